@@ -0,0 +1,203 @@
+"""Bounded-cost arithmetic evaluator.
+
+Expressions are tokenized with a regex and evaluated with an iterative
+shunting-yard loop over ``int`` and ``Fraction`` values, so there is no
+recursion and results are exact. Every budget is checked before the work it guards:
+input length and literal size before parsing, nesting depth while parsing,
+and operation count plus result size before each operation. With the
+default budget an expression is at most 64 operations on numbers of at most
+4096 bits, which keeps the worst case well under a millisecond on the event
+loop. Anything over budget, malformed, or undefined (such as division by
+zero) evaluates to ``None``.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from decimal import Decimal, localcontext
+from fractions import Fraction
+import math
+import re
+
+
+@dataclass(frozen=True)
+class ArithmeticBudget:
+    max_length: int = 256
+    max_depth: int = 32
+    max_literal_digits: int = 32
+    max_operations: int = 64
+    max_result_bits: int = 4096
+
+
+DEFAULT_BUDGET = ArithmeticBudget()
+
+_TOKEN = re.compile(r"\s*(?:(\d+(?:\.\d*)?|\.\d+)|(\*\*|[-+*/^()]))")
+_BINARY = {"+": (1, False), "-": (1, False), "*": (2, False), "/": (2, False), "^": (4, True)}
+_UNARY_PRECEDENCE = 3
+
+
+class _OverBudget(Exception):
+    pass
+
+
+Number = int | Fraction
+
+
+def _tokenize(text: str, budget: ArithmeticBudget) -> list[Number | str] | None:
+    tokens: list[Number | str] = []
+    position = 0
+    end = len(text.rstrip())
+    while position < end:
+        match = _TOKEN.match(text, position)
+        if match is None:
+            return None
+        literal, operator = match.groups()
+        if literal is not None:
+            if len(literal) > budget.max_literal_digits:
+                return None
+            # Like Python's grammar, reject "007"; it also keeps dates such as
+            # "2024-03-01" from being answered as arithmetic.
+            if "." not in literal and literal[0] == "0" and literal.strip("0"):
+                return None
+            # Integers stay plain ints; Fraction is only needed once a
+            # decimal point or a division appears, and it is much slower.
+            tokens.append(Fraction(literal) if "." in literal else int(literal))
+        else:
+            tokens.append("^" if operator == "**" else operator)
+        position = match.end()
+    return tokens
+
+
+def _bits(value: Number) -> int:
+    return max(value.numerator.bit_length(), value.denominator.bit_length())
+
+
+def _power(base: Number, exponent: Number, budget: ArithmeticBudget) -> Number:
+    if exponent.denominator == 1:
+        power = exponent.numerator
+        if base == 0 and power < 0:
+            raise ZeroDivisionError
+        if base in (0, 1):
+            return base
+        if base == -1:
+            return -1 if power % 2 else 1
+        if (_bits(base) - 1) * abs(power) > budget.max_result_bits:
+            raise _OverBudget
+        return Fraction(base) ** power if power < 0 else base**power
+    # Fractional exponents fall back to floating point.
+    if base < 0:
+        raise ValueError("fractional power of a negative number")
+    result = math.pow(base, exponent)
+    if math.isinf(result):
+        raise _OverBudget
+    return Fraction(result)
+
+
+def _apply(
+    operator: str, values: list[Number], budget: ArithmeticBudget
+) -> None:
+    if operator in ("neg", "pos"):
+        if not values:
+            raise ValueError("missing operand")
+        if operator == "neg":
+            values[-1] = -values[-1]
+        return
+    if len(values) < 2:
+        raise ValueError("missing operand")
+    right = values.pop()
+    left = values.pop()
+    if operator == "+":
+        result = left + right
+    elif operator == "-":
+        result = left - right
+    elif operator == "*":
+        result = left * right
+    elif operator == "/":
+        result = Fraction(left) / right
+    else:
+        result = _power(left, right, budget)
+    if _bits(result) > budget.max_result_bits:
+        raise _OverBudget
+    values.append(result)
+
+
+def evaluate(text: str, budget: ArithmeticBudget = DEFAULT_BUDGET) -> Number | None:
+    if not text or len(text) > budget.max_length:
+        return None
+    tokens = _tokenize(text, budget)
+    if not tokens:
+        return None
+    values: list[Number] = []
+    operators: list[str] = []
+    operations = 0
+    depth = 0
+    expect_operand = True
+
+    def reduce(operator: str) -> None:
+        nonlocal operations
+        operations += 1
+        if operations > budget.max_operations:
+            raise _OverBudget
+        _apply(operator, values, budget)
+
+    try:
+        for token in tokens:
+            if not isinstance(token, str):
+                if not expect_operand:
+                    return None
+                values.append(token)
+                expect_operand = False
+            elif token == "(":
+                if not expect_operand:
+                    return None
+                depth += 1
+                if depth > budget.max_depth:
+                    return None
+                operators.append(token)
+            elif token == ")":
+                if expect_operand:
+                    return None
+                while operators and operators[-1] != "(":
+                    reduce(operators.pop())
+                if not operators:
+                    return None
+                operators.pop()
+                depth -= 1
+            elif expect_operand:
+                if token not in "+-":
+                    return None
+                operators.append("neg" if token == "-" else "pos")
+            else:
+                precedence, right_assoc = _BINARY[token]
+                while operators and operators[-1] != "(":
+                    top = operators[-1]
+                    top_precedence = (
+                        _UNARY_PRECEDENCE if top in ("neg", "pos") else _BINARY[top][0]
+                    )
+                    if top_precedence > precedence or (
+                        top_precedence == precedence and not right_assoc
+                    ):
+                        reduce(operators.pop())
+                    else:
+                        break
+                operators.append(token)
+                expect_operand = True
+        if expect_operand:
+            return None
+        while operators:
+            operator = operators.pop()
+            if operator == "(":
+                return None
+            reduce(operator)
+    except (_OverBudget, ZeroDivisionError, ValueError, OverflowError):
+        return None
+    return values[0] if len(values) == 1 else None
+
+
+def format_fraction(value: Number, digits: int = 12) -> str:
+    if value.denominator == 1:
+        return str(value.numerator)
+    with localcontext() as ctx:
+        ctx.prec = digits
+        decimal = Decimal(value.numerator) / Decimal(value.denominator)
+    return format(decimal.normalize(), "f" if abs(decimal.adjusted()) < digits else "e")
@@ -0,0 +1,61 @@
+"""Builds the storage and model backends selected by the config.
+
+Each backend module is imported inside its builder, so an SDK that the
+configuration does not use (``google.cloud.firestore`` with
+``FIRESTORE_DISABLED=1``) is never imported, and the OpenAI SDK is only loaded
+when the client first talks to the API.
+"""
+
+from __future__ import annotations
+
+from app.config import Config
+
+
+def build_store_backend(config: Config) -> object:
+    if config.firestore_enabled:
+        from app.services.firestore_client import FirestoreClient
+
+        return FirestoreClient(
+            project_id=config.gcp_project_id or "",
+            compaction_lease_seconds=config.compaction_lease_seconds,
+        )
+    from app.services.memory_store import MemoryStore
+
+    return MemoryStore()
+
+
+def build_model_backend(config: Config) -> object:
+    from app.services.openai_client import OpenAIClient
+    from app.services.response_cache import ResponseCache
+
+    return OpenAIClient(
+        api_key=config.openai_api_key,
+        fast_model=config.openai_fast_model,
+        max_connections=config.openai_max_connections,
+        max_keepalive_connections=config.openai_max_keepalive_connections,
+        keepalive_expiry=config.openai_keepalive_expiry,
+        history_token_budget=config.history_token_budget,
+        fast_history_token_budget=config.fast_history_token_budget,
+        max_message_tokens=config.max_message_tokens,
+        response_cache=(
+            ResponseCache(
+                max_entries=config.response_cache_max_entries,
+                ttl=config.response_cache_ttl,
+                path=config.response_cache_path,
+            )
+            if config.response_cache_max_entries > 0
+            else None
+        ),
+        chain_max_turns=config.response_chain_max_turns,
+        latency_slo=config.model_latency_slo,
+        fast_max_prompt_tokens=config.router_fast_max_prompt_tokens or None,
+        hedge_percentile=config.hedge_percentile or None,
+        hedge_min_samples=config.hedge_min_samples,
+        max_retries=config.openai_max_retries,
+        circuit_failure_threshold=config.circuit_failure_threshold,
+        circuit_reset_timeout=config.circuit_reset_timeout,
+        summary_chunk_tokens=config.summary_chunk_tokens,
+        summary_max_tokens=config.summary_max_tokens,
+        summary_parallelism=config.summary_parallelism,
+        summary_use_fast_model=config.summary_fast_model,
+    )
@@ -17,6 +17,61 @@ class Config:
     history_max_messages: int
     summary_trigger: int
     history_ttl_days: int
+    openai_max_connections: int
+    openai_max_keepalive_connections: int
+    openai_keepalive_expiry: float
+    stream_replies: bool
+    stream_edit_interval: float
+    write_behind_max_batch: int
+    write_behind_flush_ms: int
+    write_behind_max_pending: int
+    history_cache_max_users: int
+    history_cache_max_age: float
+    ordered_dispatch: bool
+    dispatch_max_concurrency: int
+    dispatch_max_pending_per_chat: int
+    dispatch_drain_timeout: float
+    history_token_budget: int
+    fast_history_token_budget: int
+    max_message_tokens: int
+    response_cache_max_entries: int
+    response_cache_ttl: float
+    response_cache_path: str | None
+    local_currency_rates: dict[str, float]
+    stateful_replies: bool
+    response_chain_max_turns: int
+    model_latency_slo: float
+    router_fast_max_prompt_tokens: int
+    reply_deadline: float
+    hedge_percentile: float
+    hedge_min_samples: int
+    openai_max_retries: int
+    circuit_failure_threshold: int
+    circuit_reset_timeout: float
+    compaction_debounce: float
+    compaction_workers: int
+    compaction_drain_timeout: float
+    compaction_lease_seconds: float
+    summary_chunk_tokens: int
+    summary_max_tokens: int
+    summary_parallelism: int
+    summary_fast_model: bool
+    polling_limit: int
+    polling_timeout: int
+    drop_pending_updates: bool
+    telegram_chat_rate: float
+    telegram_chat_burst: int
+    telegram_group_rate: float
+    telegram_global_rate: float
+
+
+def _parse_rates(raw: str) -> dict[str, float]:
+    rates: dict[str, float] = {}
+    for item in raw.split(","):
+        code, sep, value = item.partition("=")
+        if sep and code.strip():
+            rates[code.strip().upper()] = float(value)
+    return rates
 
 
 def load_config() -> Config:
@@ -33,6 +88,76 @@ def load_config() -> Config:
     history_max_messages = int(os.getenv("HISTORY_MAX_MESSAGES", "16"))
     summary_trigger = int(os.getenv("SUMMARY_TRIGGER", "20"))
     history_ttl_days = int(os.getenv("HISTORY_TTL_DAYS", "7"))
+    openai_max_connections = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+    openai_max_keepalive_connections = int(
+        os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "10")
+    )
+    openai_keepalive_expiry = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+    stream_replies = os.getenv("STREAM_REPLIES", "").strip().lower() in {
+        "1",
+        "true",
+        "yes",
+    }
+    stream_edit_interval = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+    write_behind_max_batch = int(os.getenv("WRITE_BEHIND_MAX_BATCH", "100"))
+    write_behind_flush_ms = int(os.getenv("WRITE_BEHIND_FLUSH_MS", "250"))
+    write_behind_max_pending = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))
+    history_cache_max_users = int(os.getenv("HISTORY_CACHE_MAX_USERS", "1024"))
+    history_cache_max_age = float(os.getenv("HISTORY_CACHE_MAX_AGE", "300"))
+    ordered_dispatch = os.getenv("ORDERED_DISPATCH_DISABLED", "").strip().lower() not in {
+        "1",
+        "true",
+        "yes",
+    }
+    dispatch_max_concurrency = int(os.getenv("DISPATCH_MAX_CONCURRENCY", "8"))
+    dispatch_max_pending_per_chat = int(
+        os.getenv("DISPATCH_MAX_PENDING_PER_CHAT", "100")
+    )
+    dispatch_drain_timeout = float(os.getenv("DISPATCH_DRAIN_TIMEOUT", "8"))
+    history_token_budget = int(os.getenv("HISTORY_TOKEN_BUDGET", "6000"))
+    fast_history_token_budget = int(os.getenv("HISTORY_FAST_TOKEN_BUDGET", "1500"))
+    max_message_tokens = int(os.getenv("HISTORY_MAX_MESSAGE_TOKENS", "1500"))
+    response_cache_max_entries = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "0"))
+    response_cache_ttl = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+    response_cache_path = os.getenv("RESPONSE_CACHE_PATH", "").strip() or None
+    local_currency_rates = _parse_rates(os.getenv("LOCAL_CURRENCY_RATES", ""))
+    stateful_replies = os.getenv("STATEFUL_REPLIES", "").strip().lower() in {
+        "1",
+        "true",
+        "yes",
+    }
+    response_chain_max_turns = int(os.getenv("RESPONSE_CHAIN_MAX_TURNS", "20"))
+    model_latency_slo = float(os.getenv("MODEL_LATENCY_SLO", "0"))
+    router_fast_max_prompt_tokens = int(os.getenv("ROUTER_FAST_MAX_PROMPT_TOKENS", "0"))
+    reply_deadline = float(os.getenv("REPLY_DEADLINE", "60"))
+    hedge_percentile = float(os.getenv("HEDGE_PERCENTILE", "95"))
+    hedge_min_samples = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+    openai_max_retries = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+    circuit_failure_threshold = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+    circuit_reset_timeout = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+    compaction_debounce = float(os.getenv("COMPACTION_DEBOUNCE", "2"))
+    compaction_workers = int(os.getenv("COMPACTION_WORKERS", "2"))
+    compaction_drain_timeout = float(os.getenv("COMPACTION_DRAIN_TIMEOUT", "10"))
+    compaction_lease_seconds = float(os.getenv("COMPACTION_LEASE_SECONDS", "120"))
+    summary_chunk_tokens = int(os.getenv("SUMMARY_CHUNK_TOKENS", "2000"))
+    summary_max_tokens = int(os.getenv("SUMMARY_MAX_TOKENS", "400"))
+    summary_parallelism = int(os.getenv("SUMMARY_PARALLELISM", "4"))
+    summary_fast_model = os.getenv("SUMMARY_FAST_MODEL", "").strip().lower() in {
+        "1",
+        "true",
+        "yes",
+    }
+    polling_limit = min(max(int(os.getenv("POLLING_LIMIT", "100")), 1), 100)
+    polling_timeout = int(os.getenv("POLLING_TIMEOUT", "30"))
+    drop_pending_updates = os.getenv("KEEP_PENDING_UPDATES", "").strip().lower() not in {
+        "1",
+        "true",
+        "yes",
+    }
+    telegram_chat_rate = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+    telegram_chat_burst = int(os.getenv("TELEGRAM_CHAT_BURST", "3"))
+    telegram_group_rate = float(os.getenv("TELEGRAM_GROUP_RATE_PER_MINUTE", "20")) / 60
+    telegram_global_rate = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
 
     if not bot_token or not openai_api_key or not admin_id_raw:
         raise RuntimeError(
@@ -61,4 +186,50 @@ def load_config() -> Config:
         history_max_messages=history_max_messages,
         summary_trigger=summary_trigger,
         history_ttl_days=history_ttl_days,
+        openai_max_connections=openai_max_connections,
+        openai_max_keepalive_connections=openai_max_keepalive_connections,
+        openai_keepalive_expiry=openai_keepalive_expiry,
+        stream_replies=stream_replies,
+        stream_edit_interval=stream_edit_interval,
+        write_behind_max_batch=write_behind_max_batch,
+        write_behind_flush_ms=write_behind_flush_ms,
+        write_behind_max_pending=write_behind_max_pending,
+        history_cache_max_users=history_cache_max_users,
+        history_cache_max_age=history_cache_max_age,
+        ordered_dispatch=ordered_dispatch,
+        dispatch_max_concurrency=dispatch_max_concurrency,
+        dispatch_max_pending_per_chat=dispatch_max_pending_per_chat,
+        dispatch_drain_timeout=dispatch_drain_timeout,
+        history_token_budget=history_token_budget,
+        fast_history_token_budget=fast_history_token_budget,
+        max_message_tokens=max_message_tokens,
+        response_cache_max_entries=response_cache_max_entries,
+        response_cache_ttl=response_cache_ttl,
+        response_cache_path=response_cache_path,
+        local_currency_rates=local_currency_rates,
+        stateful_replies=stateful_replies,
+        response_chain_max_turns=response_chain_max_turns,
+        model_latency_slo=model_latency_slo,
+        router_fast_max_prompt_tokens=router_fast_max_prompt_tokens,
+        reply_deadline=reply_deadline,
+        hedge_percentile=hedge_percentile,
+        hedge_min_samples=hedge_min_samples,
+        openai_max_retries=openai_max_retries,
+        circuit_failure_threshold=circuit_failure_threshold,
+        circuit_reset_timeout=circuit_reset_timeout,
+        compaction_debounce=compaction_debounce,
+        compaction_workers=compaction_workers,
+        compaction_drain_timeout=compaction_drain_timeout,
+        compaction_lease_seconds=compaction_lease_seconds,
+        summary_chunk_tokens=summary_chunk_tokens,
+        summary_max_tokens=summary_max_tokens,
+        summary_parallelism=summary_parallelism,
+        summary_fast_model=summary_fast_model,
+        polling_limit=polling_limit,
+        polling_timeout=polling_timeout,
+        drop_pending_updates=drop_pending_updates,
+        telegram_chat_rate=telegram_chat_rate,
+        telegram_chat_burst=telegram_chat_burst,
+        telegram_group_rate=telegram_group_rate,
+        telegram_global_rate=telegram_global_rate,
     )
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+from collections import deque
+from collections.abc import Awaitable, Callable, Hashable
+from dataclasses import dataclass, field
+import asyncio
+import logging
+import time
+from typing import Any
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+
+from app.metrics import CHAT_QUEUE_DEPTH, CHAT_QUEUES_ACTIVE, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+def update_chat_id(update: dict[str, Any]) -> int | None:
+    for value in update.values():
+        if not isinstance(value, dict):
+            continue
+        chat = value.get("chat")
+        if chat is None and isinstance(value.get("message"), dict):
+            chat = value["message"].get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return chat["id"]
+    return None
+
+
+@dataclass
+class ChatUpdateQueue:
+    """Runs updates strictly in order per chat, with bounded concurrency across chats.
+
+    Each chat with pending updates gets one worker task; workers share a
+    semaphore so at most ``max_concurrency`` updates are processed at once.
+    """
+
+    process: Callable[[Any], Awaitable[object]]
+    max_concurrency: int = 8
+    max_pending_per_chat: int = 100
+    _pending: dict[Hashable, deque[tuple[float, Any]]] = field(
+        default_factory=dict, init=False
+    )
+    _workers: dict[Hashable, asyncio.Task] = field(default_factory=dict, init=False)
+    _semaphore: asyncio.Semaphore = field(init=False)
+    _depth: int = field(default=0, init=False)
+    _closing: bool = field(default=False, init=False)
+
+    def __post_init__(self) -> None:
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    @property
+    def depth(self) -> int:
+        return self._depth
+
+    def submit(self, key: Hashable, item: Any) -> bool:
+        if self._closing:
+            return False
+        queue = self._pending.setdefault(key, deque())
+        if len(queue) >= self.max_pending_per_chat:
+            logger.warning("chat_queue_full key=%s depth=%s", key, len(queue))
+            return False
+        queue.append((time.monotonic(), item))
+        self._depth += 1
+        CHAT_QUEUE_DEPTH.set(self._depth)
+        if key not in self._workers:
+            self._workers[key] = asyncio.create_task(self._run(key))
+            CHAT_QUEUES_ACTIVE.set(len(self._workers))
+        return True
+
+    async def drain(self, timeout: float | None = None) -> None:
+        self._closing = True
+        workers = list(self._workers.values())
+        if not workers:
+            return
+        _, still_running = await asyncio.wait(workers, timeout=timeout)
+        if still_running:
+            logger.warning(
+                "chat_queue_drain_timeout chats=%s dropped_updates=%s",
+                len(still_running),
+                self._depth,
+            )
+            for task in still_running:
+                task.cancel()
+            await asyncio.gather(*still_running, return_exceptions=True)
+
+    async def _run(self, key: Hashable) -> None:
+        queue = self._pending[key]
+        try:
+            while queue:
+                async with self._semaphore:
+                    enqueued_at, item = queue.popleft()
+                    self._depth -= 1
+                    CHAT_QUEUE_DEPTH.set(self._depth)
+                    STAGE_SECONDS.observe(
+                        time.monotonic() - enqueued_at, stage="queue_wait"
+                    )
+                    try:
+                        await self.process(item)
+                    except Exception:
+                        logger.exception("chat_update_failed key=%s", key)
+        finally:
+            self._depth -= len(queue)
+            CHAT_QUEUE_DEPTH.set(self._depth)
+            self._pending.pop(key, None)
+            self._workers.pop(key, None)
+            CHAT_QUEUES_ACTIVE.set(len(self._workers))
+
+
+class OrderedRequestHandler(SimpleRequestHandler):
+    """Webhook handler that acknowledges at once and feeds per-chat queues."""
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        *,
+        max_concurrency: int = 8,
+        max_pending_per_chat: int = 100,
+        drain_timeout: float = 8.0,
+        **data: Any,
+    ) -> None:
+        super().__init__(
+            dispatcher=dispatcher, bot=bot, handle_in_background=True, **data
+        )
+        self.drain_timeout = drain_timeout
+        self.queue = ChatUpdateQueue(
+            self._process,
+            max_concurrency=max_concurrency,
+            max_pending_per_chat=max_pending_per_chat,
+        )
+
+    async def _process(self, update: dict[str, Any]) -> None:
+        await self._background_feed_update(bot=self.bot, update=update)
+
+    async def _handle_request_background(
+        self, bot: Bot, request: web.Request
+    ) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        chat_id = update_chat_id(update)
+        # Updates without a chat have no ordering constraint.
+        key = chat_id if chat_id is not None else ("update", update.get("update_id"))
+        if not self.queue.submit(key, update):
+            # Telegram redelivers on non-2xx, which gives natural backpressure.
+            return web.json_response({"ok": False}, status=503)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def close(self) -> None:
+        await self.queue.drain(self.drain_timeout)
+        await super().close()
@@ -1,16 +1,29 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import asyncio
-import ast
 import logging
 import time
 
 from aiogram import Router
 from aiogram.enums import ChatMemberStatus
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import ChatMemberUpdated, Message
 
 from app.access import should_leave_chat, should_respond
+from app.local_answers import LocalAnswers, build_local_answers
+from app.services.compaction import CompactionScheduler
+from app.services.telegram_sender import (
+    TELEGRAM_MAX_MESSAGE_LEN,
+    TelegramSender,
+    truncate_utf16,
+)
+from app.metrics import (
+    MODEL_SECONDS,
+    OPENAI_FAILURES,
+    REQUESTS_IN_FLIGHT,
+    STAGE_SECONDS,
+)
 
 
 @dataclass
@@ -22,60 +35,78 @@ class AppContext:
     history_max_messages: int
     summary_trigger: int
     history_ttl_days: int
+    stream_replies: bool = False
+    stream_edit_interval: float = 1.0
+    history_token_budget: int | None = None
+    max_message_tokens: int | None = None
+    local_answers: LocalAnswers = field(default_factory=build_local_answers)
+    stateful_replies: bool = False
+    reply_deadline: float | None = None
+    compactions: CompactionScheduler = field(default_factory=CompactionScheduler)
+    sender: TelegramSender = field(default_factory=TelegramSender)
 
 
 router = Router()
 logger = logging.getLogger(__name__)
 
-_ARITH_ALLOWED = set("0123456789+-*/(). \t\r\n")
-def _safe_eval_arithmetic(text: str) -> str | None:
-    stripped = text.strip()
-    if not stripped:
-        return None
-    if stripped.endswith("="):
-        stripped = stripped[:-1].strip()
-        if not stripped:
-            return None
-    if any(ch not in _ARITH_ALLOWED for ch in stripped):
-        return None
+_STREAM_CURSOR = " …"
+
+
+async def _edit_placeholder(
+    context: AppContext,
+    message: Message,
+    placeholder: Message,
+    text: str,
+    *,
+    preview: bool = False,
+) -> bool:
     try:
-        node = ast.parse(stripped, mode="eval")
-    except SyntaxError:
-        return None
-
-    def _eval(n):
-        if isinstance(n, ast.Expression):
-            return _eval(n.body)
-        if isinstance(n, ast.BinOp) and isinstance(
-            n.op, (ast.Add, ast.Sub, ast.Mult, ast.Div)
-        ):
-            left = _eval(n.left)
-            right = _eval(n.right)
-            if left is None or right is None:
-                return None
-            if isinstance(n.op, ast.Add):
-                return left + right
-            if isinstance(n.op, ast.Sub):
-                return left - right
-            if isinstance(n.op, ast.Mult):
-                return left * right
-            if isinstance(n.op, ast.Div):
-                return left / right
-        if isinstance(n, ast.UnaryOp) and isinstance(n.op, (ast.UAdd, ast.USub)):
-            value = _eval(n.operand)
-            if value is None:
-                return None
-            return value if isinstance(n.op, ast.UAdd) else -value
-        if isinstance(n, ast.Constant) and isinstance(n.value, (int, float)):
-            return n.value
-        return None
-
-    result = _eval(node)
-    if result is None:
-        return None
-    if isinstance(result, float) and result.is_integer():
-        return str(int(result))
-    return str(result)
+        if preview:
+            await context.sender.edit_preview(message, placeholder, text)
+        else:
+            await context.sender.edit(message, placeholder, text)
+    except TelegramBadRequest as exc:
+        logger.warning("telegram_edit_failed error=%s", exc.message)
+        return False
+    return True
+
+
+async def _stream_reply(
+    message: Message,
+    placeholder: Message,
+    history: list[dict[str, str]],
+    message_text: str,
+    context: AppContext,
+) -> tuple[str, str]:
+    parts: list[str] = []
+    model_used = ""
+    shown = ""
+    last_edit = 0.0
+    async for delta, model in context.openai_client.stream_reply(
+        history, user_text=message_text
+    ):
+        model_used = model
+        parts.append(delta)
+        now = time.monotonic()
+        if now - last_edit < context.stream_edit_interval:
+            continue
+        preview = "".join(parts).strip()
+        if not preview or preview == shown:
+            continue
+        last_edit = now
+        shown = preview
+        limit = TELEGRAM_MAX_MESSAGE_LEN - len(_STREAM_CURSOR)
+        # Partial output may contain unbalanced HTML, so previews are sent as
+        # plain text in one message; the final edit uses the bot's default
+        # parse mode and splits.
+        await _edit_placeholder(
+            context,
+            message,
+            placeholder,
+            truncate_utf16(preview, limit) + _STREAM_CURSOR,
+            preview=True,
+        )
+    return "".join(parts).strip(), model_used
 
 
 @router.message()
@@ -84,7 +115,9 @@ async def handle_message(message: Message, context: AppContext) -> None:
     chat_type = message.chat.type if message.chat else "unknown"
     message_text = message.text or message.caption or ""
     text_preview = message_text[:200]
+    access_start = time.monotonic()
     will_respond = should_respond(message, context.bot_username, context.admin_id)
+    STAGE_SECONDS.observe(time.monotonic() - access_start, stage="access_check")
     logger.info(
         "message_received sender_id=%s admin_id=%s chat_type=%s will_respond=%s text_preview=%r",
         sender_id,
@@ -96,41 +129,104 @@ async def handle_message(message: Message, context: AppContext) -> None:
     if not will_respond:
         return
 
+    REQUESTS_IN_FLIGHT.inc()
+    try:
+        await _answer_message(message, context, message_text)
+    finally:
+        REQUESTS_IN_FLIGHT.dec()
+
+
+async def _persist_turn(
+    context: AppContext, user_id: int, user_text: str, reply: str
+) -> None:
+    persist_start = time.monotonic()
+    await context.firestore_client.append_message(user_id, "user", user_text)
+    await context.firestore_client.append_message(user_id, "assistant", reply)
+    STAGE_SECONDS.observe(time.monotonic() - persist_start, stage="persist")
+
+
+async def _answer_message(
+    message: Message, context: AppContext, message_text: str
+) -> None:
+    sender_id = message.from_user.id if message.from_user else None
+    chat_type = message.chat.type if message.chat else "unknown"
     user_id = message.from_user.id if message.from_user else 0
-    quick_answer = _safe_eval_arithmetic(message_text)
-    if quick_answer is not None:
-        context.firestore_client.append_message(user_id, "user", message_text)
-        context.firestore_client.append_message(user_id, "assistant", quick_answer)
+    deadline = (
+        time.monotonic() + context.reply_deadline if context.reply_deadline else None
+    )
+    local = context.local_answers.answer(message_text)
+    if local is not None:
+        resolver, quick_answer = local
         send_start = time.monotonic()
-        await message.answer(f"{quick_answer}\n\n— model: local-arith")
+        await context.sender.answer(
+            message, f"{quick_answer}\n\n— model: local-{resolver}"
+        )
         send_elapsed = time.monotonic() - send_start
+        STAGE_SECONDS.observe(send_elapsed, stage="send")
         logger.info(
-            "telegram_send_done sender_id=%s kind=local_arith elapsed_ms=%s",
+            "telegram_send_done sender_id=%s kind=local_%s elapsed_ms=%s",
             sender_id,
+            resolver,
             int(send_elapsed * 1000),
         )
+        await _persist_turn(context, user_id, message_text, quick_answer)
         return
 
     send_start = time.monotonic()
-    await message.answer("Подумаю и отвечу…")
+    placeholder = await context.sender.answer(message, "Подумаю и отвечу…")
     send_elapsed = time.monotonic() - send_start
+    STAGE_SECONDS.observe(send_elapsed, stage="send")
     logger.info(
         "telegram_send_done sender_id=%s kind=thinking elapsed_ms=%s",
         sender_id,
         int(send_elapsed * 1000),
     )
-    history = context.firestore_client.get_recent_history(
-        user_id, max_messages=context.history_max_messages
+    streaming = context.stream_replies and hasattr(
+        context.openai_client, "stream_reply"
+    )
+    stateful = context.stateful_replies and not streaming
+    history_start = time.monotonic()
+    history_fetch = context.firestore_client.get_recent_history(
+        user_id,
+        max_messages=context.history_max_messages,
+        token_budget=context.history_token_budget,
+        max_message_tokens=context.max_message_tokens,
     )
+    response_state = None
+    if stateful:
+        history, response_state = await asyncio.gather(
+            history_fetch, context.firestore_client.get_response_state(user_id)
+        )
+    else:
+        history = await history_fetch
+    STAGE_SECONDS.observe(time.monotonic() - history_start, stage="history_fetch")
     history.append({"role": "user", "content": message_text})
 
     try:
         openai_start = time.monotonic()
-        reply, model_used = await context.openai_client.generate_reply(
-            history,
-            user_text=message_text,
-        )
+        if streaming:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            async with asyncio.timeout(remaining):
+                reply, model_used = await _stream_reply(
+                    message, placeholder, history, message_text, context
+                )
+        elif stateful:
+            (
+                reply,
+                model_used,
+                response_state,
+            ) = await context.openai_client.generate_chained_reply(
+                history, message_text, response_state, deadline=deadline
+            )
+        else:
+            reply, model_used = await context.openai_client.generate_reply(
+                history,
+                user_text=message_text,
+                deadline=deadline,
+            )
         openai_elapsed = time.monotonic() - openai_start
+        STAGE_SECONDS.observe(openai_elapsed, stage="model_call")
+        MODEL_SECONDS.observe(openai_elapsed, model=model_used or "unknown")
         logger.info(
             "openai_reply_done sender_id=%s model=%s elapsed_ms=%s",
             sender_id,
@@ -138,39 +234,48 @@ async def handle_message(message: Message, context: AppContext) -> None:
             int(openai_elapsed * 1000),
         )
     except Exception:
+        OPENAI_FAILURES.inc()
         logger.exception("generate_reply_failed sender_id=%s", sender_id)
-        await message.answer("Temporary error talking to OpenAI. Please try again.")
+        await context.sender.answer(
+            message, "Temporary error talking to OpenAI. Please try again."
+        )
         return
 
     display_reply = reply
     if model_used:
         display_reply = f"{reply}\n\n— model: {model_used}"
-    context.firestore_client.append_message(user_id, "user", message_text)
-    context.firestore_client.append_message(user_id, "assistant", reply)
 
     send_start = time.monotonic()
-    await message.answer(display_reply)
+    if not streaming or not await _edit_placeholder(
+        context, message, placeholder, display_reply
+    ):
+        await context.sender.answer(message, display_reply)
     send_elapsed = time.monotonic() - send_start
+    STAGE_SECONDS.observe(send_elapsed, stage="send")
     logger.info(
-        "telegram_send_done sender_id=%s kind=final elapsed_ms=%s",
+        "telegram_send_done sender_id=%s kind=final streamed=%s elapsed_ms=%s",
         sender_id,
+        streaming,
         int(send_elapsed * 1000),
     )
+    await _persist_turn(context, user_id, message_text, reply)
+    if stateful and response_state is not None:
+        try:
+            await context.firestore_client.set_response_state(user_id, response_state)
+        except Exception:
+            logger.exception("response_state_save_failed sender_id=%s", sender_id)
 
     if hasattr(context.firestore_client, "compact"):
-        async def _compact() -> None:
-            try:
-                await context.firestore_client.compact(
-                    user_id,
-                    max_messages=context.history_max_messages,
-                    summary_trigger=context.summary_trigger,
-                    ttl_hours=context.history_ttl_days * 24,
-                    summarize_fn=context.openai_client.summarize_history,
-                )
-            except Exception:
-                logger.exception("compact_failed sender_id=%s", sender_id)
-
-        asyncio.create_task(_compact())
+        context.compactions.schedule(
+            user_id,
+            lambda: context.firestore_client.compact(
+                user_id,
+                max_messages=context.history_max_messages,
+                summary_trigger=context.summary_trigger,
+                ttl_hours=context.history_ttl_days * 24,
+                summarize_fn=context.openai_client.summarize_history,
+            ),
+        )
     logger.info(
         "message_answered chat_id=%s sender_id=%s chat_type=%s reply_len=%s",
         message.chat.id if message.chat else None,
@@ -0,0 +1,332 @@
+"""Answers that can be computed without calling the model.
+
+Resolvers are tried in registration order; the first one that returns a
+string wins. Each resolver only accepts text it fully understands and returns
+``None`` otherwise, so anything ambiguous still goes to OpenAI.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from fractions import Fraction
+import logging
+import re
+
+from app.arithmetic import evaluate, format_fraction
+from app.metrics import LOCAL_ANSWER_HITS
+
+logger = logging.getLogger(__name__)
+
+Resolver = Callable[[str], "str | None"]
+
+_NUMBER = r"[-+]?\d+(?:[.,]\d+)?"
+
+
+@dataclass
+class LocalAnswers:
+    resolvers: list[tuple[str, Resolver]] = field(default_factory=list)
+
+    def register(self, name: str, resolve: Resolver) -> None:
+        self.resolvers.append((name, resolve))
+
+    def answer(self, text: str) -> tuple[str, str] | None:
+        """Returns ``(resolver_name, answer)`` from the first resolver that matches."""
+        query = _normalize(text)
+        if not query:
+            return None
+        for name, resolve in self.resolvers:
+            try:
+                result = resolve(query)
+            except (ArithmeticError, ValueError, OverflowError):
+                result = None
+            except Exception:
+                logger.exception("local_resolver_failed resolver=%s", name)
+                result = None
+            if result is not None:
+                LOCAL_ANSWER_HITS.inc(resolver=name)
+                return name, result
+        return None
+
+
+def build_local_answers(
+    *,
+    currency_rates: dict[str, float] | None = None,
+    today: Callable[[], date] = date.today,
+    now: Callable[[], datetime] = datetime.now,
+) -> LocalAnswers:
+    answers = LocalAnswers()
+    answers.register("arith", evaluate_arithmetic)
+    answers.register("base", convert_base)
+    answers.register("unit", convert_units)
+    if currency_rates:
+        answers.register("currency", make_currency_converter(currency_rates))
+    answers.register("date", make_date_calculator(today, now))
+    return answers
+
+
+def _normalize(text: str) -> str:
+    query = " ".join(text.split()).casefold()
+    return query.rstrip("?=").strip()
+
+
+def _parse_number(raw: str) -> float:
+    return float(raw.replace(",", "."))
+
+
+def _parse_fraction(raw: str) -> Fraction:
+    return Fraction(raw.replace(",", "."))
+
+
+def format_number(value: float | int | Fraction) -> str:
+    if isinstance(value, Fraction):
+        return format_fraction(value)
+    if isinstance(value, int):
+        return str(value)
+    if value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return f"{value:.12g}"
+
+
+# Arithmetic -----------------------------------------------------------------
+
+_PERCENT_OF = re.compile(rf"^({_NUMBER})\s*%\s*(?:of|от)\s+(.+)$")
+_PERCENT_CHANGE = re.compile(rf"^(.+?)\s*([+-])\s*({_NUMBER})\s*%$")
+_PERCENT = re.compile(r"(\d+(?:\.\d+)?)\s*%")
+
+
+def evaluate_arithmetic(text: str) -> str | None:
+    """Evaluates ``+ - * / ** ^`` and percentages, e.g. ``15% of 80``, ``200 + 15%``.
+
+    The arithmetic itself goes through the bounded evaluator in ``app.arithmetic``.
+    """
+    match = _PERCENT_OF.match(text)
+    if match:
+        base = evaluate(match.group(2))
+        if base is None:
+            return None
+        return format_number(_parse_fraction(match.group(1)) / 100 * base)
+    match = _PERCENT_CHANGE.match(text)
+    if match:
+        base = evaluate(match.group(1))
+        if base is None:
+            return None
+        sign = 1 if match.group(2) == "+" else -1
+        return format_number(base * (1 + sign * _parse_fraction(match.group(3)) / 100))
+    result = evaluate(_PERCENT.sub(r"(\1/100)", text))
+    if result is None:
+        return None
+    return format_number(result)
+
+
+# Base conversion ------------------------------------------------------------
+
+_BASE_QUERY = re.compile(
+    r"^(0x[0-9a-f]+|0b[01]+|0o[0-7]+|\d+)\s+(?:to|in|в)\s+"
+    r"(hex|hexadecimal|bin|binary|oct|octal|dec|decimal)$"
+)
+
+
+def convert_base(text: str) -> str | None:
+    """Converts between bases, e.g. ``255 to hex`` or ``0b1010 in dec``."""
+    match = _BASE_QUERY.match(text)
+    if not match:
+        return None
+    value = int(match.group(1), 0)
+    target = match.group(2)
+    if target.startswith("hex"):
+        return hex(value)
+    if target.startswith("bin"):
+        return bin(value)
+    if target.startswith("oct"):
+        return oct(value)
+    return str(value)
+
+
+# Units ----------------------------------------------------------------------
+
+# Factor to the base unit of each dimension (metre, kilogram, litre).
+_UNITS: dict[str, tuple[str, float]] = {
+    "mm": ("length", 0.001),
+    "мм": ("length", 0.001),
+    "cm": ("length", 0.01),
+    "см": ("length", 0.01),
+    "m": ("length", 1.0),
+    "м": ("length", 1.0),
+    "km": ("length", 1000.0),
+    "км": ("length", 1000.0),
+    "in": ("length", 0.0254),
+    "inch": ("length", 0.0254),
+    "inches": ("length", 0.0254),
+    "ft": ("length", 0.3048),
+    "feet": ("length", 0.3048),
+    "yd": ("length", 0.9144),
+    "mi": ("length", 1609.344),
+    "mile": ("length", 1609.344),
+    "miles": ("length", 1609.344),
+    "g": ("mass", 0.001),
+    "г": ("mass", 0.001),
+    "kg": ("mass", 1.0),
+    "кг": ("mass", 1.0),
+    "t": ("mass", 1000.0),
+    "т": ("mass", 1000.0),
+    "lb": ("mass", 0.45359237),
+    "lbs": ("mass", 0.45359237),
+    "oz": ("mass", 0.028349523125),
+    "ml": ("volume", 0.001),
+    "мл": ("volume", 0.001),
+    "l": ("volume", 1.0),
+    "л": ("volume", 1.0),
+    "gal": ("volume", 3.785411784),
+}
+_TEMPERATURES = {"c": "c", "°c": "c", "f": "f", "°f": "f", "k": "k"}
+_CONVERSION = re.compile(rf"^({_NUMBER})\s*(\S+)\s+(?:to|in|в|во)\s+(\S+)$")
+
+
+def convert_units(text: str) -> str | None:
+    """Converts length, mass, volume and temperature, e.g. ``5 km to mi``."""
+    match = _CONVERSION.match(text)
+    if not match:
+        return None
+    amount = _parse_number(match.group(1))
+    source, target = match.group(2), match.group(3)
+    if source in _TEMPERATURES and target in _TEMPERATURES:
+        value = _convert_temperature(
+            amount, _TEMPERATURES[source], _TEMPERATURES[target]
+        )
+        return f"{format_number(round(value, 2))} {target}"
+    if source not in _UNITS or target not in _UNITS:
+        return None
+    source_dim, source_factor = _UNITS[source]
+    target_dim, target_factor = _UNITS[target]
+    if source_dim != target_dim:
+        return None
+    value = amount * source_factor / target_factor
+    return f"{format_number(round(value, 6))} {target}"
+
+
+def _convert_temperature(value: float, source: str, target: str) -> float:
+    if source == "f":
+        value = (value - 32) * 5 / 9
+    elif source == "k":
+        value -= 273.15
+    if target == "f":
+        return value * 9 / 5 + 32
+    if target == "k":
+        return value + 273.15
+    return value
+
+
+_CURRENCY_ALIASES = {
+    "$": "USD",
+    "usd": "USD",
+    "dollar": "USD",
+    "dollars": "USD",
+    "доллар": "USD",
+    "доллара": "USD",
+    "долларов": "USD",
+    "€": "EUR",
+    "eur": "EUR",
+    "euro": "EUR",
+    "euros": "EUR",
+    "евро": "EUR",
+    "₽": "RUB",
+    "rub": "RUB",
+    "руб": "RUB",
+    "рубль": "RUB",
+    "рубля": "RUB",
+    "рублей": "RUB",
+}
+
+
+def make_currency_converter(rates: dict[str, float]) -> Resolver:
+    """Builds a converter from ``rates``: units of each currency per one USD."""
+    table = {code.upper(): rate for code, rate in rates.items() if rate > 0}
+
+    def convert_currency(text: str) -> str | None:
+        match = _CONVERSION.match(text)
+        if not match:
+            return None
+        source = _CURRENCY_ALIASES.get(match.group(2), match.group(2).upper())
+        target = _CURRENCY_ALIASES.get(match.group(3), match.group(3).upper())
+        if source not in table or target not in table:
+            return None
+        value = _parse_number(match.group(1)) / table[source] * table[target]
+        return f"{value:.2f} {target}"
+
+    return convert_currency
+
+
+# Dates and times ------------------------------------------------------------
+
+_DATE = r"(\d{4}-\d{2}-\d{2}|\d{1,2}\.\d{1,2}\.\d{4}|today|tomorrow|yesterday|сегодня|завтра|вчера)"
+_DAY_WORDS = r"(days?|d|weeks?|w|день|дня|дней|недел[яиь]|нед)"
+_DATE_SHIFT = re.compile(rf"^{_DATE}\s*([+-])\s*(\d+)\s*{_DAY_WORDS}$")
+_DATE_DIFF = re.compile(
+    rf"^(?:days\s+between\s+{_DATE}\s+and\s+{_DATE}|дней\s+между\s+{_DATE}\s+и\s+{_DATE})$"
+)
+_DAYS_UNTIL = re.compile(rf"^(?:days\s+until|дней\s+до)\s+{_DATE}$")
+_TIME_SHIFT = re.compile(
+    r"^(\d{1,2}):(\d{2})\s*([+-])\s*(\d+)\s*(h|hours?|ч|час(?:а|ов)?|min|minutes?|мин(?:ут[аы]?)?)$"
+)
+_RELATIVE_DAYS = {
+    "today": 0,
+    "сегодня": 0,
+    "tomorrow": 1,
+    "завтра": 1,
+    "yesterday": -1,
+    "вчера": -1,
+}
+
+
+def make_date_calculator(
+    today: Callable[[], date], now: Callable[[], datetime]
+) -> Resolver:
+    """Builds the date/time resolver.
+
+    Handles ``2024-03-01 + 30 days``, ``today - 2 weeks``, ``days between A and B``,
+    ``days until A`` and ``18:30 + 90 min``.
+    """
+
+    def parse_date(raw: str) -> date:
+        if raw in _RELATIVE_DAYS:
+            return today() + timedelta(days=_RELATIVE_DAYS[raw])
+        if "." in raw:
+            return datetime.strptime(raw, "%d.%m.%Y").date()
+        return date.fromisoformat(raw)
+
+    def calculate(text: str) -> str | None:
+        match = _DATE_SHIFT.match(text)
+        if match:
+            start = parse_date(match.group(1))
+            days = int(match.group(3))
+            if match.group(4).startswith(("w", "нед")):
+                days *= 7
+            if match.group(2) == "-":
+                days = -days
+            return (start + timedelta(days=days)).isoformat()
+        match = _DATE_DIFF.match(text)
+        if match:
+            first, second = (group for group in match.groups() if group)
+            return f"{abs((parse_date(second) - parse_date(first)).days)} days"
+        match = _DAYS_UNTIL.match(text)
+        if match:
+            return f"{(parse_date(match.group(1)) - today()).days} days"
+        match = _TIME_SHIFT.match(text)
+        if match:
+            hours, minutes = int(match.group(1)), int(match.group(2))
+            if hours > 23 or minutes > 59:
+                return None
+            start = now().replace(hour=hours, minute=minutes, second=0, microsecond=0)
+            amount = int(match.group(4))
+            delta = (
+                timedelta(hours=amount)
+                if match.group(5).startswith(("h", "ч"))
+                else timedelta(minutes=amount)
+            )
+            shifted = start + delta if match.group(3) == "+" else start - delta
+            return shifted.strftime("%H:%M")
+        return None
+
+    return calculate
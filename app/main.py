@@ -1,23 +1,38 @@
 from __future__ import annotations
 
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+import argparse
+import asyncio
 import logging
+import signal
+import time
 
 from aiohttp import web
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.base import BaseSession
 from aiogram.exceptions import TelegramRetryAfter
 from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
-from app.config import load_config
+from app.backends import build_model_backend, build_store_backend
+from app.config import Config, load_config
+from app.dispatch import OrderedRequestHandler
 from app.handlers import AppContext, router
-from app.services.firestore_client import FirestoreClient
-from app.services.memory_store import MemoryStore
-from app.services.openai_client import OpenAIClient
+from app.local_answers import build_local_answers
+from app.metrics import REGISTRY, STAGE_SECONDS
+from app.polling import Poller
+from app.services.compaction import CompactionScheduler
+from app.services.history_cache import CachedHistoryStore
+from app.services.telegram_sender import TelegramSender
+from app.services.write_behind import WriteBehindStore
 
 
-async def on_startup(bot: Bot, webhook_url: str, admin_id: int) -> None:
+async def on_startup(
+    bot: Bot, webhook_url: str, admin_id: int, *, drop_pending_updates: bool = True
+) -> None:
     try:
-        await bot.set_webhook(webhook_url, drop_pending_updates=True)
+        await bot.set_webhook(webhook_url, drop_pending_updates=drop_pending_updates)
     except TelegramRetryAfter as exc:
         logging.getLogger(__name__).warning(
             "set_webhook_rate_limited retry_after=%s", exc.retry_after
@@ -32,33 +47,153 @@ async def on_startup(bot: Bot, webhook_url: str, admin_id: int) -> None:
         logging.getLogger(__name__).exception("startup_notify_failed")
 
 
-async def on_shutdown(bot: Bot) -> None:
-    return
+async def on_shutdown(bot: Bot, *clients: object) -> None:
+    for client in clients:
+        close = getattr(client, "close", None)
+        if close is None:
+            continue
+        try:
+            await close()
+        except Exception:
+            logging.getLogger(__name__).exception(
+                "client_close_failed client=%s", type(client).__name__
+            )
+
+
+async def metrics_handler(_: web.Request) -> web.Response:
+    return web.Response(text=REGISTRY.render(), content_type="text/plain")
+
+
+async def healthz_handler(_: web.Request) -> web.Response:
+    return web.json_response({"status": "ok"})
+
+
+async def readyz_handler(request: web.Request) -> web.Response:
+    if not request.app["ready"].is_set():
+        return web.json_response({"status": "warming_up"}, status=503)
+    warm = request.app.get("warm")
+    return web.json_response(
+        {"status": "ready", "warm": warm is None or warm.is_set()}
+    )
+
+
+async def _timed_step(name: str, step: Callable[[], Awaitable[object]]) -> bool:
+    start = time.monotonic()
+    try:
+        await step()
+    except Exception:
+        logging.getLogger(__name__).exception(
+            "warmup_step_failed step=%s elapsed_ms=%s",
+            name,
+            int((time.monotonic() - start) * 1000),
+        )
+        return False
+    elapsed = time.monotonic() - start
+    STAGE_SECONDS.observe(elapsed, stage=f"warmup_{name}")
+    logging.getLogger(__name__).info(
+        "warmup_step_done step=%s elapsed_ms=%s", name, int(elapsed * 1000)
+    )
+    return True
+
+
+async def warm_up(steps: dict[str, Callable[[], Awaitable[object]]]) -> bool:
+    """Runs the warm-up steps concurrently; returns whether all succeeded.
+
+    A failed step is logged and left to be retried lazily on first use.
+    """
+    start = time.monotonic()
+    results = await asyncio.gather(
+        *(_timed_step(name, step) for name, step in steps.items())
+    )
+    logging.getLogger(__name__).info(
+        "warmup_done ok=%s elapsed_ms=%s",
+        all(results),
+        int((time.monotonic() - start) * 1000),
+    )
+    return all(results)
 
 
 def build_webhook_url(base: str, path: str) -> str:
     return f"{base.rstrip('/')}{path}"
 
 
-def create_app() -> web.Application:
-    config = load_config()
-    logging.basicConfig(level=logging.INFO)
+@dataclass
+class Runtime:
+    """Everything the webhook server and the poller share."""
+
+    config: Config
+    bot: Bot
+    dispatcher: Dispatcher
+    openai_client: object
+    firestore_client: object
+    compactions: CompactionScheduler
+    get_context: Callable[[], Awaitable[AppContext]]
 
+    def warm_up_steps(self) -> dict[str, Callable[[], Awaitable[object]]]:
+        steps: dict[str, Callable[[], Awaitable[object]]] = {
+            "bot_identity": self.get_context
+        }
+        for name, client in (
+            ("openai", self.openai_client),
+            ("store", self.firestore_client),
+        ):
+            client_warm_up = getattr(client, "warm_up", None)
+            if client_warm_up is not None:
+                steps[name] = client_warm_up
+        return steps
+
+    async def close(self) -> None:
+        # Compactions still need both clients, so they are drained first.
+        await on_shutdown(
+            self.bot, self.compactions, self.openai_client, self.firestore_client
+        )
+
+
+def build_runtime(
+    config: Config,
+    *,
+    session: BaseSession | None = None,
+    openai_client: object | None = None,
+    firestore_client: object | None = None,
+) -> Runtime:
     bot = Bot(
         token=config.bot_token,
+        session=session,
         default=DefaultBotProperties(parse_mode="HTML"),
     )
     dispatcher = Dispatcher()
     dispatcher.include_router(router)
 
-    openai_client = OpenAIClient(
-        api_key=config.openai_api_key,
-        fast_model=config.openai_fast_model,
+    if openai_client is None:
+        openai_client = build_model_backend(config)
+    if firestore_client is None:
+        firestore_client = build_store_backend(config)
+    firestore_client = WriteBehindStore(
+        firestore_client,
+        max_batch=config.write_behind_max_batch,
+        flush_interval=config.write_behind_flush_ms / 1000,
+        max_pending=config.write_behind_max_pending,
     )
-    if config.firestore_enabled:
-        firestore_client = FirestoreClient(project_id=config.gcp_project_id or "")
-    else:
-        firestore_client = MemoryStore()
+    if config.history_cache_max_age > 0:
+        firestore_client = CachedHistoryStore(
+            firestore_client,
+            window=config.history_max_messages,
+            max_users=config.history_cache_max_users,
+            max_age=config.history_cache_max_age,
+        )
+
+    compactions = CompactionScheduler(
+        debounce=config.compaction_debounce,
+        max_workers=config.compaction_workers,
+        drain_timeout=config.compaction_drain_timeout,
+    )
+    sender = TelegramSender(
+        chat_rate=config.telegram_chat_rate,
+        chat_burst=config.telegram_chat_burst,
+        group_rate=config.telegram_group_rate,
+        global_rate=config.telegram_global_rate,
+    )
+
     async def build_context() -> AppContext:
         bot_user = await bot.get_me()
         return AppContext(
@@ -69,39 +204,186 @@ def create_app() -> web.Application:
             history_max_messages=config.history_max_messages,
             summary_trigger=config.summary_trigger,
             history_ttl_days=config.history_ttl_days,
+            stream_replies=config.stream_replies,
+            stream_edit_interval=config.stream_edit_interval,
+            history_token_budget=config.history_token_budget,
+            max_message_tokens=config.max_message_tokens,
+            local_answers=build_local_answers(
+                currency_rates=config.local_currency_rates
+            ),
+            stateful_replies=config.stateful_replies,
+            reply_deadline=config.reply_deadline or None,
+            compactions=compactions,
+            sender=sender,
         )
 
-    async def middleware(handler, event, data):
+    context_lock = asyncio.Lock()
+
+    async def get_context() -> AppContext:
+        # The lock keeps concurrent first updates from each calling get_me().
         if "context" not in dispatcher.workflow_data:
-            dispatcher.workflow_data["context"] = await build_context()
-        data["context"] = dispatcher.workflow_data["context"]
+            async with context_lock:
+                if "context" not in dispatcher.workflow_data:
+                    dispatcher.workflow_data["context"] = await build_context()
+        return dispatcher.workflow_data["context"]
+
+    async def middleware(handler, event, data):
+        data["context"] = await get_context()
         return await handler(event, data)
 
     dispatcher.update.middleware(middleware)
+    return Runtime(
+        config=config,
+        bot=bot,
+        dispatcher=dispatcher,
+        openai_client=openai_client,
+        firestore_client=firestore_client,
+        compactions=compactions,
+        get_context=get_context,
+    )
+
+
+def create_app(
+    *,
+    session: BaseSession | None = None,
+    openai_client: object | None = None,
+    firestore_client: object | None = None,
+) -> web.Application:
+    config = load_config()
+    logging.basicConfig(level=logging.INFO)
+    runtime = build_runtime(
+        config,
+        session=session,
+        openai_client=openai_client,
+        firestore_client=firestore_client,
+    )
+    bot = runtime.bot
+    dispatcher = runtime.dispatcher
 
     app = web.Application()
     app["bot"] = bot
-    app["firestore_client"] = firestore_client
+    app["dispatcher"] = dispatcher
+    app["openai_client"] = runtime.openai_client
+    app["firestore_client"] = runtime.firestore_client
+    app["compactions"] = runtime.compactions
+    app["ready"] = asyncio.Event()
+    app["warm"] = asyncio.Event()
+
+    async def run_warm_up() -> None:
+        if await warm_up(runtime.warm_up_steps()):
+            app["warm"].set()
+        else:
+            # Failed steps are retried lazily on first use, so serving cold
+            # beats failing the startup probe over a transient outage.
+            logging.getLogger(__name__).warning("warmup_incomplete serving_cold=true")
+        app["ready"].set()
+
+    async def start_warm_up(_: web.Application) -> None:
+        # Runs in the background so /healthz answers while connections open.
+        app["warm_up_task"] = asyncio.create_task(run_warm_up())
+
+    async def stop_warm_up(_: web.Application) -> None:
+        task = app.get("warm_up_task")
+        if task is not None and not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    app.on_startup.append(start_warm_up)
+    app.on_shutdown.append(stop_warm_up)
+
     if config.webhook_base:
         webhook_url = build_webhook_url(config.webhook_base, config.webhook_path)
 
         async def startup(_: web.Application) -> None:
-            await on_startup(bot, webhook_url, config.admin_id)
-
-        async def shutdown(_: web.Application) -> None:
-            await on_shutdown(bot)
+            await on_startup(
+                bot,
+                webhook_url,
+                config.admin_id,
+                drop_pending_updates=config.drop_pending_updates,
+            )
 
         app.on_startup.append(startup)
-        app.on_shutdown.append(shutdown)
 
-    SimpleRequestHandler(dispatcher=dispatcher, bot=bot).register(
-        app, path=config.webhook_path
-    )
+    if config.ordered_dispatch:
+        request_handler = OrderedRequestHandler(
+            dispatcher=dispatcher,
+            bot=bot,
+            max_concurrency=config.dispatch_max_concurrency,
+            max_pending_per_chat=config.dispatch_max_pending_per_chat,
+            drain_timeout=config.dispatch_drain_timeout,
+        )
+    else:
+        request_handler = SimpleRequestHandler(dispatcher=dispatcher, bot=bot)
+    # Registered first so queued updates drain before the clients are closed.
+    request_handler.register(app, path=config.webhook_path)
+
+    async def shutdown(_: web.Application) -> None:
+        await runtime.close()
+
+    app.on_shutdown.append(shutdown)
+    app.router.add_get("/metrics", metrics_handler)
+    app.router.add_get("/healthz", healthz_handler)
+    app.router.add_get("/readyz", readyz_handler)
     setup_application(app, dispatcher, bot=bot)
     return app
 
 
-def main() -> None:
+async def run_polling(
+    *,
+    session: BaseSession | None = None,
+    openai_client: object | None = None,
+    firestore_client: object | None = None,
+) -> None:
+    """Serves updates with ``getUpdates`` instead of a webhook until SIGINT/SIGTERM."""
+    config = load_config()
+    logging.basicConfig(level=logging.INFO)
+    runtime = build_runtime(
+        config,
+        session=session,
+        openai_client=openai_client,
+        firestore_client=firestore_client,
+    )
+    poller = Poller(
+        runtime.bot,
+        runtime.dispatcher,
+        limit=config.polling_limit,
+        timeout=config.polling_timeout,
+        drop_pending_updates=config.drop_pending_updates,
+        ordered=config.ordered_dispatch,
+        max_concurrency=config.dispatch_max_concurrency,
+        max_pending_per_chat=config.dispatch_max_pending_per_chat,
+        drain_timeout=config.dispatch_drain_timeout,
+    )
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, poller.stop)
+        except (NotImplementedError, RuntimeError):
+            pass
+    try:
+        await warm_up(runtime.warm_up_steps())
+        await poller.run()
+    finally:
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.remove_signal_handler(signum)
+            except (NotImplementedError, RuntimeError):
+                pass
+        await runtime.close()
+        await runtime.bot.session.close()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Odin Telegram bot")
+    parser.add_argument(
+        "--polling",
+        action="store_true",
+        help="receive updates with getUpdates instead of the webhook server",
+    )
+    args = parser.parse_args(argv)
+    if args.polling:
+        asyncio.run(run_polling())
+        return
     app = create_app()
     web.run_app(app, host="0.0.0.0", port=8080)
 
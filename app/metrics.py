@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from dataclasses import dataclass, field
+
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+@dataclass
+class _Metric:
+    name: str
+    help: str
+    labelnames: tuple[str, ...] = ()
+
+    def _key(self, labels: dict[str, object]) -> tuple[str, ...]:
+        if labels.keys() != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+@dataclass
+class Counter(_Metric):
+    _values: dict[tuple[str, ...], float] = field(default_factory=dict, init=False)
+
+    def inc(self, amount: float = 1, **labels: object) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: object) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+@dataclass
+class Gauge(_Metric):
+    _values: dict[tuple[str, ...], float] = field(default_factory=dict, init=False)
+
+    def set(self, value: float, **labels: object) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: object) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: object) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: object) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+@dataclass
+class Histogram(_Metric):
+    buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    # Per label set: non-cumulative bucket counts (last slot is +Inf), sum, count.
+    _values: dict[tuple[str, ...], list] = field(default_factory=dict, init=False)
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            self._values[key] = state
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def count(self, **labels: object) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def render(self) -> list[str]:
+        lines: list[str] = []
+        for key, (counts, total, observed) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                le = bound if isinstance(bound, str) else _format_value(bound)
+                labels = _format_labels(self.labelnames, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {observed}")
+        return lines
+
+
+@dataclass
+class MetricsRegistry:
+    _metrics: dict[str, _Metric] = field(default_factory=dict, init=False)
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        kinds = {Counter: "counter", Gauge: "gauge", Histogram: "histogram"}
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {kinds[type(metric)]}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "odin_stage_seconds",
+    "Time spent in each message handling stage.",
+    ("stage",),
+)
+MODEL_SECONDS = REGISTRY.histogram(
+    "odin_model_seconds",
+    "OpenAI reply latency per model.",
+    ("model",),
+)
+LOCAL_ANSWER_HITS = REGISTRY.counter(
+    "odin_local_answer_hits_total",
+    "Messages answered locally, by resolver.",
+    ("resolver",),
+)
+OPENAI_FAILURES = REGISTRY.counter(
+    "odin_openai_failures_total",
+    "Replies that failed with an OpenAI error.",
+)
+COMPACTIONS = REGISTRY.counter(
+    "odin_compactions_total",
+    "Background history compactions by result (ok, skipped, failed, debounced).",
+    ("result",),
+)
+WRITE_BEHIND_DROPPED = REGISTRY.counter(
+    "odin_write_behind_dropped_total",
+    "Queued messages dropped because the write-behind queue was full.",
+)
+REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    "odin_requests_in_flight",
+    "Messages currently being answered.",
+)
+BACKGROUND_TASKS = REGISTRY.gauge(
+    "odin_background_tasks",
+    "Background tasks currently running.",
+)
+CHAT_QUEUE_DEPTH = REGISTRY.gauge(
+    "odin_chat_queue_depth",
+    "Updates waiting in per-chat dispatch queues.",
+)
+CHAT_QUEUES_ACTIVE = REGISTRY.gauge(
+    "odin_chat_queues_active",
+    "Chats with a running dispatch worker.",
+)
+RESPONSE_CACHE_LOOKUPS = REGISTRY.counter(
+    "odin_response_cache_lookups_total",
+    "Fast-model response cache lookups by result.",
+    ("result",),
+)
+MODEL_ROUTES = REGISTRY.counter(
+    "odin_model_routes_total",
+    "Model routing decisions by chosen model and reason.",
+    ("model", "reason"),
+)
+HEDGES = REGISTRY.counter(
+    "odin_hedged_requests_total",
+    "Hedged fast-model requests by outcome.",
+    ("outcome",),
+)
+CIRCUIT_STATE = REGISTRY.gauge(
+    "odin_circuit_state",
+    "OpenAI circuit breaker state per model (0 closed, 1 half-open, 2 open).",
+    ("model",),
+)
+OPENAI_RETRIES = REGISTRY.counter(
+    "odin_openai_retries_total",
+    "OpenAI requests retried after a transient error.",
+    ("model",),
+)
+COMPACTION_QUEUE_DEPTH = REGISTRY.gauge(
+    "odin_compaction_queue_depth",
+    "Users with a compaction waiting to run.",
+)
+COMPACTION_SECONDS = REGISTRY.histogram(
+    "odin_compaction_seconds",
+    "Duration of background history compactions.",
+)
+COMPACTION_LEASES = REGISTRY.counter(
+    "odin_compaction_leases_total",
+    "Per-user compaction lease attempts by result (acquired, busy, lost).",
+    ("result",),
+)
+TELEGRAM_SEND_SECONDS = REGISTRY.histogram(
+    "odin_telegram_send_seconds",
+    "Telegram Bot API call latency for outgoing messages, by method.",
+    ("method",),
+)
+TELEGRAM_SEND_WAIT_SECONDS = REGISTRY.histogram(
+    "odin_telegram_send_wait_seconds",
+    "Time throttled outgoing messages waited for the per-chat and global rate limits.",
+)
+TELEGRAM_RETRY_AFTER = REGISTRY.counter(
+    "odin_telegram_retry_after_total",
+    "Outgoing Telegram calls retried after a 429 Retry-After, by method.",
+    ("method",),
+)
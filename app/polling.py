@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+import asyncio
+import logging
+
+from aiogram import Bot, Dispatcher
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import Update
+
+from app.dispatch import ChatUpdateQueue
+
+logger = logging.getLogger(__name__)
+
+
+def update_chat_key(update: Update, ordered: bool = True) -> object:
+    chat = getattr(update.event, "chat", None) if ordered else None
+    # Updates without a chat have no ordering constraint.
+    return chat.id if chat is not None else ("update", update.update_id)
+
+
+@dataclass
+class Poller:
+    """Long-polls ``getUpdates`` and feeds the dispatcher through per-chat queues.
+
+    Updates run concurrently across chats and in order within a chat, through
+    the same ``ChatUpdateQueue`` as the webhook server. When a chat's queue is
+    full the offset is not advanced past the rejected update, so Telegram
+    hands it out again on a later poll.
+    """
+
+    bot: Bot
+    dispatcher: Dispatcher
+    limit: int = 100
+    timeout: int = 30
+    drop_pending_updates: bool = True
+    ordered: bool = True
+    max_concurrency: int = 8
+    max_pending_per_chat: int = 100
+    drain_timeout: float = 8.0
+    max_backoff: float = 30.0
+    queue: ChatUpdateQueue = field(init=False)
+    _stopping: asyncio.Event = field(default_factory=asyncio.Event, init=False)
+    _offset: int | None = field(default=None, init=False)
+
+    def __post_init__(self) -> None:
+        self.queue = ChatUpdateQueue(
+            self._process,
+            max_concurrency=self.max_concurrency,
+            max_pending_per_chat=self.max_pending_per_chat,
+        )
+
+    async def _process(self, update: Update) -> None:
+        await self.dispatcher.feed_update(self.bot, update)
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    async def run(self) -> None:
+        # getUpdates is refused while a webhook is set.
+        await self.bot.delete_webhook(drop_pending_updates=self.drop_pending_updates)
+        allowed_updates = self.dispatcher.resolve_used_update_types()
+        logger.info(
+            "polling_started limit=%s timeout=%s drop_pending_updates=%s",
+            self.limit,
+            self.timeout,
+            self.drop_pending_updates,
+        )
+        backoff = 1.0
+        try:
+            while not self._stopping.is_set():
+                try:
+                    updates = await self._poll(allowed_updates)
+                except asyncio.CancelledError:
+                    raise
+                except TelegramRetryAfter as exc:
+                    logger.warning("polling_rate_limited retry_after=%s", exc.retry_after)
+                    await self._sleep(exc.retry_after)
+                    continue
+                except Exception:
+                    logger.exception("polling_failed backoff_s=%s", backoff)
+                    await self._sleep(backoff)
+                    backoff = min(backoff * 2, self.max_backoff)
+                    continue
+                backoff = 1.0
+                if updates and not self._submit(updates):
+                    await self._sleep(1.0)
+        finally:
+            await self.queue.drain(self.drain_timeout)
+            logger.info("polling_stopped offset=%s", self._offset)
+
+    async def _poll(self, allowed_updates: list[str]) -> list[Update] | None:
+        poll = asyncio.ensure_future(
+            self.bot.get_updates(
+                offset=self._offset,
+                limit=self.limit,
+                timeout=self.timeout,
+                allowed_updates=allowed_updates,
+                request_timeout=self.timeout + 10,
+            )
+        )
+        stopping = asyncio.ensure_future(self._stopping.wait())
+        try:
+            await asyncio.wait({poll, stopping}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stopping.cancel()
+        if not poll.done():
+            poll.cancel()
+            await asyncio.gather(poll, return_exceptions=True)
+            return None
+        return poll.result()
+
+    def _submit(self, updates: list[Update]) -> bool:
+        for update in updates:
+            if not self.queue.submit(update_chat_key(update, self.ordered), update):
+                # Telegram resends everything from the offset on the next poll.
+                return False
+            self._offset = update.update_id + 1
+        return True
+
+    async def _sleep(self, delay: float) -> None:
+        try:
+            async with asyncio.timeout(delay):
+                await self._stopping.wait()
+        except TimeoutError:
+            pass
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+from collections.abc import Callable
+from dataclasses import dataclass, field
+import logging
+import time
+
+from app.metrics import CIRCUIT_STATE
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a model whose breaker is open."""
+
+
+@dataclass
+class CircuitBreaker:
+    """Consecutive-failure breaker.
+
+    After ``failure_threshold`` failures in a row the circuit opens and calls
+    are refused for ``reset_timeout`` seconds. After that it is half-open:
+    calls are let through again, the next success closes the circuit and the
+    next failure opens it for another ``reset_timeout``.
+    """
+
+    name: str
+    failure_threshold: int = 5
+    reset_timeout: float = 30.0
+    clock: Callable[[], float] = time.monotonic
+    state: str = field(default=CLOSED, init=False)
+    failures: int = field(default=0, init=False)
+    opened_at: float | None = field(default=None, init=False)
+
+    def __post_init__(self) -> None:
+        CIRCUIT_STATE.set(_STATE_VALUES[self.state], model=self.name)
+
+    def allow(self) -> bool:
+        if self.state == OPEN:
+            if self.clock() - self.opened_at < self.reset_timeout:
+                return False
+            self._set_state(HALF_OPEN)
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        if self.state != CLOSED:
+            self._set_state(CLOSED)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = self.clock()
+            if self.state != OPEN:
+                self._set_state(OPEN)
+
+    def snapshot(self) -> dict[str, object]:
+        return {"state": self.state, "failures": self.failures}
+
+    def _set_state(self, state: str) -> None:
+        logger.warning(
+            "circuit_state_changed model=%s from=%s to=%s failures=%s",
+            self.name,
+            self.state,
+            state,
+            self.failures,
+        )
+        self.state = state
+        CIRCUIT_STATE.set(_STATE_VALUES[state], model=self.name)
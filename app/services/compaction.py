@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+from collections.abc import Awaitable, Callable, Hashable
+from dataclasses import dataclass, field
+import asyncio
+import logging
+import time
+
+from app.metrics import (
+    BACKGROUND_TASKS,
+    COMPACTION_QUEUE_DEPTH,
+    COMPACTION_SECONDS,
+    COMPACTIONS,
+)
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Awaitable[object]]
+
+
+@dataclass
+class CompactionScheduler:
+    """Runs history compactions in the background, at most one per user at a time.
+
+    A user has at most one pending job: scheduling again before it starts
+    replaces it and pushes its start back by ``debounce`` seconds, so a burst
+    of messages is compacted once. A job scheduled while that user's
+    compaction is running starts after it finishes. At most ``max_workers``
+    compactions run at once across users. ``drain`` starts pending jobs
+    without waiting out the debounce and waits for all of them. A job that
+    returns ``False`` is counted as ``skipped`` rather than ``ok``.
+    """
+
+    debounce: float = 2.0
+    max_workers: int = 2
+    drain_timeout: float = 10.0
+    _jobs: dict[Hashable, Job] = field(default_factory=dict, init=False)
+    _due: dict[Hashable, float] = field(default_factory=dict, init=False)
+    _tasks: dict[Hashable, asyncio.Task] = field(default_factory=dict, init=False)
+    _semaphore: asyncio.Semaphore = field(init=False)
+    _draining: asyncio.Event = field(default_factory=asyncio.Event, init=False)
+
+    def __post_init__(self) -> None:
+        self._semaphore = asyncio.Semaphore(self.max_workers)
+
+    @property
+    def pending(self) -> int:
+        return len(self._jobs)
+
+    def schedule(self, key: Hashable, job: Job) -> bool:
+        if self._draining.is_set():
+            return False
+        if key in self._jobs:
+            COMPACTIONS.inc(result="debounced")
+        self._jobs[key] = job
+        self._due[key] = time.monotonic() + self.debounce
+        COMPACTION_QUEUE_DEPTH.set(len(self._jobs))
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._run(key))
+            BACKGROUND_TASKS.inc()
+        return True
+
+    async def drain(self, timeout: float | None = None) -> None:
+        self._draining.set()
+        tasks = list(self._tasks.values())
+        if not tasks:
+            return
+        _, still_running = await asyncio.wait(tasks, timeout=timeout)
+        if still_running:
+            logger.warning(
+                "compaction_drain_timeout running=%s dropped=%s",
+                len(still_running),
+                len(self._jobs),
+            )
+            for task in still_running:
+                task.cancel()
+            await asyncio.gather(*still_running, return_exceptions=True)
+
+    async def close(self) -> None:
+        await self.drain(self.drain_timeout)
+
+    async def _run(self, key: Hashable) -> None:
+        try:
+            while key in self._jobs:
+                await self._wait_until_due(key)
+                job = self._jobs.pop(key)
+                self._due.pop(key, None)
+                COMPACTION_QUEUE_DEPTH.set(len(self._jobs))
+                async with self._semaphore:
+                    start = time.monotonic()
+                    try:
+                        # ``compact`` returns False when there was nothing to do
+                        # or another instance holds the lease.
+                        committed = await job()
+                        result = "skipped" if committed is False else "ok"
+                        COMPACTIONS.inc(result=result)
+                    except Exception:
+                        COMPACTIONS.inc(result="failed")
+                        logger.exception("compact_failed key=%s", key)
+                    finally:
+                        COMPACTION_SECONDS.observe(time.monotonic() - start)
+        finally:
+            self._jobs.pop(key, None)
+            self._due.pop(key, None)
+            COMPACTION_QUEUE_DEPTH.set(len(self._jobs))
+            self._tasks.pop(key, None)
+            BACKGROUND_TASKS.dec()
+
+    async def _wait_until_due(self, key: Hashable) -> None:
+        # ``_due`` moves forward whenever the job is replaced.
+        while not self._draining.is_set():
+            delay = self._due[key] - time.monotonic()
+            if delay <= 0:
+                return
+            try:
+                async with asyncio.timeout(delay):
+                    await self._draining.wait()
+            except TimeoutError:
+                pass
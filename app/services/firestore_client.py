@@ -1,56 +1,118 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
+import inspect
+import logging
+import uuid
 
 from google.cloud import firestore
 
+from app.metrics import COMPACTION_LEASES
+from app.services.lease import FirestoreLease
+from app.services.tokens import count_tokens, window_by_tokens
+
+logger = logging.getLogger(__name__)
+
+# Firestore rejects batches with more than 500 writes.
+_MAX_BATCH_WRITES = 500
+
 
 @dataclass
 class FirestoreClient:
     project_id: str
     ttl_hours: int = 24
+    compact_page_size: int = 200
+    compaction_lease_seconds: float = 120.0
+    instance_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    _db: firestore.AsyncClient | None = field(default=None, init=False, repr=False)
+
+    def _client(self) -> firestore.AsyncClient:
+        if self._db is None:
+            self._db = firestore.AsyncClient(project=self.project_id)
+        return self._db
+
+    async def warm_up(self) -> None:
+        """Opens the gRPC channel with one small read before the first message."""
+        client = self._client()
+        await client.collection("conversations").document("_warmup").get()
 
-    def _client(self) -> firestore.Client:
-        return firestore.Client(project=self.project_id)
+    async def close(self) -> None:
+        if self._db is None:
+            return
+        db, self._db = self._db, None
+        # AsyncClient.close() only closes the HTTP session; the gRPC channel
+        # belongs to the GAPIC client, which exists once a request was made.
+        api = getattr(db, "_firestore_api_internal", None)
+        if api is None:
+            return
+        closed = api.transport.close()
+        if inspect.isawaitable(closed):
+            await closed
 
-    def append_message(self, user_id: int, role: str, content: str) -> None:
+    async def append_message(self, user_id: int, role: str, content: str) -> None:
         client = self._client()
         expires_at = datetime.now(timezone.utc) + timedelta(hours=self.ttl_hours)
         doc = {
             "role": role,
             "content": content,
+            "tokens": count_tokens(content),
             "created_at": firestore.SERVER_TIMESTAMP,
             "expires_at": expires_at,
         }
-        client.collection("conversations").document(str(user_id)).collection(
+        await client.collection("conversations").document(str(user_id)).collection(
             "messages"
         ).add(doc)
 
-    def get_recent_history(self, user_id: int, max_messages: int) -> list[dict[str, str]]:
+    async def append_messages(self, entries: list[tuple[int, str, str]]) -> None:
+        client = self._client()
+        now = datetime.now(timezone.utc)
+        expires_at = now + timedelta(hours=self.ttl_hours)
+        batch = client.batch()
+        for index, (user_id, role, content) in enumerate(entries):
+            # All writes in a batch share one server timestamp, so order the
+            # batch with distinct client-side timestamps instead.
+            doc = {
+                "role": role,
+                "content": content,
+                "tokens": count_tokens(content),
+                "created_at": now + timedelta(microseconds=index),
+                "expires_at": expires_at,
+            }
+            ref = (
+                client.collection("conversations")
+                .document(str(user_id))
+                .collection("messages")
+                .document()
+            )
+            batch.set(ref, doc)
+        await batch.commit()
+
+    async def get_recent_history(
+        self,
+        user_id: int,
+        max_messages: int,
+        token_budget: int | None = None,
+        max_message_tokens: int | None = None,
+    ) -> list[dict[str, object]]:
         client = self._client()
         convo_ref = client.collection("conversations").document(str(user_id))
-        summary_doc = convo_ref.collection("summaries").document("current").get()
-        history: list[dict[str, str]] = []
+        summary_doc = await convo_ref.collection("summaries").document("current").get()
+        history: list[dict[str, object]] = []
         if summary_doc.exists:
-            summary = summary_doc.to_dict().get("content")
-            if summary:
-                history.append({"role": "system", "content": summary})
+            summary = summary_doc.to_dict()
+            if summary.get("content"):
+                history.append(_history_entry(summary, role="system"))
 
         messages_ref = (
             convo_ref.collection("messages")
             .order_by("created_at", direction=firestore.Query.DESCENDING)
             .limit(max_messages)
         )
-        docs = list(messages_ref.stream())
+        docs = [doc async for doc in messages_ref.stream()]
         docs.reverse()
-        history.extend(
-            [
-                {"role": doc.to_dict().get("role"), "content": doc.to_dict().get("content")}
-                for doc in docs
-            ]
-        )
-        return history
+        history.extend(_history_entry(doc.to_dict()) for doc in docs)
+        return window_by_tokens(history, token_budget, max_message_tokens)
 
     async def compact(
         self,
@@ -60,20 +122,77 @@ class FirestoreClient:
         summary_trigger: int,
         ttl_hours: int,
         summarize_fn,
-    ) -> None:
+    ) -> bool:
+        """Summarizes older messages; returns whether a new summary was written."""
         client = self._client()
         convo_ref = client.collection("conversations").document(str(user_id))
-        messages_ref = (
-            convo_ref.collection("messages")
-            .order_by("created_at")
+        messages_col = convo_ref.collection("messages")
+        if await _count(messages_col) <= summary_trigger:
+            return False
+
+        # Several instances may compact the same user at once; only the lease
+        # holder summarizes, the others skip after one transactional read.
+        lease = FirestoreLease(
+            client,
+            convo_ref.collection("state").document("compaction_lease"),
+            owner=self.instance_id,
+            ttl=self.compaction_lease_seconds,
         )
-        docs = list(messages_ref.stream())
-        if len(docs) <= summary_trigger:
-            return
+        if not await lease.acquire():
+            COMPACTION_LEASES.inc(result="busy")
+            logger.info("compact_skipped_lease_busy user_id=%s", user_id)
+            return False
+        COMPACTION_LEASES.inc(result="acquired")
+        try:
+            return await self._compact_locked(
+                client,
+                convo_ref,
+                lease,
+                max_messages=max_messages,
+                summary_trigger=summary_trigger,
+                ttl_hours=ttl_hours,
+                summarize_fn=summarize_fn,
+            )
+        finally:
+            await lease.release()
+
+    async def _compact_locked(
+        self,
+        client: firestore.AsyncClient,
+        convo_ref: firestore.AsyncDocumentReference,
+        lease: FirestoreLease,
+        *,
+        max_messages: int,
+        summary_trigger: int,
+        ttl_hours: int,
+        summarize_fn,
+    ) -> bool:
+        messages_col = convo_ref.collection("messages")
+        # Count again: the previous holder may have just compacted.
+        total = await _count(messages_col)
+        if total <= summary_trigger:
+            return False
+
+        overflow = total - max_messages
+        older_docs = []
+        cursor = None
+        while len(older_docs) < overflow:
+            page_query = messages_col.order_by("created_at").limit(
+                min(self.compact_page_size, overflow - len(older_docs))
+            )
+            if cursor is not None:
+                page_query = page_query.start_after(cursor)
+            page = [doc async for doc in page_query.stream()]
+            if not page:
+                break
+            older_docs.extend(page)
+            cursor = page[-1]
+        if not older_docs:
+            return False
 
-        older_docs = docs[:-max_messages]
-        recent_docs = docs[-max_messages:]
-        existing_summary_doc = convo_ref.collection("summaries").document("current").get()
+        existing_summary_doc = await convo_ref.collection("summaries").document(
+            "current"
+        ).get()
         existing_summary = ""
         if existing_summary_doc.exists:
             existing_summary = existing_summary_doc.to_dict().get("content", "")
@@ -83,12 +202,78 @@ class FirestoreClient:
             for doc in older_docs
         ]
         summary = await summarize_fn(older_messages, existing_summary)
+        # Summarizing can outlast the lease; write nothing if another instance
+        # has taken it over in the meantime.
+        if not await lease.renew():
+            COMPACTION_LEASES.inc(result="lost")
+            return False
         expires_at = datetime.now(timezone.utc) + timedelta(hours=ttl_hours)
-        convo_ref.collection("summaries").document("current").set(
-            {"content": summary, "updated_at": firestore.SERVER_TIMESTAMP, "expires_at": expires_at}
+        await convo_ref.collection("summaries").document("current").set(
+            {
+                "content": summary,
+                "tokens": count_tokens(summary),
+                "updated_at": firestore.SERVER_TIMESTAMP,
+                "expires_at": expires_at,
+            }
         )
 
-        batch = client.batch()
-        for doc in older_docs:
-            batch.delete(doc.reference)
-        batch.commit()
+        for start in range(0, len(older_docs), _MAX_BATCH_WRITES):
+            batch = client.batch()
+            for doc in older_docs[start : start + _MAX_BATCH_WRITES]:
+                batch.delete(doc.reference)
+            await batch.commit()
+        return True
+
+    async def get_response_state(self, user_id: int) -> dict[str, object] | None:
+        client = self._client()
+        doc = await (
+            client.collection("conversations")
+            .document(str(user_id))
+            .collection("state")
+            .document("response")
+            .get()
+        )
+        if not doc.exists:
+            return None
+        data = doc.to_dict()
+        expires_at = data.get("expires_at")
+        if expires_at is not None and expires_at <= datetime.now(timezone.utc):
+            return None
+        return {
+            "response_id": data.get("response_id"),
+            "model": data.get("model"),
+            "turns": data.get("turns", 0),
+        }
+
+    async def set_response_state(self, user_id: int, state: dict[str, object]) -> None:
+        client = self._client()
+        expires_at = datetime.now(timezone.utc) + timedelta(hours=self.ttl_hours)
+        await (
+            client.collection("conversations")
+            .document(str(user_id))
+            .collection("state")
+            .document("response")
+            .set(
+                {
+                    **state,
+                    "updated_at": firestore.SERVER_TIMESTAMP,
+                    "expires_at": expires_at,
+                }
+            )
+        )
+
+
+async def _count(query) -> int:
+    result = await query.count(alias="total").get()
+    return result[0][0].value if result else 0
+
+
+def _history_entry(data: dict[str, object], role: str | None = None) -> dict[str, object]:
+    content = data.get("content") or ""
+    tokens = data.get("tokens")
+    return {
+        "role": role or data.get("role"),
+        "content": data.get("content"),
+        # Documents written before token counts were stored get counted here.
+        "tokens": tokens if isinstance(tokens, int) else count_tokens(str(content)),
+    }
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+from collections import OrderedDict, deque
+from collections.abc import Callable
+from dataclasses import dataclass, field
+import time
+
+from app.services.tokens import count_tokens, window_by_tokens
+
+
+@dataclass
+class _CacheEntry:
+    summary: dict[str, object] | None
+    messages: deque[dict[str, object]]
+    loaded_at: float
+
+
+@dataclass
+class CachedHistoryStore:
+    """Read-through per-user cache of the recent history window and summary.
+
+    Entries are kept current by this instance's own appends and compactions;
+    writes from other instances become visible once an entry is older than
+    ``max_age`` seconds.
+    """
+
+    store: object
+    window: int = 16
+    max_users: int = 1024
+    max_age: float = 300.0
+    clock: Callable[[], float] = time.monotonic
+    hits: int = field(default=0, init=False)
+    misses: int = field(default=0, init=False)
+    evictions: int = field(default=0, init=False)
+    _entries: OrderedDict[int, _CacheEntry] = field(
+        default_factory=OrderedDict, init=False
+    )
+    _generations: dict[int, int] = field(default_factory=dict, init=False)
+
+    async def append_message(self, user_id: int, role: str, content: str) -> None:
+        await self.store.append_message(user_id, role, content)
+        self._bump(user_id)
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            entry.messages.append(
+                {"role": role, "content": content, "tokens": count_tokens(content)}
+            )
+
+    async def get_recent_history(
+        self,
+        user_id: int,
+        max_messages: int,
+        token_budget: int | None = None,
+        max_message_tokens: int | None = None,
+    ) -> list[dict[str, object]]:
+        entry = self._fresh_entry(user_id)
+        if entry is not None and max_messages <= self.window:
+            self.hits += 1
+            self._entries.move_to_end(user_id)
+            return window_by_tokens(
+                self._render(entry, max_messages), token_budget, max_message_tokens
+            )
+
+        self.misses += 1
+        generation = self._generations.get(user_id, 0)
+        history = await self.store.get_recent_history(
+            user_id, max_messages=max(max_messages, self.window)
+        )
+        if self._generations.get(user_id, 0) == generation:
+            self._store_entry(user_id, history)
+        else:
+            # A local write raced the load, so the result may already be stale.
+            self._entries.pop(user_id, None)
+
+        summary = history[:1] if history and history[0].get("role") == "system" else []
+        messages = history[len(summary):]
+        if max_messages <= 0:
+            messages = []
+        return window_by_tokens(
+            [dict(msg) for msg in summary + messages[-max_messages:]],
+            token_budget,
+            max_message_tokens,
+        )
+
+    async def compact(self, user_id: int, *, max_messages: int, summarize_fn, **kwargs) -> bool:
+        summaries: list[str] = []
+
+        async def capture_summary(messages, existing_summary):
+            summary = await summarize_fn(messages, existing_summary)
+            summaries.append(summary)
+            return summary
+
+        try:
+            committed = await self.store.compact(
+                user_id,
+                max_messages=max_messages,
+                summarize_fn=capture_summary,
+                **kwargs,
+            )
+        except Exception:
+            self.invalidate(user_id)
+            raise
+        if not summaries:
+            return committed
+        if not committed:
+            # Summarized but not written (e.g. the Firestore lease was lost):
+            # the store may differ from what this instance expected.
+            self.invalidate(user_id)
+            return False
+        self._bump(user_id)
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return True
+        entry.summary = {
+            "role": "system",
+            "content": summaries[-1],
+            "tokens": count_tokens(summaries[-1]),
+        }
+        while len(entry.messages) > max_messages:
+            entry.messages.popleft()
+        return True
+
+    async def get_response_state(self, user_id: int) -> dict[str, object] | None:
+        return await self.store.get_response_state(user_id)
+
+    async def set_response_state(self, user_id: int, state: dict[str, object]) -> None:
+        await self.store.set_response_state(user_id, state)
+
+    def invalidate(self, user_id: int) -> None:
+        self._bump(user_id)
+        self._entries.pop(user_id, None)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+        }
+
+    async def warm_up(self) -> None:
+        warm_up = getattr(self.store, "warm_up", None)
+        if warm_up is not None:
+            await warm_up()
+
+    async def close(self) -> None:
+        self._entries.clear()
+        close = getattr(self.store, "close", None)
+        if close is not None:
+            await close()
+
+    def _fresh_entry(self, user_id: int) -> _CacheEntry | None:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        if self.clock() - entry.loaded_at > self.max_age:
+            self._entries.pop(user_id, None)
+            return None
+        return entry
+
+    def _store_entry(self, user_id: int, history: list[dict[str, object]]) -> None:
+        summary = None
+        messages: deque[dict[str, object]] = deque(maxlen=self.window)
+        if history and history[0].get("role") == "system":
+            summary = dict(history[0])
+            history = history[1:]
+        messages.extend(dict(msg) for msg in history)
+        self._entries[user_id] = _CacheEntry(
+            summary=summary, messages=messages, loaded_at=self.clock()
+        )
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _bump(self, user_id: int) -> None:
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+    @staticmethod
+    def _render(entry: _CacheEntry, max_messages: int) -> list[dict[str, object]]:
+        history: list[dict[str, object]] = []
+        if entry.summary is not None:
+            history.append(dict(entry.summary))
+        if max_messages > 0:
+            history.extend(dict(msg) for msg in list(entry.messages)[-max_messages:])
+        return history
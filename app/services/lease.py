@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+import logging
+
+from google.cloud import firestore
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FirestoreLease:
+    """An expiring lock held in one Firestore document.
+
+    The document stores ``owner`` and ``expires_at``. ``acquire`` claims it in
+    a transaction when it is missing, expired or already ours, so of several
+    instances racing for the same lease exactly one wins; the others get
+    ``False`` after a single read. ``renew`` extends a lease only while we
+    still own it, which lets the holder check it has not expired and been
+    taken over before doing anything irreversible. ``release`` deletes the
+    document only if we own it.
+    """
+
+    client: firestore.AsyncClient
+    reference: firestore.AsyncDocumentReference
+    owner: str
+    ttl: float = 120.0
+
+    async def acquire(self, now: datetime | None = None) -> bool:
+        return await self._claim(now, require_owner=False)
+
+    async def renew(self, now: datetime | None = None) -> bool:
+        renewed = await self._claim(now, require_owner=True)
+        if not renewed:
+            logger.warning(
+                "lease_lost path=%s owner=%s", self.reference.path, self.owner
+            )
+        return renewed
+
+    async def release(self) -> None:
+        @firestore.async_transactional
+        async def release(transaction) -> None:
+            snapshot = await self.reference.get(transaction=transaction)
+            if snapshot.exists and snapshot.to_dict().get("owner") == self.owner:
+                transaction.delete(self.reference)
+
+        await release(self.client.transaction())
+
+    async def _claim(self, now: datetime | None, *, require_owner: bool) -> bool:
+        now = now or datetime.now(timezone.utc)
+
+        @firestore.async_transactional
+        async def claim(transaction) -> bool:
+            snapshot = await self.reference.get(transaction=transaction)
+            current = snapshot.to_dict() if snapshot.exists else None
+            if not _claimable(current, self.owner, now, require_owner=require_owner):
+                return False
+            transaction.set(
+                self.reference,
+                {"owner": self.owner, "expires_at": now + timedelta(seconds=self.ttl)},
+            )
+            return True
+
+        return await claim(self.client.transaction())
+
+
+def _claimable(
+    current: dict[str, object] | None,
+    owner: str,
+    now: datetime,
+    *,
+    require_owner: bool,
+) -> bool:
+    if current is None:
+        return not require_owner
+    expires_at = current.get("expires_at")
+    live = expires_at is not None and expires_at > now
+    if current.get("owner") == owner:
+        return live or not require_owner
+    return not require_owner and not live
@@ -1,44 +1,102 @@
 from __future__ import annotations
 
-from collections import defaultdict
+from collections import deque
+from collections.abc import Callable
 from dataclasses import dataclass, field
-from datetime import datetime, timedelta, timezone
+from itertools import count, islice
 from threading import Lock
+import heapq
+import time
+
+from app.services.tokens import count_tokens, window_by_tokens
+
+
+class _Record:
+    __slots__ = ("role", "content", "tokens", "created_at")
+
+    def __init__(self, role: str, content: str, created_at: float) -> None:
+        self.role = role
+        self.content = content
+        self.tokens = count_tokens(content)
+        self.created_at = created_at
+
+    def as_message(self) -> dict[str, object]:
+        return {"role": self.role, "content": self.content, "tokens": self.tokens}
+
+
+class _Summary:
+    __slots__ = ("content", "tokens", "expires_at")
+
+    def __init__(self, content: str, expires_at: float) -> None:
+        self.content = content
+        self.tokens = count_tokens(content)
+        self.expires_at = expires_at
 
 
 @dataclass
 class MemoryStore:
+    """In-process conversation store.
+
+    Each user keeps a bounded deque of records. A global, time-ordered index of
+    appended records drives TTL expiry from the oldest end, so expiry work is
+    amortized O(1) per message instead of a full rescan on every call.
+    Summaries expire on their own ``expires_at``.
+    """
+
     ttl_hours: int = 24
+    max_messages_per_user: int = 256
+    clock: Callable[[], float] = time.time
     _lock: Lock = field(default_factory=Lock, init=False)
-    _messages: dict[int, list[dict[str, object]]] = field(
-        default_factory=lambda: defaultdict(list), init=False
+    _messages: dict[int, deque[_Record]] = field(default_factory=dict, init=False)
+    _summaries: dict[int, _Summary] = field(default_factory=dict, init=False)
+    _expiry_index: deque[tuple[int, _Record]] = field(
+        default_factory=deque, init=False
+    )
+    _summary_index: list[tuple[float, int, int, _Summary]] = field(
+        default_factory=list, init=False
     )
-    _summaries: dict[int, dict[str, object]] = field(
+    _summary_seq: count = field(default_factory=count, init=False)
+    _response_states: dict[int, tuple[float, dict[str, object]]] = field(
         default_factory=dict, init=False
     )
 
-    def append_message(self, user_id: int, role: str, content: str) -> None:
-        created_at = datetime.now(timezone.utc)
+    async def append_message(self, user_id: int, role: str, content: str) -> None:
+        await self.append_messages([(user_id, role, content)])
+
+    async def append_messages(self, entries: list[tuple[int, str, str]]) -> None:
+        now = self.clock()
         with self._lock:
-            self._messages[user_id].append(
-                {"role": role, "content": content, "created_at": created_at}
-            )
-            self._prune_locked(user_id)
+            self._expire_locked(now)
+            for user_id, role, content in entries:
+                record = _Record(role, content, now)
+                messages = self._messages.get(user_id)
+                if messages is None:
+                    messages = deque(maxlen=self.max_messages_per_user)
+                    self._messages[user_id] = messages
+                messages.append(record)
+                self._expiry_index.append((user_id, record))
 
-    def get_recent_history(self, user_id: int, max_messages: int) -> list[dict[str, str]]:
+    async def get_recent_history(
+        self,
+        user_id: int,
+        max_messages: int,
+        token_budget: int | None = None,
+        max_message_tokens: int | None = None,
+    ) -> list[dict[str, object]]:
         with self._lock:
-            self._prune_locked(user_id)
+            self._expire_locked(self.clock())
+            history: list[dict[str, object]] = []
             summary = self._summaries.get(user_id)
-            history: list[dict[str, str]] = []
-            if summary and summary.get("content"):
-                history.append({"role": "system", "content": summary["content"]})
-            history.extend(
-                [
-                    {"role": msg["role"], "content": msg["content"]}
-                    for msg in self._messages.get(user_id, [])[-max_messages:]
-                ]
-            )
-            return history
+            if summary and summary.content:
+                history.append(
+                    {"role": "system", "content": summary.content, "tokens": summary.tokens}
+                )
+            messages = self._messages.get(user_id)
+            if messages and max_messages > 0:
+                recent = list(islice(reversed(messages), max_messages))
+                recent.reverse()
+                history.extend(record.as_message() for record in recent)
+        return window_by_tokens(history, token_budget, max_message_tokens)
 
     async def compact(
         self,
@@ -48,29 +106,65 @@ class MemoryStore:
         summary_trigger: int,
         ttl_hours: int,
         summarize_fn,
-    ) -> None:
+    ) -> bool:
         with self._lock:
-            self._prune_locked(user_id)
-            messages = self._messages.get(user_id, [])
-            if len(messages) <= summary_trigger:
-                return
-            older = messages[:-max_messages]
-            self._messages[user_id] = messages[-max_messages:]
-            existing_summary = self._summaries.get(user_id, {}).get("content", "")
-
-        summary = await summarize_fn(older, existing_summary)
-        expires_at = datetime.now(timezone.utc) + timedelta(hours=ttl_hours)
+            self._expire_locked(self.clock())
+            messages = self._messages.get(user_id)
+            if not messages or len(messages) <= summary_trigger:
+                return False
+            older = [
+                {"role": record.role, "content": record.content}
+                for record in (
+                    messages.popleft()
+                    for _ in range(len(messages) - max_messages)
+                )
+            ]
+            summary = self._summaries.get(user_id)
+            existing_summary = summary.content if summary else ""
+
+        content = await summarize_fn(older, existing_summary)
+        expires_at = self.clock() + ttl_hours * 3600
         with self._lock:
-            self._summaries[user_id] = {
-                "content": summary,
-                "expires_at": expires_at,
-            }
-
-    def _prune_locked(self, user_id: int) -> None:
-        cutoff = datetime.now(timezone.utc) - timedelta(hours=self.ttl_hours)
-        self._messages[user_id] = [
-            msg for msg in self._messages.get(user_id, []) if msg["created_at"] >= cutoff
-        ]
-        summary = self._summaries.get(user_id)
-        if summary and summary.get("expires_at") and summary["expires_at"] < cutoff:
-            self._summaries.pop(user_id, None)
+            summary = _Summary(content, expires_at)
+            self._summaries[user_id] = summary
+            heapq.heappush(
+                self._summary_index,
+                (expires_at, next(self._summary_seq), user_id, summary),
+            )
+        return True
+
+    async def get_response_state(self, user_id: int) -> dict[str, object] | None:
+        with self._lock:
+            entry = self._response_states.get(user_id)
+            if entry is None:
+                return None
+            expires_at, state = entry
+            if expires_at <= self.clock():
+                del self._response_states[user_id]
+                return None
+            return dict(state)
+
+    async def set_response_state(self, user_id: int, state: dict[str, object]) -> None:
+        expires_at = self.clock() + self.ttl_hours * 3600
+        with self._lock:
+            self._response_states[user_id] = (expires_at, dict(state))
+
+    def _expire_locked(self, now: float) -> None:
+        cutoff = now - self.ttl_hours * 3600
+        index = self._expiry_index
+        while index and index[0][1].created_at < cutoff:
+            user_id, record = index.popleft()
+            messages = self._messages.get(user_id)
+            # Records already dropped by the deque bound or by compaction are
+            # skipped; anything older in the user's deque has expired before.
+            if messages and messages[0] is record:
+                messages.popleft()
+                if not messages:
+                    del self._messages[user_id]
+
+        summaries = self._summary_index
+        while summaries and summaries[0][0] <= now:
+            _, _, user_id, summary = heapq.heappop(summaries)
+            if self._summaries.get(user_id) is summary:
+                del self._summaries[user_id]
+
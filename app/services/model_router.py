@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass, field
+import logging
+import math
+import time
+
+from app.metrics import MODEL_ROUTES
+from app.services.tokens import message_tokens
+
+logger = logging.getLogger(__name__)
+
+_STANDARD_MODEL_PHRASES = (
+    "standard model",
+    "full model",
+    "slow model",
+    "обычную модель",
+    "стандартную модель",
+    "полную модель",
+    "медленную модель",
+)
+
+
+@dataclass
+class ModelStats:
+    recent_latencies: deque[float] = field(default_factory=lambda: deque(maxlen=200))
+    latency_ewma: float | None = None
+    error_ewma: float = 0.0
+    samples: int = 0
+    consecutive_failures: int = 0
+    last_failure_at: float | None = None
+    last_sample_at: float | None = None
+
+
+@dataclass(frozen=True)
+class RoutingDecision:
+    at: float
+    model: str
+    reason: str
+    prompt_tokens: int
+    latency_ewma: dict[str, float | None]
+    error_ewma: dict[str, float]
+
+
+@dataclass
+class ModelRouter:
+    """Chooses between the primary and the fast model.
+
+    The text heuristics of the old ``_choose_model`` give the preferred model;
+    per-model EWMAs of latency and error rate can then override it. A model
+    with repeated recent failures or a high error rate is avoided for
+    ``failure_cooldown`` seconds. With ``latency_slo`` set, a short prompt
+    whose fast model's latency EWMA exceeds it while the primary is within it
+    goes to the primary until the EWMA is ``stale_after`` seconds old. Prompts
+    that prefer the primary are never moved to the fast model for speed: its
+    output and history caps would truncate their answers. Every decision is kept in
+    ``decisions`` (bounded) and counted in ``odin_model_routes_total``.
+    """
+
+    model: str
+    fast_model: str | None = None
+    latency_slo: float = 0.0
+    alpha: float = 0.2
+    max_fast_prompt_chars: int = 160
+    fast_max_prompt_tokens: int | None = None
+    max_error_rate: float = 0.5
+    failure_threshold: int = 2
+    failure_cooldown: float = 30.0
+    stale_after: float = 300.0
+    clock: Callable[[], float] = time.monotonic
+    decision_log_size: int = 256
+    stats: dict[str, ModelStats] = field(default_factory=dict, init=False)
+    decisions: deque[RoutingDecision] = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.decisions = deque(maxlen=self.decision_log_size)
+
+    def record(self, model: str, latency: float | None, ok: bool) -> None:
+        stats = self.stats.setdefault(model, ModelStats())
+        stats.samples += 1
+        stats.last_sample_at = self.clock()
+        stats.error_ewma += self.alpha * ((0.0 if ok else 1.0) - stats.error_ewma)
+        if ok:
+            stats.consecutive_failures = 0
+        else:
+            stats.consecutive_failures += 1
+            stats.last_failure_at = self.clock()
+        if latency is not None:
+            self.record_latency(model, latency)
+
+    def record_latency(self, model: str, latency: float) -> None:
+        """Adds a latency sample without counting a request outcome.
+
+        Used for requests cancelled before they finished, whose elapsed time
+        is only a lower bound on the model's latency.
+        """
+        stats = self.stats.setdefault(model, ModelStats())
+        stats.recent_latencies.append(latency)
+        if stats.latency_ewma is None:
+            stats.latency_ewma = latency
+        else:
+            stats.latency_ewma += self.alpha * (latency - stats.latency_ewma)
+
+    def latency_percentile(
+        self, model: str, pct: float, min_samples: int = 1
+    ) -> float | None:
+        stats = self.stats.get(model)
+        if stats is None or len(stats.recent_latencies) < max(min_samples, 1):
+            return None
+        ordered = sorted(stats.recent_latencies)
+        rank = max(math.ceil(pct / 100 * len(ordered)) - 1, 0)
+        return ordered[rank]
+
+    def choose(
+        self, user_text: str | None, messages: list[dict[str, object]]
+    ) -> RoutingDecision:
+        prompt_tokens = sum(message_tokens(message) for message in messages)
+        model, reason = self._route(user_text, messages, prompt_tokens)
+        decision = RoutingDecision(
+            at=self.clock(),
+            model=model,
+            reason=reason,
+            prompt_tokens=prompt_tokens,
+            latency_ewma={
+                name: self.stats[name].latency_ewma if name in self.stats else None
+                for name in self._models()
+            },
+            error_ewma={
+                name: self.stats[name].error_ewma if name in self.stats else 0.0
+                for name in self._models()
+            },
+        )
+        self.decisions.append(decision)
+        MODEL_ROUTES.inc(model=model, reason=reason)
+        logger.info(
+            "model_routed model=%s reason=%s prompt_tokens=%s latency_ewma=%s error_ewma=%s",
+            model,
+            reason,
+            prompt_tokens,
+            decision.latency_ewma,
+            decision.error_ewma,
+        )
+        return decision
+
+    def _models(self) -> tuple[str, ...]:
+        return (self.model, self.fast_model) if self.fast_model else (self.model,)
+
+    def _route(
+        self,
+        user_text: str | None,
+        messages: list[dict[str, object]],
+        prompt_tokens: int,
+    ) -> tuple[str, str]:
+        if not self.fast_model:
+            return self.model, "single_model"
+        text = (user_text or "").strip()
+        if not text:
+            return self.model, "no_text"
+        lowered = text.lower()
+        if len(messages) >= 6 and any(
+            phrase in lowered for phrase in _STANDARD_MODEL_PHRASES
+        ):
+            return self.model, "user_requested"
+
+        if len(text) >= self.max_fast_prompt_chars:
+            preferred, other, reason = self.model, self.fast_model, "long_prompt"
+        elif (
+            self.fast_max_prompt_tokens is not None
+            and prompt_tokens > self.fast_max_prompt_tokens
+        ):
+            preferred, other, reason = self.model, self.fast_model, "large_context"
+        else:
+            preferred, other, reason = self.fast_model, self.model, "short_prompt"
+
+        if not self._healthy(preferred) and self._healthy(other):
+            return other, f"{reason}:{preferred}_unhealthy"
+        # Long prompts and large contexts are not moved to the capped fast
+        # model for speed.
+        if (
+            preferred == self.fast_model
+            and self._over_slo(preferred)
+            and not self._over_slo(other)
+            and self._healthy(other)
+        ):
+            return other, f"{reason}:{preferred}_over_slo"
+        return preferred, reason
+
+    def _healthy(self, model: str) -> bool:
+        # An avoided model gets no new samples, so it is retried once the
+        # cooldown since its last failure has passed.
+        stats = self.stats.get(model)
+        if stats is None or stats.last_failure_at is None:
+            return True
+        if self.clock() - stats.last_failure_at >= self.failure_cooldown:
+            return True
+        return (
+            stats.error_ewma <= self.max_error_rate
+            and stats.consecutive_failures < self.failure_threshold
+        )
+
+    def _over_slo(self, model: str) -> bool:
+        if not self.latency_slo:
+            return False
+        stats = self.stats.get(model)
+        if stats is None or stats.latency_ewma is None:
+            return False
+        if self.clock() - stats.last_sample_at >= self.stale_after:
+            return False
+        return stats.latency_ewma > self.latency_slo
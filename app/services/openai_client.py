@@ -1,10 +1,74 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+import asyncio
 import logging
+import random
+import time
+from typing import TYPE_CHECKING, TypeVar
 
-from openai import AsyncOpenAI
+from app.metrics import HEDGES, OPENAI_RETRIES, RESPONSE_CACHE_LOOKUPS
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.services.model_router import ModelRouter
+from app.services.response_cache import ResponseCache, cache_key, context_fingerprint
+from app.services.summarizer import HierarchicalSummarizer
+from app.services.tokens import strip_token_counts, window_by_tokens
 
+# The SDK (and httpx under it) is imported on first use rather than at module
+# load: it is one of the slowest imports in the app and adds to cold starts.
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+# Kept byte-for-byte stable and always first so prompt-prefix caching hits.
+FAST_SYSTEM_PROMPT = (
+    "Answer concisely and directly. "
+    "Do not add extra offers or follow-up suggestions."
+)
+
+
+T = TypeVar("T")
+
+
+def _retryable_errors() -> tuple[type[Exception], ...]:
+    import openai
+
+    return (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)
+
+
+def _request_errors() -> tuple[type[Exception], ...]:
+    # Errors about the request itself, which say nothing about model health.
+    import openai
+
+    return (openai.BadRequestError, openai.NotFoundError)
+
+
+def _remaining(deadline: float | None) -> float | None:
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0.0)
+
+
+def _retry_after(exc: Exception) -> float | None:
+    """Reads ``retry-after-ms`` / ``retry-after`` (seconds or HTTP date)."""
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
 
 
 @dataclass
@@ -14,91 +78,543 @@ class OpenAIClient:
     fast_model: str | None = None
     fast_max_output_tokens: int = 128
     fast_temperature: float = 0.2
+    max_connections: int = 20
+    max_keepalive_connections: int = 10
+    keepalive_expiry: float = 60.0
+    history_token_budget: int | None = None
+    fast_history_token_budget: int | None = None
+    max_message_tokens: int | None = None
+    response_cache: ResponseCache | None = None
+    chain_max_turns: int = 20
+    latency_slo: float = 0.0
+    fast_max_prompt_tokens: int | None = None
+    router: ModelRouter | None = None
+    hedge_percentile: float | None = None
+    hedge_min_samples: int = 20
+    max_retries: int = 2
+    retry_base_delay: float = 0.5
+    retry_max_delay: float = 8.0
+    circuit_failure_threshold: int = 5
+    circuit_reset_timeout: float = 30.0
+    summary_chunk_tokens: int = 2000
+    summary_max_tokens: int = 400
+    summary_parallelism: int = 4
+    summary_use_fast_model: bool = False
     _logger: logging.Logger = logging.getLogger(__name__)
+    _async_client: AsyncOpenAI | None = field(default=None, init=False, repr=False)
+    _responses_api: bool | None = field(default=None, init=False, repr=False)
+    _breakers: dict[str, CircuitBreaker] = field(
+        default_factory=dict, init=False, repr=False
+    )
+
+    def __post_init__(self) -> None:
+        if self.router is None:
+            self.router = ModelRouter(
+                model=self.model,
+                fast_model=self.fast_model,
+                latency_slo=self.latency_slo,
+                fast_max_prompt_tokens=self.fast_max_prompt_tokens,
+            )
+        for name in (self.model, self.fast_model):
+            if name:
+                self._breakers[name] = CircuitBreaker(
+                    name,
+                    failure_threshold=self.circuit_failure_threshold,
+                    reset_timeout=self.circuit_reset_timeout,
+                )
 
     def _client(self) -> AsyncOpenAI:
-        return AsyncOpenAI(api_key=self.api_key)
-
-    def _choose_model(self, user_text: str | None, messages: list[dict[str, str]]) -> str:
-        if not self.fast_model:
-            return self.model
-        if not user_text:
-            return self.model
-        text = user_text.strip()
-        if not text:
-            return self.model
-        lowered = text.lower()
-        asks_standard_model = any(
+        if self._async_client is None:
+            import httpx
+            from openai import AsyncOpenAI
+
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+            )
+            # Retries are done by ``_with_retries`` so they can honour the
+            # deadline and the circuit breakers.
+            self._async_client = AsyncOpenAI(
+                api_key=self.api_key, http_client=http_client, max_retries=0
+            )
+        return self._async_client
+
+    def detect_capabilities(self) -> bool:
+        """Checks once whether the SDK has the Responses API; called at startup."""
+        self._responses_api = getattr(self._client(), "responses", None) is not None
+        self._logger.info("openai_capabilities responses_api=%s", self._responses_api)
+        if not self._responses_api:
+            import openai
+
+            self._logger.warning(
+                "openai_responses_api_unavailable sdk_version=%s "
+                "stateful replies fall back to full history replay",
+                openai.__version__,
+            )
+        return self._responses_api
+
+    async def warm_up(self) -> None:
+        """Detects capabilities and opens a pooled connection to the API."""
+        self.detect_capabilities()
+        await self._client().models.retrieve(self.model)
+
+    def _uses_responses(self, client: AsyncOpenAI) -> bool:
+        if self._responses_api is None:
+            self._responses_api = getattr(client, "responses", None) is not None
+        return self._responses_api
+
+    def breaker_states(self) -> dict[str, dict[str, object]]:
+        return {name: breaker.snapshot() for name, breaker in self._breakers.items()}
+
+    async def close(self) -> None:
+        if self.response_cache is not None:
+            self.response_cache.save()
+        if self._async_client is None:
+            return
+        client, self._async_client = self._async_client, None
+        await client.close()
+
+    def _choose_model(
+        self, user_text: str | None, messages: list[dict[str, str]]
+    ) -> tuple[str, str]:
+        """Returns ``(model, routing reason)``, skipping models whose circuit is open."""
+        decision = self.router.choose(user_text, messages)
+        model = decision.model
+        if self._breakers[model].allow():
+            return model, decision.reason
+        for other, breaker in self._breakers.items():
+            if other != model and breaker.allow():
+                self._logger.warning("circuit_failover from=%s to=%s", model, other)
+                return other, decision.reason
+        raise CircuitOpenError(f"circuit open for {model}")
+
+    async def _with_retries(self, model: str, call: Callable[[], Awaitable[T]]) -> T:
+        """Retries 429, 5xx and connection errors with full-jitter backoff.
+
+        A ``Retry-After`` from the server is a lower bound on the wait; one
+        longer than ``retry_max_delay`` is not waited for and the error is raised.
+        """
+        attempt = 0
+        while True:
+            try:
+                return await call()
+            except _retryable_errors() as exc:
+                if attempt >= self.max_retries:
+                    raise
+                cap = min(self.retry_max_delay, self.retry_base_delay * 2**attempt)
+                delay = random.uniform(0, cap)
+                retry_after = _retry_after(exc)
+                if retry_after is not None:
+                    if retry_after > self.retry_max_delay:
+                        raise
+                    delay = max(delay, retry_after)
+                attempt += 1
+                OPENAI_RETRIES.inc(model=model)
+                self._logger.warning(
+                    "openai_retry model=%s attempt=%s delay_ms=%s error=%s",
+                    model,
+                    attempt,
+                    int(delay * 1000),
+                    type(exc).__name__,
+                )
+                await asyncio.sleep(delay)
+
+    def _cacheable(self, user_text: str | None, model: str) -> bool:
+        # Only short fast-model lookups are cached; the full model gets
+        # conversational prompts whose answers depend on the whole history.
+        if self.response_cache is None or model != self.fast_model or not user_text:
+            return False
+        lowered = user_text.lower()
+        wants_fresh = any(
             phrase in lowered
             for phrase in (
-                "standard model",
-                "full model",
-                "slow model",
-                "обычную модель",
-                "стандартную модель",
-                "полную модель",
-                "медленную модель",
+                "no cache",
+                "fresh answer",
+                "без кэша",
+                "без кеша",
+                "свежий ответ",
             )
         )
-        if len(text) < 160 and (not asks_standard_model or len(messages) < 6):
-            return self.fast_model
-        return self.model
+        return not wants_fresh
+
+    def _cache_key(
+        self,
+        user_text: str | None,
+        model: str,
+        messages: list[dict[str, str]],
+        extra_args: dict[str, object],
+    ) -> str | None:
+        if not self._cacheable(user_text, model):
+            return None
+        system = [msg["content"] for msg in messages if msg.get("role") == "system"]
+        return cache_key(user_text, model, context_fingerprint(system, extra_args))
+
+    def _cached_reply(self, key: str | None) -> str | None:
+        if key is None:
+            return None
+        reply = self.response_cache.get(key)
+        RESPONSE_CACHE_LOOKUPS.inc(result="miss" if reply is None else "hit")
+        return reply
+
+    def _store_reply(self, key: str | None, reply: str) -> None:
+        if key is not None and reply:
+            self.response_cache.set(key, reply)
 
     def _build_messages(
         self, messages: list[dict[str, str]], model: str
     ) -> list[dict[str, str]]:
+        budget = (
+            self.fast_history_token_budget
+            if model == self.fast_model
+            else self.history_token_budget
+        )
+        messages = strip_token_counts(
+            window_by_tokens(
+                messages, budget, self.max_message_tokens, keep_latest=True
+            )
+        )
         if model != self.fast_model:
             return messages
-        if messages and messages[0].get("role") == "system":
-            return messages
-        system_prompt = (
-            "Answer concisely and directly. "
-            "Do not add extra offers or follow-up suggestions."
-        )
-        return [{"role": "system", "content": system_prompt}] + messages
+        return [{"role": "system", "content": FAST_SYSTEM_PROMPT}] + messages
+
+    @asynccontextmanager
+    async def _observe(self, model: str) -> AsyncIterator[None]:
+        """Feeds the request's latency and outcome to the router and breaker."""
+        start = time.monotonic()
+        try:
+            yield
+        except _request_errors():
+            raise
+        except Exception:
+            self.router.record(model, None, ok=False)
+            self._breakers[model].record_failure()
+            raise
+        self.router.record(model, time.monotonic() - start, ok=True)
+        self._breakers[model].record_success()
+
+    def _generation_args(self, model: str) -> dict[str, object]:
+        if model != self.fast_model:
+            return {}
+        return {
+            "max_output_tokens": self.fast_max_output_tokens,
+            "temperature": self.fast_temperature,
+            "stop": ["\n\n"],
+        }
 
     async def generate_reply(
-        self, messages: list[dict[str, str]], user_text: str | None = None
+        self,
+        messages: list[dict[str, str]],
+        user_text: str | None = None,
+        *,
+        deadline: float | None = None,
     ) -> tuple[str, str]:
+        """Returns ``(reply, model)``.
+
+        ``deadline`` is a ``time.monotonic()`` timestamp; once it passes the
+        request is cancelled and ``TimeoutError`` is raised. When the primary
+        model is slower than its ``hedge_percentile`` latency, the same request
+        is also sent to the fast model, without its output and history caps,
+        and whichever answers first is used; turns where the user asked for
+        the standard model are never hedged.
+        """
         client = self._client()
-        model = self._choose_model(user_text, messages)
+        model, reason = self._choose_model(user_text, messages)
+        if self._cacheable(user_text, model):
+            # Cached lookups are answered without earlier turns, so the key
+            # covers everything sent and a repeat hits in any conversation.
+            messages = [{"role": "user", "content": user_text}]
         final_messages = self._build_messages(messages, model)
-        extra_args: dict[str, object] = {}
-        if model == self.fast_model:
-            extra_args["max_output_tokens"] = self.fast_max_output_tokens
-            extra_args["temperature"] = self.fast_temperature
-            extra_args["stop"] = ["\n\n"]
+        extra_args = self._generation_args(model)
+        key = self._cache_key(user_text, model, final_messages, extra_args)
+        cached = self._cached_reply(key)
+        if cached is not None:
+            return cached, model
         try:
-            response = await client.responses.create(
-                model=model,
-                input=final_messages,
-                **extra_args,
-            )
-            content = response.output_text
-            return content.strip(), model
-        except AttributeError:
-            chat_args: dict[str, object] = {
-                "model": model,
-                "messages": final_messages,
-            }
-            if model == self.fast_model:
-                chat_args["max_tokens"] = self.fast_max_output_tokens
-                chat_args["temperature"] = self.fast_temperature
-                chat_args["stop"] = ["\n\n"]
-            response = await client.chat.completions.create(**chat_args)
-            content = response.choices[0].message.content or ""
-            return content.strip(), model
+            async with asyncio.timeout(_remaining(deadline)):
+                hedge_delay = self._hedge_delay(model, reason)
+                if hedge_delay is None:
+                    content = await self._observed_reply(
+                        client, model, final_messages, extra_args
+                    )
+                else:
+                    content, model = await self._hedged_reply(
+                        client, model, final_messages, extra_args, hedge_delay
+                    )
         except Exception:
             self._logger.exception("OpenAI request failed")
             raise
+        self._store_reply(key, content)
+        return content, model
+
+    def _hedge_delay(self, model: str, reason: str) -> float | None:
+        if not self.fast_model or model != self.model or not self.hedge_percentile:
+            return None
+        # The user asked for the standard model; a fast answer would ignore that.
+        if reason == "user_requested":
+            return None
+        if not self._breakers[self.fast_model].allow():
+            return None
+        return self.router.latency_percentile(
+            model, self.hedge_percentile, self.hedge_min_samples
+        )
+
+    async def _observed_reply(
+        self,
+        client: AsyncOpenAI,
+        model: str,
+        final_messages: list[dict[str, str]],
+        extra_args: dict[str, object],
+    ) -> str:
+        async with self._observe(model):
+            return await self._create_reply(client, model, final_messages, extra_args)
+
+    async def _hedged_reply(
+        self,
+        client: AsyncOpenAI,
+        model: str,
+        final_messages: list[dict[str, str]],
+        extra_args: dict[str, object],
+        delay: float,
+    ) -> tuple[str, str]:
+        start = time.monotonic()
+        primary = asyncio.create_task(
+            self._observed_reply(client, model, final_messages, extra_args)
+        )
+        tasks = {primary: model}
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if primary in done:
+                return primary.result(), model
+            fast = self.fast_model
+            # The hedge gets the primary's request as is: the fast model's
+            # output and history caps would truncate a long answer.
+            hedge = asyncio.create_task(
+                self._observed_reply(client, fast, final_messages, extra_args)
+            )
+            tasks[hedge] = fast
+            self._logger.info(
+                "hedge_launched primary=%s hedge=%s delay_ms=%s",
+                model,
+                fast,
+                int(delay * 1000),
+            )
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        outcome = "primary_won" if task is primary else "hedge_won"
+                        HEDGES.inc(outcome=outcome)
+                        self._logger.info(
+                            "hedge_finished outcome=%s model=%s", outcome, tasks[task]
+                        )
+                        return task.result(), tasks[task]
+            HEDGES.inc(outcome="failed")
+            raise primary.exception()
+        finally:
+            # The loser (or both, on timeout) is cancelled and awaited so its
+            # connection is released before the reply goes out.
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # Only completed requests are observed, so without this the slow
+            # tail the hedge cut off would vanish and pull the percentile down.
+            if primary.cancelled():
+                self.router.record_latency(model, time.monotonic() - start)
+
+    async def _create_reply(
+        self,
+        client: AsyncOpenAI,
+        model: str,
+        final_messages: list[dict[str, str]],
+        extra_args: dict[str, object],
+    ) -> str:
+        if self._uses_responses(client):
+            response = await self._with_retries(
+                model,
+                lambda: client.responses.create(
+                    model=model,
+                    input=final_messages,
+                    **extra_args,
+                ),
+            )
+            return response.output_text.strip()
+        chat_args = self._chat_args(model, final_messages)
+        response = await self._with_retries(
+            model, lambda: client.chat.completions.create(**chat_args)
+        )
+        return (response.choices[0].message.content or "").strip()
+
+    def _chat_args(
+        self, model: str, final_messages: list[dict[str, str]], **extra: object
+    ) -> dict[str, object]:
+        chat_args: dict[str, object] = {
+            "model": model,
+            "messages": final_messages,
+            **extra,
+        }
+        if model == self.fast_model:
+            chat_args["max_tokens"] = self.fast_max_output_tokens
+            chat_args["temperature"] = self.fast_temperature
+            chat_args["stop"] = ["\n\n"]
+        return chat_args
+
+    async def generate_chained_reply(
+        self,
+        messages: list[dict[str, str]],
+        user_text: str | None,
+        state: dict[str, object] | None,
+        *,
+        deadline: float | None = None,
+    ) -> tuple[str, str, dict[str, object] | None]:
+        """Continues the server-side conversation in ``state`` when possible.
+
+        Only the new user turn is sent, chained with ``previous_response_id``.
+        The full ``messages`` replay is used instead when there is no state,
+        the model changed, the chain reached ``chain_max_turns``, or OpenAI no
+        longer has the previous response. Returns the reply, the model and the
+        state to store for the next turn (``None`` without the Responses API).
+        ``deadline`` works as in ``generate_reply``; chained turns are not hedged.
+        """
+        async with asyncio.timeout(_remaining(deadline)):
+            return await self._chained_reply(messages, user_text, state)
+
+    async def _chained_reply(
+        self,
+        messages: list[dict[str, str]],
+        user_text: str | None,
+        state: dict[str, object] | None,
+    ) -> tuple[str, str, dict[str, object] | None]:
+        client = self._client()
+        if not self._uses_responses(client):
+            reply, model = await self.generate_reply(messages, user_text)
+            return reply, model, None
+        model, _ = self._choose_model(user_text, messages)
+        extra_args = self._generation_args(model)
+        if (
+            state
+            and user_text
+            and state.get("model") == model
+            and int(state.get("turns", 0)) < self.chain_max_turns
+        ):
+            try:
+                async with self._observe(model):
+                    response = await self._with_retries(
+                        model,
+                        lambda: client.responses.create(
+                            model=model,
+                            previous_response_id=state["response_id"],
+                            input=[{"role": "user", "content": user_text}],
+                            **extra_args,
+                        ),
+                    )
+                return response.output_text.strip(), model, {
+                    "response_id": response.id,
+                    "model": model,
+                    "turns": int(state.get("turns", 0)) + 1,
+                }
+            except _request_errors() as exc:
+                self._logger.info(
+                    "response_chain_expired model=%s error=%s", model, type(exc).__name__
+                )
+
+        final_messages = self._build_messages(messages, model)
+        async with self._observe(model):
+            response = await self._with_retries(
+                model,
+                lambda: client.responses.create(
+                    model=model,
+                    input=final_messages,
+                    **extra_args,
+                ),
+            )
+        return response.output_text.strip(), model, {
+            "response_id": response.id,
+            "model": model,
+            "turns": 1,
+        }
+
+    async def stream_reply(
+        self, messages: list[dict[str, str]], user_text: str | None = None
+    ) -> AsyncIterator[tuple[str, str]]:
+        client = self._client()
+        model, _ = self._choose_model(user_text, messages)
+        if self._cacheable(user_text, model):
+            # Cached lookups are answered without earlier turns, so the key
+            # covers everything sent and a repeat hits in any conversation.
+            messages = [{"role": "user", "content": user_text}]
+        final_messages = self._build_messages(messages, model)
+        extra_args = self._generation_args(model)
+        key = self._cache_key(user_text, model, final_messages, extra_args)
+        cached = self._cached_reply(key)
+        if cached is not None:
+            yield cached, model
+            return
+        # Latency here is the whole stream, not the time to the first delta.
+        async with self._observe(model):
+            parts: list[str] = []
+            # Only opening the stream is retried; once deltas have been
+            # yielded a retry would repeat them.
+            if self._uses_responses(client):
+                stream = await self._with_retries(
+                    model,
+                    lambda: client.responses.create(
+                        model=model,
+                        input=final_messages,
+                        stream=True,
+                        **extra_args,
+                    ),
+                )
+                async for event in stream:
+                    if getattr(event, "type", None) == "response.output_text.delta":
+                        parts.append(event.delta)
+                        yield event.delta, model
+                self._store_reply(key, "".join(parts).strip())
+                return
+
+            chat_args = self._chat_args(model, final_messages, stream=True)
+            stream = await self._with_retries(
+                model, lambda: client.chat.completions.create(**chat_args)
+            )
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta, model
+            self._store_reply(key, "".join(parts).strip())
 
     async def summarize_history(
         self, messages: list[dict[str, str]], existing_summary: str
+    ) -> str:
+        """Folds ``messages`` into ``existing_summary``; see ``app.services.summarizer``."""
+        summarizer = HierarchicalSummarizer(
+            self._summarize_chunk,
+            self._merge_summaries,
+            chunk_tokens=self.summary_chunk_tokens,
+            max_summary_tokens=self.summary_max_tokens,
+            max_parallel=self.summary_parallelism,
+        )
+        return await summarizer.summarize(messages, existing_summary)
+
+    def _summary_length_hint(self) -> str:
+        # About three quarters of a word per token.
+        return f"Keep it under {self.summary_max_tokens * 3 // 4} words."
+
+    async def _summarize_chunk(
+        self, messages: list[dict[str, object]], existing_summary: str
     ) -> str:
         prompt = (
             "Summarize the conversation so far for future context. "
             "Be concise and factual. Preserve user preferences, goals, and key facts. "
-            "Omit small talk and greetings."
+            "Omit small talk and greetings. "
+            + self._summary_length_hint()
         )
         summary_input = []
         if existing_summary:
@@ -106,19 +622,53 @@ class OpenAIClient:
                 {"role": "system", "content": f"Existing summary: {existing_summary}"}
             )
         summary_input.append({"role": "system", "content": prompt})
-        summary_input.extend(messages)
+        summary_input.extend(strip_token_counts(messages))
+        model = self.model
+        if (
+            self.summary_use_fast_model
+            and self.fast_model
+            and self._breakers[self.fast_model].allow()
+        ):
+            model = self.fast_model
+        return await self._summarize(model, summary_input)
+
+    async def _merge_summaries(self, existing_summary: str, partials: list[str]) -> str:
+        prompt = (
+            "Merge these summaries of consecutive parts of one conversation, "
+            "oldest first, into a single summary for future context. Later facts "
+            "override earlier ones. Preserve user preferences, goals, and key facts. "
+            + self._summary_length_hint()
+        )
+        summary_input = [{"role": "system", "content": prompt}]
+        if existing_summary:
+            summary_input.append(
+                {"role": "user", "content": f"Existing summary:\n{existing_summary}"}
+            )
+        summary_input.extend(
+            {"role": "user", "content": f"Part {index}:\n{partial}"}
+            for index, partial in enumerate(partials, start=1)
+        )
+        return await self._summarize(self.model, summary_input)
 
+    async def _summarize(self, model: str, summary_input: list[dict[str, object]]) -> str:
         client = self._client()
-        try:
-            response = await client.responses.create(
-                model=self.model,
-                input=summary_input,
+        if not self._breakers[model].allow():
+            raise CircuitOpenError(f"circuit open for {model}")
+        if self._uses_responses(client):
+            response = await self._with_retries(
+                model,
+                lambda: client.responses.create(
+                    model=model,
+                    input=summary_input,
+                ),
             )
             return response.output_text.strip()
-        except AttributeError:
-            response = await client.chat.completions.create(
-                model=self.model,
+        response = await self._with_retries(
+            model,
+            lambda: client.chat.completions.create(
+                model=model,
                 messages=summary_input,
-            )
-            content = response.choices[0].message.content or ""
-            return content.strip()
+            ),
+        )
+        content = response.choices[0].message.content or ""
+        return content.strip()
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass, field
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(text: str) -> str:
+    return _WHITESPACE.sub(" ", text).strip().casefold().rstrip("?!. ")
+
+
+def cache_key(text: str, model: str, fingerprint: str = "") -> str:
+    raw = "\x00".join((model, fingerprint, normalize_prompt(text)))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def context_fingerprint(*parts: object) -> str:
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class ResponseCache:
+    """TTL + LRU cache of model replies, optionally backed by a JSON file.
+
+    Expiry uses wall-clock time so entries loaded from ``path`` after a restart
+    keep their original deadline. The file is read once on creation and
+    rewritten atomically by ``save``.
+    """
+
+    max_entries: int = 512
+    ttl: float = 3600.0
+    path: str | None = None
+    clock: Callable[[], float] = time.time
+    hits: int = field(default=0, init=False)
+    misses: int = field(default=0, init=False)
+    evictions: int = field(default=0, init=False)
+    _entries: OrderedDict[str, tuple[float, str]] = field(
+        default_factory=OrderedDict, init=False
+    )
+
+    def __post_init__(self) -> None:
+        if self.path:
+            self._load()
+
+    def get(self, key: str) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self._entries[key] = (self.clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+        }
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        now = self.clock()
+        entries = [
+            [key, expires_at, value]
+            for key, (expires_at, value) in self._entries.items()
+            if expires_at > now
+        ]
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as fh:
+                json.dump(entries, fh, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            logger.exception("response_cache_save_failed path=%s", self.path)
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, encoding="utf-8") as fh:
+                entries = json.load(fh)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            logger.exception("response_cache_load_failed path=%s", self.path)
+            return
+        now = self.clock()
+        for key, expires_at, value in entries[-self.max_entries :]:
+            if expires_at > now:
+                self._entries[key] = (expires_at, value)
+        logger.info(
+            "response_cache_loaded path=%s entries=%s", self.path, len(self._entries)
+        )
@@ -0,0 +1,124 @@
+"""Incremental, hierarchical conversation summarization.
+
+Messages leaving the history window are split into chunks of at most
+``chunk_tokens``. A single chunk is folded into the rolling summary with one
+call, as before. Several chunks are summarized in parallel, then the partial
+summaries are merged into the rolling summary; when the partials are too many
+to merge in one request they are first merged in groups, level by level.
+Every summary is capped at ``max_summary_tokens``, so no request grows with
+the size of the backlog.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+import asyncio
+
+from app.services.tokens import count_tokens, message_tokens, trim_message, truncate_text
+
+# (messages, existing_summary) -> summary
+SummarizeChunk = Callable[[list[dict[str, object]], str], Awaitable[str]]
+# (existing_summary, partial_summaries) -> summary
+MergeSummaries = Callable[[str, list[str]], Awaitable[str]]
+
+_ELLIPSIS = "…"
+
+
+def chunk_messages(
+    messages: list[dict[str, object]], max_tokens: int
+) -> list[list[dict[str, object]]]:
+    """Splits ``messages`` in order into chunks of at most ``max_tokens``.
+
+    A message larger than a whole chunk is trimmed and gets a chunk of its own.
+    """
+    chunks: list[list[dict[str, object]]] = []
+    current: list[dict[str, object]] = []
+    used = 0
+    for message in messages:
+        tokens = message_tokens(message)
+        if tokens > max_tokens:
+            message = trim_message(message, max_tokens)
+            tokens = max_tokens
+        if current and used + tokens > max_tokens:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(message)
+        used += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def cap_summary(text: str, max_tokens: int) -> str:
+    """Cuts ``text`` to ``max_tokens``, at a sentence or word end when possible."""
+    text = text.strip()
+    if count_tokens(text) <= max_tokens:
+        return text
+    cut = truncate_text(text, max_tokens - count_tokens(_ELLIPSIS))
+    sentence_end = max(cut.rfind(". "), cut.rfind("\n"))
+    if sentence_end >= len(cut) // 2:
+        return cut[: sentence_end + 1].rstrip()
+    word_end = cut.rfind(" ")
+    if word_end >= len(cut) // 2:
+        cut = cut[:word_end]
+    return cut.rstrip() + _ELLIPSIS
+
+
+@dataclass
+class HierarchicalSummarizer:
+    summarize_chunk: SummarizeChunk
+    merge: MergeSummaries
+    chunk_tokens: int = 2000
+    max_summary_tokens: int = 400
+    max_parallel: int = 4
+
+    async def summarize(
+        self, messages: list[dict[str, object]], existing_summary: str = ""
+    ) -> str:
+        chunks = chunk_messages(messages, self.chunk_tokens)
+        if not chunks:
+            return existing_summary
+        if len(chunks) == 1:
+            summary = await self.summarize_chunk(chunks[0], existing_summary)
+            return cap_summary(summary, self.max_summary_tokens)
+
+        semaphore = asyncio.Semaphore(self.max_parallel)
+
+        async def bounded(call: Awaitable[str]) -> str:
+            async with semaphore:
+                return cap_summary(await call, self.max_summary_tokens)
+
+        partials = list(
+            await asyncio.gather(
+                *(bounded(self.summarize_chunk(chunk, "")) for chunk in chunks)
+            )
+        )
+        budget = self.chunk_tokens - count_tokens(existing_summary)
+        while len(partials) > 1 and sum(map(count_tokens, partials)) > budget:
+            groups = self._group(partials)
+            partials = list(
+                await asyncio.gather(
+                    *(bounded(self.merge("", group)) for group in groups)
+                )
+            )
+        summary = await self.merge(existing_summary, partials)
+        return cap_summary(summary, self.max_summary_tokens)
+
+    def _group(self, partials: list[str]) -> list[list[str]]:
+        # At least two per group so every level shrinks the list.
+        groups: list[list[str]] = []
+        current: list[str] = []
+        used = 0
+        for partial in partials:
+            tokens = count_tokens(partial)
+            if len(current) >= 2 and used + tokens > self.chunk_tokens:
+                groups.append(current)
+                current, used = [], 0
+            current.append(partial)
+            used += tokens
+        if len(current) == 1 and groups:
+            groups[-1].extend(current)
+        elif current:
+            groups.append(current)
+        return groups
@@ -0,0 +1,318 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from itertools import accumulate
+import asyncio
+import logging
+import re
+import time
+from typing import Any
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from app.metrics import (
+    TELEGRAM_RETRY_AFTER,
+    TELEGRAM_SEND_SECONDS,
+    TELEGRAM_SEND_WAIT_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_MAX_MESSAGE_LEN = 4096
+
+# Tags and character references are never cut in half.
+_MARKUP = re.compile(r"<(/?)([a-zA-Z][\w-]*)[^<>]*>|&#?\w+;")
+_CODE_TAGS = {"pre", "code"}
+
+# Preferred split points, best first.
+_BREAK_PARAGRAPH = 3
+_BREAK_LINE = 2
+_BREAK_SPACE = 1
+_BREAK_ANY = 0
+
+
+def _utf16_len(text: str) -> int:
+    # Telegram counts message length in UTF-16 code units.
+    return len(text) + sum(1 for char in text if ord(char) > 0xFFFF)
+
+
+def truncate_utf16(text: str, limit: int) -> str:
+    """Cuts ``text`` to at most ``limit`` UTF-16 units, never inside a character."""
+    width = 0
+    for index, char in enumerate(text):
+        width += 2 if ord(char) > 0xFFFF else 1
+        if width > limit:
+            return text[:index]
+    return text
+
+
+def _closing(stack: tuple[tuple[str, str], ...]) -> str:
+    return "".join(f"</{name}>" for name, _ in reversed(stack))
+
+
+def _opening(stack: tuple[tuple[str, str], ...]) -> str:
+    return "".join(tag for _, tag in stack)
+
+
+def _boundaries(
+    text: str, html: bool = True
+) -> tuple[list[int], list[tuple[tuple[str, str], ...]]]:
+    """Offsets where ``text`` may be cut, with the HTML tags open at each."""
+    if not html:
+        return list(range(len(text) + 1)), [()] * (len(text) + 1)
+    offsets = [0]
+    stacks: list[tuple[tuple[str, str], ...]] = [()]
+    stack: tuple[tuple[str, str], ...] = ()
+    position = 0
+    for match in _MARKUP.finditer(text):
+        for offset in range(position + 1, match.start() + 1):
+            offsets.append(offset)
+            stacks.append(stack)
+        closing, name = match.group(1), match.group(2)
+        if name is not None:
+            name = name.lower()
+            if not closing:
+                stack = (*stack, (name, match.group(0)))
+            else:
+                names = [open_name for open_name, _ in stack]
+                if name in names:
+                    stack = stack[: len(names) - 1 - names[::-1].index(name)]
+        position = match.end()
+        offsets.append(position)
+        stacks.append(stack)
+    for offset in range(position + 1, len(text) + 1):
+        offsets.append(offset)
+        stacks.append(stack)
+    return offsets, stacks
+
+
+def _break_level(text: str, end: int, stack: tuple[tuple[str, str], ...]) -> int:
+    in_code = any(name in _CODE_TAGS for name, _ in stack)
+    if not in_code and (
+        text.endswith("\n\n", 0, end) or text[end - 6 : end].lower() == "</pre>"
+    ):
+        return _BREAK_PARAGRAPH
+    previous = text[end - 1]
+    if previous == "\n":
+        return _BREAK_LINE
+    if previous.isspace():
+        return _BREAK_SPACE
+    return _BREAK_ANY
+
+
+def split_html(
+    text: str, limit: int = TELEGRAM_MAX_MESSAGE_LEN, *, html: bool = True
+) -> list[str]:
+    """Splits ``text`` into messages of at most ``limit`` UTF-16 units.
+
+    Cuts prefer paragraph breaks outside code blocks, then line breaks, then
+    spaces. Tags open at a cut are closed at the end of one part and reopened
+    at the start of the next, so each part is valid HTML on its own. With
+    ``html=False`` the text is plain and ``<``/``&`` are ordinary characters.
+    """
+    if _utf16_len(text) <= limit:
+        return [text]
+    offsets, stacks = _boundaries(text, html)
+    widths = [0, *accumulate(2 if ord(char) > 0xFFFF else 1 for char in text)]
+    parts: list[str] = []
+    index = 0
+    last = len(offsets) - 1
+    while index < last:
+        start, stack = offsets[index], stacks[index]
+        reopen = _opening(stack)
+        reopen_width = _utf16_len(reopen)
+        best: dict[int, int] = {}
+        cursor = index + 1
+        while cursor <= last:
+            end = offsets[cursor]
+            width = (
+                reopen_width
+                + widths[end]
+                - widths[start]
+                + _utf16_len(_closing(stacks[cursor]))
+            )
+            if width > limit:
+                break
+            best[_break_level(text, end, stacks[cursor])] = cursor
+            cursor += 1
+        if cursor > last:
+            cut = last
+        elif best:
+            cut = best[max(best)]
+        else:
+            cut = index + 1
+        part = reopen + text[start : offsets[cut]] + _closing(stacks[cut])
+        if (_MARKUP.sub("", part) if html else part).strip():
+            parts.append(part)
+        index = cut
+    return parts
+
+
+@dataclass
+class TokenBucket:
+    """Token bucket that hands out reservations.
+
+    ``reserve`` always takes a token and returns how long the caller must wait
+    before using it; the balance goes negative while callers are queued, so
+    concurrent senders are spaced out instead of all retrying at once.
+    """
+
+    rate: float
+    capacity: float
+    clock: Callable[[], float] = time.monotonic
+    _tokens: float = field(init=False)
+    _updated: float = field(init=False)
+
+    def __post_init__(self) -> None:
+        self._tokens = self.capacity
+        self._updated = self.clock()
+
+    @property
+    def idle(self) -> bool:
+        self._refill()
+        return self._tokens >= self.capacity
+
+    def reserve(self) -> float:
+        self._refill()
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def pause(self, seconds: float) -> None:
+        """Makes the next reservation wait at least ``seconds``."""
+        self._refill()
+        self._tokens = min(self._tokens, 1.0) - seconds * self.rate
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+
+@dataclass
+class TelegramSender:
+    """Sends replies through per-chat and global rate limits.
+
+    Every outgoing call first waits for its chat's bucket (``chat_rate`` per
+    second in private chats, ``group_rate`` in groups) and then for the
+    bot-wide bucket. ``TelegramRetryAfter`` pauses that chat's bucket for the
+    requested time and retries, up to ``max_retries`` times. Text longer than
+    Telegram's limit is sent as several messages, see ``split_html``.
+    """
+
+    chat_rate: float = 1.0
+    chat_burst: int = 3
+    group_rate: float = 20 / 60
+    global_rate: float = 30.0
+    max_retries: int = 3
+    max_chats: int = 10_000
+    clock: Callable[[], float] = time.monotonic
+    sleep: Callable[[float], Awaitable[object]] = asyncio.sleep
+    _global: TokenBucket = field(init=False)
+    _chats: OrderedDict[int, TokenBucket] = field(
+        default_factory=OrderedDict, init=False
+    )
+
+    def __post_init__(self) -> None:
+        self._global = TokenBucket(self.global_rate, self.global_rate, self.clock)
+
+    async def answer(self, message: Any, text: str, **kwargs: Any) -> Any:
+        """Replies to ``message``; returns the first message sent."""
+        first = None
+        for part in _split(text, kwargs):
+            sent = await self._call(
+                message.chat.id, "send", lambda: message.answer(part, **kwargs)
+            )
+            first = first if first is not None else sent
+        return first
+
+    async def edit(self, message: Any, placeholder: Any, text: str, **kwargs: Any) -> None:
+        """Edits ``placeholder`` to ``text``; overflow goes out as replies to ``message``."""
+        first, *rest = _split(text, kwargs)
+        await self._call(
+            message.chat.id, "edit", lambda: placeholder.edit_text(first, **kwargs)
+        )
+        for part in rest:
+            await self._call(
+                message.chat.id, "send", lambda: message.answer(part, **kwargs)
+            )
+
+    async def edit_preview(self, message: Any, placeholder: Any, text: str) -> None:
+        """Edits ``placeholder`` to plain ``text`` cut to one message; never sends more."""
+        text = truncate_utf16(text, TELEGRAM_MAX_MESSAGE_LEN)
+        await self._call(
+            message.chat.id,
+            "edit",
+            lambda: placeholder.edit_text(text, parse_mode=None),
+        )
+
+    async def _call(
+        self, chat_id: int, method: str, call: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        bucket = self._bucket(chat_id)
+        attempt = 0
+        while True:
+            await self._wait(bucket, chat_id)
+            start = self.clock()
+            try:
+                result = await call()
+            except TelegramRetryAfter as exc:
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                TELEGRAM_RETRY_AFTER.inc(method=method)
+                logger.warning(
+                    "telegram_retry_after chat_id=%s method=%s retry_after=%s attempt=%s",
+                    chat_id,
+                    method,
+                    exc.retry_after,
+                    attempt,
+                )
+                bucket.pause(exc.retry_after)
+                continue
+            finally:
+                TELEGRAM_SEND_SECONDS.observe(self.clock() - start, method=method)
+            return result
+
+    async def _wait(self, bucket: TokenBucket, chat_id: int) -> None:
+        start = self.clock()
+        # Chat first, so messages queued behind one busy chat do not hold
+        # global tokens that other chats could use.
+        chat_delay = bucket.reserve()
+        if chat_delay > 0:
+            await self.sleep(chat_delay)
+        global_delay = self._global.reserve()
+        if global_delay > 0:
+            await self.sleep(global_delay)
+        if chat_delay > 0 or global_delay > 0:
+            waited = self.clock() - start
+            TELEGRAM_SEND_WAIT_SECONDS.observe(waited)
+            logger.info(
+                "telegram_send_throttled chat_id=%s waited_ms=%s",
+                chat_id,
+                int(waited * 1000),
+            )
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is not None:
+            self._chats.move_to_end(chat_id)
+            return bucket
+        if len(self._chats) >= self.max_chats:
+            oldest = next(iter(self._chats))
+            if self._chats[oldest].idle:
+                del self._chats[oldest]
+        # Group and channel ids are negative.
+        rate = self.group_rate if chat_id < 0 else self.chat_rate
+        bucket = TokenBucket(rate, self.chat_burst, self.clock)
+        self._chats[chat_id] = bucket
+        return bucket
+
+
+def _split(text: str, kwargs: dict[str, Any]) -> list[str]:
+    # An explicit ``parse_mode=None`` sends plain text; otherwise the bot's
+    # default (HTML) applies and markup must survive the split.
+    return split_html(text, html=kwargs.get("parse_mode", "HTML") is not None)
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+# Roughly four UTF-8 bytes per token for English, about two characters for
+# Cyrillic; close enough for budgeting without shipping a tokenizer.
+_BYTES_PER_TOKEN = 4
+_TRIM_MARKER = " […]"
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    return (len(text.encode("utf-8")) + _BYTES_PER_TOKEN - 1) // _BYTES_PER_TOKEN
+
+
+def message_tokens(message: dict[str, object]) -> int:
+    tokens = message.get("tokens")
+    if isinstance(tokens, int):
+        return tokens
+    return count_tokens(str(message.get("content") or ""))
+
+
+def truncate_text(text: str, max_tokens: int) -> str:
+    """Returns the longest prefix of ``text`` that fits ``max_tokens``."""
+    limit = max(max_tokens, 0) * _BYTES_PER_TOKEN
+    return text.encode("utf-8")[:limit].decode("utf-8", errors="ignore")
+
+
+def trim_message(message: dict[str, object], max_tokens: int) -> dict[str, object]:
+    content = str(message.get("content") or "")
+    limit = max(max_tokens * _BYTES_PER_TOKEN - len(_TRIM_MARKER.encode("utf-8")), 0)
+    trimmed = content.encode("utf-8")[:limit].decode("utf-8", errors="ignore")
+    return {**message, "content": trimmed + _TRIM_MARKER, "tokens": max_tokens}
+
+
+def window_by_tokens(
+    messages: list[dict[str, object]],
+    budget: int | None,
+    max_message_tokens: int | None = None,
+    *,
+    keep_latest: bool = False,
+) -> list[dict[str, object]]:
+    """Keeps the newest messages that fit ``budget``, oldest first.
+
+    A leading system summary is always kept and counts against the budget.
+    Messages longer than ``max_message_tokens`` are trimmed. With
+    ``keep_latest`` the newest message is kept whole even if it alone
+    exceeds the budget.
+    """
+    if budget is None:
+        return messages
+    head: list[dict[str, object]] = []
+    body = messages
+    if messages and messages[0].get("role") == "system":
+        head, body = messages[:1], messages[1:]
+    remaining = budget - sum(message_tokens(msg) for msg in head)
+    selected: list[dict[str, object]] = []
+    for index, message in enumerate(reversed(body)):
+        tokens = message_tokens(message)
+        latest = keep_latest and index == 0
+        if not latest and max_message_tokens is not None and tokens > max_message_tokens:
+            message = trim_message(message, max_message_tokens)
+            tokens = max_message_tokens
+        if tokens > remaining and not latest:
+            break
+        selected.append(message)
+        remaining -= tokens
+    selected.reverse()
+    return head + selected
+
+
+def strip_token_counts(messages: list[dict[str, object]]) -> list[dict[str, object]]:
+    return [
+        {key: value for key, value in message.items() if key != "tokens"}
+        for message in messages
+    ]
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+import asyncio
+import logging
+
+from app.metrics import WRITE_BEHIND_DROPPED
+
+# Firestore rejects batches with more than 500 writes.
+MAX_BATCH_WRITES = 500
+
+
+@dataclass
+class WriteBehindStore:
+    """Queues appended messages and persists them in batches off the hot path.
+
+    Reads for a user with queued messages flush the queue first, so the next
+    ``get_recent_history`` always sees that user's own writes. After a failed
+    commit the flusher backs off exponentially from ``retry_backoff`` up to
+    ``max_retry_backoff`` seconds; while the store is down at most
+    ``max_pending`` messages are kept and the oldest are dropped first.
+    """
+
+    store: object
+    max_batch: int = 100
+    flush_interval: float = 0.25
+    max_pending: int = 10_000
+    retry_backoff: float = 0.5
+    max_retry_backoff: float = 30.0
+    _logger: logging.Logger = logging.getLogger(__name__)
+    _pending: list[tuple[int, str, str]] = field(default_factory=list, init=False)
+    _inflight: list[tuple[int, str, str]] = field(default_factory=list, init=False)
+    _flush_lock: asyncio.Lock = field(default_factory=asyncio.Lock, init=False)
+    _wakeup: asyncio.Event = field(default_factory=asyncio.Event, init=False)
+    _full: asyncio.Event = field(default_factory=asyncio.Event, init=False)
+    _task: asyncio.Task | None = field(default=None, init=False)
+    _closing: asyncio.Event = field(default_factory=asyncio.Event, init=False)
+    _failures: int = field(default=0, init=False)
+
+    async def append_message(self, user_id: int, role: str, content: str) -> None:
+        self._pending.append((user_id, role, content))
+        self._trim()
+        self._ensure_flusher()
+        self._wakeup.set()
+        if len(self._pending) >= self.max_batch:
+            self._full.set()
+
+    async def get_recent_history(
+        self,
+        user_id: int,
+        max_messages: int,
+        token_budget: int | None = None,
+        max_message_tokens: int | None = None,
+    ) -> list[dict[str, object]]:
+        if self._has_pending(user_id):
+            await self.flush()
+        return await self.store.get_recent_history(
+            user_id,
+            max_messages=max_messages,
+            token_budget=token_budget,
+            max_message_tokens=max_message_tokens,
+        )
+
+    async def compact(self, user_id: int, **kwargs) -> bool:
+        if self._has_pending(user_id):
+            await self.flush()
+        return await self.store.compact(user_id, **kwargs)
+
+    async def get_response_state(self, user_id: int) -> dict[str, object] | None:
+        return await self.store.get_response_state(user_id)
+
+    async def set_response_state(self, user_id: int, state: dict[str, object]) -> None:
+        await self.store.set_response_state(user_id, state)
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            while self._pending:
+                batch_size = min(self.max_batch, MAX_BATCH_WRITES)
+                self._inflight = self._pending[:batch_size]
+                del self._pending[:batch_size]
+                try:
+                    await self.store.append_messages(self._inflight)
+                except Exception:
+                    self._failures += 1
+                    self._logger.exception(
+                        "write_behind_flush_failed batch_size=%s failures=%s",
+                        len(self._inflight),
+                        self._failures,
+                    )
+                    self._pending[:0] = self._inflight
+                    self._trim()
+                    return
+                finally:
+                    flushed = len(self._inflight)
+                    self._inflight = []
+                self._failures = 0
+                self._logger.info("write_behind_flushed batch_size=%s", flushed)
+
+    async def warm_up(self) -> None:
+        warm_up = getattr(self.store, "warm_up", None)
+        if warm_up is not None:
+            await warm_up()
+
+    async def close(self) -> None:
+        # Cancelling the flusher mid-commit would drop the in-flight batch, so
+        # ask it to stop after its current flush and wait for it.
+        self._closing.set()
+        if self._task is not None:
+            self._full.set()
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        close = getattr(self.store, "close", None)
+        if close is not None:
+            await close()
+
+    def _has_pending(self, user_id: int) -> bool:
+        return any(
+            entry[0] == user_id for entry in (*self._inflight, *self._pending)
+        )
+
+    def _trim(self) -> None:
+        overflow = len(self._pending) - self.max_pending
+        if overflow <= 0:
+            return
+        del self._pending[:overflow]
+        WRITE_BEHIND_DROPPED.inc(overflow)
+        self._logger.warning(
+            "write_behind_dropped count=%s max_pending=%s", overflow, self.max_pending
+        )
+
+    def _retry_delay(self) -> float:
+        return min(
+            self.retry_backoff * 2 ** (self._failures - 1), self.max_retry_backoff
+        )
+
+    def _ensure_flusher(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            if len(self._pending) < self.max_batch:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            self._full.clear()
+            await self.flush()
+            if self._closing.is_set():
+                return
+            if self._failures:
+                # Retrying a down store right away only spins and floods the
+                # log; close() interrupts the wait and flushes once more.
+                try:
+                    await asyncio.wait_for(self._closing.wait(), self._retry_delay())
+                except asyncio.TimeoutError:
+                    pass
+                else:
+                    return
+            if self._pending:
+                self._wakeup.set()
@@ -0,0 +1,146 @@
+"""Micro-benchmark: bounded arithmetic evaluator vs. the previous ast evaluator.
+
+``legacy_eval`` is the ``ast``-based ``_safe_eval_arithmetic`` that used to
+live in ``app/handlers.py``, kept here verbatim as the baseline. Each case
+is timed for both evaluators; exceptions are recorded instead of raised so
+pathological inputs show up as outcomes.
+
+Usage::
+
+    python -m bench.arith_eval --repeat 200 --output arith_result.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import ast
+import json
+import sys
+import time
+
+from app.arithmetic import evaluate, format_fraction
+
+_LEGACY_ALLOWED = set("0123456789+-*/(). \t\r\n")
+
+CASES: dict[str, str] = {
+    "simple": "2+2",
+    "precedence": "(1+2)*3-4/5",
+    "decimals": "0.1+0.2",
+    "long_chain": "+".join(["12345"] * 40),
+    "nested_200": "(" * 200 + "1" + ")" * 200,
+    "chain_5000": "+".join(["1"] * 5000),
+    "huge_product": "*".join(["9" * 2000] * 20),
+    "div_by_zero": "1/(2-2)",
+}
+
+
+def legacy_eval(text: str) -> str | None:
+    stripped = text.strip()
+    if not stripped:
+        return None
+    if stripped.endswith("="):
+        stripped = stripped[:-1].strip()
+        if not stripped:
+            return None
+    if any(ch not in _LEGACY_ALLOWED for ch in stripped):
+        return None
+    try:
+        node = ast.parse(stripped, mode="eval")
+    except SyntaxError:
+        return None
+
+    def _eval(n):
+        if isinstance(n, ast.Expression):
+            return _eval(n.body)
+        if isinstance(n, ast.BinOp) and isinstance(
+            n.op, (ast.Add, ast.Sub, ast.Mult, ast.Div)
+        ):
+            left = _eval(n.left)
+            right = _eval(n.right)
+            if left is None or right is None:
+                return None
+            if isinstance(n.op, ast.Add):
+                return left + right
+            if isinstance(n.op, ast.Sub):
+                return left - right
+            if isinstance(n.op, ast.Mult):
+                return left * right
+            if isinstance(n.op, ast.Div):
+                return left / right
+        if isinstance(n, ast.UnaryOp) and isinstance(n.op, (ast.UAdd, ast.USub)):
+            value = _eval(n.operand)
+            if value is None:
+                return None
+            return value if isinstance(n.op, ast.UAdd) else -value
+        if isinstance(n, ast.Constant) and isinstance(n.value, (int, float)):
+            return n.value
+        return None
+
+    result = _eval(node)
+    if result is None:
+        return None
+    if isinstance(result, float) and result.is_integer():
+        return str(int(result))
+    return str(result)
+
+
+def bounded_eval(text: str) -> str | None:
+    result = evaluate(text)
+    return None if result is None else format_fraction(result)
+
+
+def _outcome(fn, text: str) -> str:
+    try:
+        result = fn(text)
+    except Exception as exc:  # noqa: BLE001 - outcomes are reported, not raised
+        return f"error:{type(exc).__name__}"
+    if result is None:
+        return "rejected"
+    return result if len(result) <= 40 else f"{result[:37]}..."
+
+
+def _time(fn, text: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            fn(text)
+        except Exception:  # noqa: BLE001
+            pass
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_benchmark(repeat: int = 50, cases: dict[str, str] | None = None) -> dict:
+    results = {}
+    for name, text in (cases or CASES).items():
+        results[name] = {
+            "input_chars": len(text),
+            "legacy": {
+                "best_us": round(_time(legacy_eval, text, repeat) * 1e6, 2),
+                "outcome": _outcome(legacy_eval, text),
+            },
+            "bounded": {
+                "best_us": round(_time(bounded_eval, text, repeat) * 1e6, 2),
+                "outcome": _outcome(bounded_eval, text),
+            },
+        }
+    return {"repeat": repeat, "cases": results}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--output", help="write the JSON result to this path")
+    args = parser.parse_args(argv)
+
+    rendered = json.dumps(run_benchmark(args.repeat), indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(rendered + "\n")
+    print(rendered)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,375 @@
+"""End-to-end load test for the webhook app with local stand-ins.
+
+Builds the real aiohttp app from ``app.main.create_app`` and replaces the
+Telegram Bot API, OpenAI and the storage backend with in-process fakes that
+sleep for a configurable latency. Synthetic webhook updates are posted to the
+``SimpleRequestHandler`` route at a fixed concurrency, and per-stage latency
+percentiles plus throughput are written as JSON.
+
+Usage::
+
+    python -m bench.load_test --updates 500 --concurrency 32 \\
+        --output bench_result.json --baseline bench_baseline.json
+"""
+
+from __future__ import annotations
+
+from collections import defaultdict
+from collections.abc import Callable
+from dataclasses import dataclass, field
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import math
+import os
+import sys
+import time
+
+from aiohttp import ClientSession
+from aiohttp.test_utils import TestServer
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import GetMe, TelegramMethod
+from aiogram.types import Message, User
+
+BENCH_ADMIN_ID = 100013433
+BENCH_TOKEN = "123456:BENCH-TOKEN"
+STAGES = ("access_check", "history_fetch", "model_call", "send", "persist")
+
+
+@dataclass
+class StageRecorder:
+    samples: dict[str, list[float]] = field(default_factory=lambda: defaultdict(list))
+
+    def record(self, stage: str, seconds: float) -> None:
+        self.samples[stage].append(seconds)
+
+    def wrap_async(self, stage: str, fn: Callable) -> Callable:
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+
+        return timed
+
+    def wrap_sync(self, stage: str, fn: Callable) -> Callable:
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+
+        return timed
+
+
+class FakeTelegramSession(BaseSession):
+    """Answers Bot API calls locally after ``latency`` seconds."""
+
+    def __init__(self, latency: float, recorder: StageRecorder) -> None:
+        super().__init__()
+        self.latency = latency
+        self.recorder = recorder
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot, method: TelegramMethod, timeout=None):
+        start = time.perf_counter()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if isinstance(method, GetMe):
+            return User(id=1, is_bot=True, first_name="Odin", username="odin_bench_bot")
+        returning = getattr(method, "__returning__", None)
+        if returning is Message or "Message" in str(returning):
+            self.recorder.record("send", time.perf_counter() - start)
+            chat_id = getattr(method, "chat_id", None) or 0
+            return Message.model_validate(
+                {
+                    "message_id": next(self._message_ids),
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "text": getattr(method, "text", None),
+                },
+                context={"bot": bot},
+            )
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        raise NotImplementedError("file downloads are not part of the benchmark")
+
+    async def close(self) -> None:
+        return
+
+
+@dataclass
+class FakeOpenAIClient:
+    latency: float
+    model: str = "bench-model"
+
+    async def generate_reply(self, messages, user_text=None, *, deadline=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return "Benchmark reply.", self.model
+
+    async def summarize_history(self, messages, existing_summary):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return "Benchmark summary."
+
+
+def make_fake_store(latency: float):
+    from app.services.memory_store import MemoryStore
+
+    class LatencyStore(MemoryStore):
+        async def append_messages(self, entries):
+            if latency:
+                await asyncio.sleep(latency)
+            await super().append_messages(entries)
+
+        async def get_recent_history(self, user_id, max_messages, **kwargs):
+            if latency:
+                await asyncio.sleep(latency)
+            return await super().get_recent_history(user_id, max_messages, **kwargs)
+
+    return LatencyStore()
+
+
+def make_update(update_id: int, chat_id: int, text: str) -> dict[str, object]:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": BENCH_ADMIN_ID, "is_bot": False, "first_name": "Admin"},
+            "text": text,
+        },
+    }
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(math.ceil(pct / 100 * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+def summarize(samples: list[float]) -> dict[str, float]:
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+    }
+
+
+def _set_bench_env(telegram_rate: float) -> None:
+    # Telegram's production send limits (1/s per chat) would dominate the
+    # latencies, so the bench runs them at ``telegram_rate`` instead.
+    os.environ.update(
+        {
+            "BOT_TOKEN": BENCH_TOKEN,
+            "OPENAI_API_KEY": "bench",
+            "ADMIN_ID": str(BENCH_ADMIN_ID),
+            "FIRESTORE_DISABLED": "1",
+            "TELEGRAM_CHAT_RATE": str(telegram_rate),
+            "TELEGRAM_CHAT_BURST": str(max(int(telegram_rate), 1)),
+            "TELEGRAM_GROUP_RATE_PER_MINUTE": str(telegram_rate * 60),
+            "TELEGRAM_GLOBAL_RATE": str(telegram_rate),
+        }
+    )
+    os.environ.pop("WEBHOOK_BASE", None)
+
+
+async def run_benchmark(
+    *,
+    updates: int = 200,
+    concurrency: int = 16,
+    chats: int = 8,
+    arith_ratio: float = 0.2,
+    telegram_latency: float = 0.02,
+    openai_latency: float = 0.2,
+    store_latency: float = 0.01,
+    telegram_rate: float = 10_000.0,
+) -> dict[str, object]:
+    import app.handlers as handlers
+    from app.main import create_app
+
+    _set_bench_env(telegram_rate)
+    recorder = StageRecorder()
+    openai_client = FakeOpenAIClient(latency=openai_latency)
+    openai_client.generate_reply = recorder.wrap_async(
+        "model_call", openai_client.generate_reply
+    )
+    app = create_app(
+        session=FakeTelegramSession(telegram_latency, recorder),
+        openai_client=openai_client,
+        firestore_client=make_fake_store(store_latency),
+    )
+    logging.getLogger().setLevel(logging.WARNING)
+    completions: dict[int, asyncio.Future[None]] = {}
+    dispatcher = app["dispatcher"]
+    feed_update = dispatcher.feed_update
+
+    async def tracked_feed_update(bot, update, **kwargs):
+        try:
+            return await feed_update(bot, update, **kwargs)
+        finally:
+            waiter = completions.get(update.update_id)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(None)
+
+    dispatcher.feed_update = tracked_feed_update
+    store = app["firestore_client"]
+    store.get_recent_history = recorder.wrap_async(
+        "history_fetch", store.get_recent_history
+    )
+    store.append_message = recorder.wrap_async("persist", store.append_message)
+
+    original_should_respond = handlers.should_respond
+    handlers.should_respond = recorder.wrap_sync("access_check", original_should_respond)
+    webhook_path = os.environ.get("WEBHOOK_PATH", "/webhook")
+    arith_every = round(1 / arith_ratio) if arith_ratio > 0 else 0
+    end_to_end: list[float] = []
+    webhook_ack: list[float] = []
+    errors = 0
+    try:
+        async with TestServer(app) as server, ClientSession() as http:
+            url = str(server.make_url(webhook_path))
+            queue: asyncio.Queue[int] = asyncio.Queue()
+            for update_id in range(1, updates + 1):
+                queue.put_nowait(update_id)
+
+            async def worker() -> None:
+                nonlocal errors
+                while True:
+                    try:
+                        update_id = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    is_arith = arith_every and update_id % arith_every == 0
+                    text = f"{update_id}+1" if is_arith else f"Tell me about {update_id}"
+                    payload = make_update(update_id, 1000 + update_id % chats, text)
+                    done = asyncio.get_running_loop().create_future()
+                    completions[update_id] = done
+                    start = time.perf_counter()
+                    async with http.post(url, json=payload) as response:
+                        await response.read()
+                        if response.status != 200:
+                            errors += 1
+                            completions.pop(update_id, None)
+                            continue
+                    webhook_ack.append(time.perf_counter() - start)
+                    # The webhook may acknowledge before the update is processed,
+                    # so end-to-end latency waits for the dispatcher to finish.
+                    await done
+                    end_to_end.append(time.perf_counter() - start)
+                    del completions[update_id]
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+    finally:
+        handlers.should_respond = original_should_respond
+
+    return {
+        "params": {
+            "updates": updates,
+            "concurrency": concurrency,
+            "chats": chats,
+            "arith_ratio": arith_ratio,
+            "telegram_latency": telegram_latency,
+            "openai_latency": openai_latency,
+            "store_latency": store_latency,
+            "telegram_rate": telegram_rate,
+        },
+        "duration_s": round(elapsed, 3),
+        "updates_per_sec": round(updates / elapsed, 2) if elapsed else 0.0,
+        "errors": errors,
+        "webhook_ack": summarize(webhook_ack),
+        "end_to_end": summarize(end_to_end),
+        "stages": {stage: summarize(recorder.samples.get(stage, [])) for stage in STAGES},
+    }
+
+
+def compare(result: dict, baseline: dict) -> dict[str, float]:
+    """Returns percentage change vs. the baseline (positive means slower)."""
+
+    def change(current: float, previous: float) -> float:
+        if not previous:
+            return 0.0
+        return round((current - previous) / previous * 100, 2)
+
+    deltas = {
+        "end_to_end_p95": change(
+            result["end_to_end"]["p95_ms"], baseline["end_to_end"]["p95_ms"]
+        ),
+        # Throughput is inverted so that a drop reads as a positive regression.
+        "updates_per_sec": -change(result["updates_per_sec"], baseline["updates_per_sec"]),
+    }
+    for stage in STAGES:
+        deltas[f"{stage}_p95"] = change(
+            result["stages"][stage]["p95_ms"], baseline["stages"][stage]["p95_ms"]
+        )
+    return deltas
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--chats", type=int, default=8)
+    parser.add_argument("--arith-ratio", type=float, default=0.2)
+    parser.add_argument("--telegram-latency", type=float, default=0.02)
+    parser.add_argument("--openai-latency", type=float, default=0.2)
+    parser.add_argument("--store-latency", type=float, default=0.01)
+    parser.add_argument(
+        "--telegram-rate",
+        type=float,
+        default=10_000.0,
+        help="outgoing messages per second per chat and globally",
+    )
+    parser.add_argument("--output", help="write the JSON result to this path")
+    parser.add_argument("--baseline", help="compare against a previous JSON result")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=None,
+        help="exit non-zero if any compared metric regresses by more than this percent",
+    )
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(
+        run_benchmark(
+            updates=args.updates,
+            concurrency=args.concurrency,
+            chats=args.chats,
+            arith_ratio=args.arith_ratio,
+            telegram_latency=args.telegram_latency,
+            openai_latency=args.openai_latency,
+            store_latency=args.store_latency,
+            telegram_rate=args.telegram_rate,
+        )
+    )
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            result["vs_baseline_pct"] = compare(result, json.load(fh))
+        if args.max_regression is not None and any(
+            delta > args.max_regression for delta in result["vs_baseline_pct"].values()
+        ):
+            exit_code = 1
+
+    rendered = json.dumps(result, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(rendered + "\n")
+    print(rendered)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
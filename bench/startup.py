@@ -0,0 +1,120 @@
+"""Startup benchmark: import time of the app, measured with ``python -X importtime``.
+
+Runs ``import app.main`` followed by ``create_app()`` in a fresh interpreter
+with Firestore disabled, so the measurement covers every module the process
+loads before it can serve a request. Reports the total import time, the
+slowest direct imports and whether any of the lazily loaded SDKs slipped
+back in.
+
+aiogram (with pydantic and the Bot API types) is needed in every mode and
+dominates the total, which also varies a lot between machines. The budget
+therefore applies to ``overhead_ms``: the total minus aiogram's cumulative
+import time. With ``--budget-ms`` the exit status is 1 when it is exceeded.
+
+Usage::
+
+    python -m bench.startup --budget-ms 1000 --output startup_result.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+STARTUP_CODE = "import app.main; app.main.create_app()"
+# Imported only when the backend that needs them is used.
+LAZY_MODULES = ("openai", "google.cloud.firestore", "httpx")
+BASE_MODULE = "aiogram"
+DEFAULT_BUDGET_MS = 1000.0
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def _startup_env() -> dict[str, str]:
+    env = dict(os.environ)
+    env.update(
+        {
+            "BOT_TOKEN": "123456:STARTUP",
+            "OPENAI_API_KEY": "startup",
+            "ADMIN_ID": "1",
+            "FIRESTORE_DISABLED": "1",
+        }
+    )
+    env.pop("WEBHOOK_BASE", None)
+    return env
+
+
+def parse_importtime(output: str) -> dict[str, object]:
+    """Returns the total and, per module, cumulative microseconds and nesting depth."""
+    modules: dict[str, int] = {}
+    depths: dict[str, int] = {}
+    total = 0
+    for line in output.splitlines():
+        match = _LINE.match(line)
+        if match is None:
+            continue
+        cumulative, indent, name = int(match.group(2)), match.group(3), match.group(4)
+        # Top-level imports are indented by one space, each level adds two.
+        depth = (len(indent) + 1) // 2
+        modules[name] = cumulative
+        depths[name] = depth
+        if depth == 1:
+            total += cumulative
+    return {"total_us": total, "modules": modules, "depths": depths}
+
+
+def measure_startup(code: str = STARTUP_CODE, python: str = sys.executable) -> dict[str, object]:
+    completed = subprocess.run(
+        [python, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        env=_startup_env(),
+        check=True,
+    )
+    return parse_importtime(completed.stderr)
+
+
+def run_benchmark(budget_ms: float | None = None, top: int = 10) -> dict[str, object]:
+    measured = measure_startup()
+    total_ms = round(measured["total_us"] / 1000, 1)
+    base_ms = round(measured["modules"].get(BASE_MODULE, 0) / 1000, 1)
+    # Direct imports of top-level modules, e.g. what ``app.main`` pulls in.
+    second_level = [
+        (name, us) for name, us in measured["modules"].items() if measured["depths"][name] == 2
+    ]
+    slowest = sorted(second_level, key=lambda item: item[1], reverse=True)
+    result = {
+        "total_ms": total_ms,
+        "base_ms": base_ms,
+        "overhead_ms": round(total_ms - base_ms, 1),
+        "slowest_ms": {name: round(us / 1000, 1) for name, us in slowest[:top]},
+        "lazy_modules_loaded": [name for name in LAZY_MODULES if name in measured["modules"]],
+    }
+    if budget_ms is not None:
+        result["budget_ms"] = budget_ms
+        result["within_budget"] = result["overhead_ms"] <= budget_ms
+    return result
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=None)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--output", help="write the JSON result to this path")
+    args = parser.parse_args(argv)
+
+    result = run_benchmark(args.budget_ms, args.top)
+    rendered = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(rendered + "\n")
+    print(rendered)
+    return 0 if result.get("within_budget", True) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
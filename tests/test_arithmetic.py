@@ -0,0 +1,60 @@
+from fractions import Fraction
+
+import pytest
+
+from app.arithmetic import ArithmeticBudget, evaluate, format_fraction
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        ("1+2*3", 7),
+        ("(1+2)*3", 9),
+        ("10-4-3", 3),
+        ("2^3^2", 512),
+        ("2**3", 8),
+        ("-2^2", -4),
+        ("2^-2", Fraction(1, 4)),
+        ("-(3-5)", 2),
+        ("0.1+0.2", Fraction(3, 10)),
+        ("1/3*3", 1),
+        ("  7 / 2 ", Fraction(7, 2)),
+    ],
+)
+def test_evaluate_follows_precedence_and_stays_exact(text, expected):
+    assert evaluate(text) == expected
+
+
+@pytest.mark.parametrize(
+    "text",
+    ["", "1+", "(1", "1)", "2 3", "*2", "1/0", "0^-1", "(-8)^0.5", "2+x", "1..2", "007", "1+02"],
+)
+def test_evaluate_rejects_malformed_and_undefined(text):
+    assert evaluate(text) is None
+
+
+def test_evaluate_enforces_budgets():
+    budget = ArithmeticBudget(
+        max_length=50, max_depth=3, max_literal_digits=5, max_operations=4, max_result_bits=64
+    )
+
+    assert evaluate("1+" * 30 + "1", budget) is None
+    assert evaluate("((((1))))", budget) is None
+    assert evaluate("(((1)))", budget) == 1
+    assert evaluate("123456+1", budget) is None
+    assert evaluate("1+1+1+1+1+1", budget) is None
+    assert evaluate("2^64", budget) is None
+    assert evaluate("65536*65536*65536*65536*2", budget) is None
+    assert evaluate("2^62", budget) == 2**62
+
+
+def test_evaluate_rejects_pathological_defaults_quickly():
+    assert evaluate("(" * 5000 + "1" + ")" * 5000) is None
+    assert evaluate("9^9^9") is None
+    assert evaluate("*".join(["9" * 30] * 8)) == int("9" * 30) ** 8
+
+
+def test_format_fraction():
+    assert format_fraction(4) == "4"
+    assert format_fraction(Fraction(7, 2)) == "3.5"
+    assert format_fraction(Fraction(1, 3)) == "0.333333333333"
@@ -0,0 +1,89 @@
+import os
+
+import pytest
+
+from bench import arith_eval, startup
+from bench.load_test import compare, percentile, run_benchmark
+
+
+def test_percentile_uses_nearest_rank():
+    samples = [0.001 * i for i in range(1, 101)]
+    assert percentile(samples, 50) == pytest.approx(0.05)
+    assert percentile(samples, 99) == pytest.approx(0.099)
+    assert percentile([], 95) == 0.0
+
+
+@pytest.mark.asyncio
+async def test_run_benchmark_reports_all_stages(monkeypatch):
+    for key in (
+        "BOT_TOKEN",
+        "OPENAI_API_KEY",
+        "ADMIN_ID",
+        "FIRESTORE_DISABLED",
+        "WEBHOOK_BASE",
+        "TELEGRAM_CHAT_RATE",
+        "TELEGRAM_CHAT_BURST",
+        "TELEGRAM_GROUP_RATE_PER_MINUTE",
+        "TELEGRAM_GLOBAL_RATE",
+    ):
+        monkeypatch.setenv(key, "")
+
+    result = await run_benchmark(
+        updates=10,
+        concurrency=4,
+        chats=2,
+        arith_ratio=0.5,
+        telegram_latency=0,
+        openai_latency=0,
+        store_latency=0,
+    )
+
+    assert result["errors"] == 0
+    assert result["end_to_end"]["count"] == 10
+    assert result["stages"]["access_check"]["count"] == 10
+    assert result["stages"]["model_call"]["count"] == 5
+    assert result["stages"]["persist"]["count"] == 20
+    assert result["updates_per_sec"] > 0
+    assert result["params"]["telegram_rate"] == 10_000.0
+
+    deltas = compare(result, result)
+    assert set(deltas.values()) == {0.0}
+
+
+def test_arith_benchmark_reports_both_evaluators():
+    result = arith_eval.run_benchmark(
+        repeat=1, cases={"simple": "2+2", "deep": "(" * 300 + "1" + ")" * 300}
+    )
+
+    assert result["cases"]["simple"]["legacy"]["outcome"] == "4"
+    assert result["cases"]["simple"]["bounded"]["outcome"] == "4"
+    assert result["cases"]["deep"]["bounded"]["outcome"] == "rejected"
+
+
+def test_parse_importtime_sums_top_level_imports():
+    output = "\n".join(
+        [
+            "import time: self [us] | cumulative | imported package",
+            "import time:       100 |        100 | site",
+            "import time:       300 |        300 |     pydantic",
+            "import time:        50 |        350 |   aiogram",
+            "import time:        20 |        400 | app.main",
+        ]
+    )
+
+    measured = startup.parse_importtime(output)
+
+    assert measured["total_us"] == 500
+    assert measured["modules"]["aiogram"] == 350
+    assert measured["depths"] == {"site": 1, "pydantic": 3, "aiogram": 2, "app.main": 1}
+
+
+def test_startup_imports_stay_within_budget():
+    budget_ms = float(
+        os.environ.get("STARTUP_IMPORT_BUDGET_MS", startup.DEFAULT_BUDGET_MS)
+    )
+
+    result = startup.run_benchmark(budget_ms)
+
+    assert result["lazy_modules_loaded"] == []
+    assert result["within_budget"], result
@@ -0,0 +1,58 @@
+from app.metrics import CIRCUIT_STATE
+from app.services.circuit_breaker import CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("m-open", failure_threshold=3, clock=FakeClock())
+
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.allow() is True
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.allow() is False
+    assert CIRCUIT_STATE.value(model="m-open") == 2
+
+
+def test_breaker_half_opens_after_timeout_and_closes_on_success():
+    clock = FakeClock()
+    breaker = CircuitBreaker("m-reset", failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+
+    clock.now = 9.9
+    assert breaker.allow() is False
+    clock.now = 10.0
+    assert breaker.allow() is True
+    assert breaker.state == "half_open"
+    assert CIRCUIT_STATE.value(model="m-reset") == 1
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert CIRCUIT_STATE.value(model="m-reset") == 0
+
+
+def test_breaker_reopens_on_half_open_failure():
+    clock = FakeClock()
+    breaker = CircuitBreaker("m-reopen", failure_threshold=5, reset_timeout=10, clock=clock)
+    for _ in range(5):
+        breaker.record_failure()
+    clock.now = 10.0
+    assert breaker.allow() is True
+
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+    clock.now = 19.0
+    assert breaker.allow() is False
@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+
+from app.metrics import COMPACTION_QUEUE_DEPTH, COMPACTION_SECONDS, COMPACTIONS
+from app.services.compaction import CompactionScheduler
+
+
+def _job(calls, name, delay=0.0):
+    async def run():
+        calls.append(("start", name))
+        await asyncio.sleep(delay)
+        calls.append(("end", name))
+
+    return run
+
+
+@pytest.mark.asyncio
+async def test_schedule_debounces_to_latest_job_per_user():
+    scheduler = CompactionScheduler(debounce=0.05)
+    calls = []
+    debounced = COMPACTIONS.value(result="debounced")
+
+    scheduler.schedule(1, _job(calls, "first"))
+    scheduler.schedule(1, _job(calls, "second"))
+    scheduler.schedule(2, _job(calls, "other"))
+    assert scheduler.pending == 2
+    assert COMPACTION_QUEUE_DEPTH.value() == 2
+
+    await asyncio.sleep(0.1)
+
+    assert sorted(calls) == sorted(
+        [("start", "second"), ("end", "second"), ("start", "other"), ("end", "other")]
+    )
+    assert COMPACTIONS.value(result="debounced") == debounced + 1
+    assert COMPACTION_QUEUE_DEPTH.value() == 0
+    assert not scheduler._tasks
+
+
+@pytest.mark.asyncio
+async def test_job_scheduled_while_running_waits_for_it():
+    scheduler = CompactionScheduler(debounce=0)
+    calls = []
+
+    scheduler.schedule(1, _job(calls, "first", delay=0.02))
+    await asyncio.sleep(0.01)
+    scheduler.schedule(1, _job(calls, "second"))
+    await scheduler.drain()
+
+    assert calls == [
+        ("start", "first"),
+        ("end", "first"),
+        ("start", "second"),
+        ("end", "second"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_workers_are_bounded():
+    scheduler = CompactionScheduler(debounce=0, max_workers=2)
+    running = 0
+    peak = 0
+
+    async def job():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    for user_id in range(6):
+        scheduler.schedule(user_id, job)
+    await scheduler.drain()
+
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_drain_skips_debounce_and_rejects_new_jobs():
+    scheduler = CompactionScheduler(debounce=60)
+    calls = []
+    observed = COMPACTION_SECONDS.count()
+
+    scheduler.schedule(1, _job(calls, "pending"))
+    await asyncio.wait_for(scheduler.drain(), timeout=1)
+
+    assert calls == [("start", "pending"), ("end", "pending")]
+    assert COMPACTION_SECONDS.count() == observed + 1
+    assert scheduler.schedule(1, _job(calls, "late")) is False
+
+
+@pytest.mark.asyncio
+async def test_drain_timeout_cancels_running_jobs():
+    scheduler = CompactionScheduler(debounce=0)
+    calls = []
+
+    scheduler.schedule(1, _job(calls, "slow", delay=10))
+    await asyncio.sleep(0)
+    await scheduler.drain(timeout=0.01)
+
+    assert calls == [("start", "slow")]
+    assert not scheduler._tasks
+
+
+@pytest.mark.asyncio
+async def test_failed_job_is_counted():
+    scheduler = CompactionScheduler(debounce=0)
+    failed = COMPACTIONS.value(result="failed")
+
+    async def boom():
+        raise RuntimeError("boom")
+
+    scheduler.schedule(1, boom)
+    await scheduler.drain()
+
+    assert COMPACTIONS.value(result="failed") == failed + 1
+
+
+@pytest.mark.asyncio
+async def test_job_that_compacted_nothing_is_counted_as_skipped():
+    scheduler = CompactionScheduler(debounce=0)
+    ok = COMPACTIONS.value(result="ok")
+    skipped = COMPACTIONS.value(result="skipped")
+
+    async def compact(committed):
+        return committed
+
+    scheduler.schedule(1, lambda: compact(False))
+    scheduler.schedule(2, lambda: compact(True))
+    await scheduler.drain()
+
+    assert COMPACTIONS.value(result="skipped") == skipped + 1
+    assert COMPACTIONS.value(result="ok") == ok + 1
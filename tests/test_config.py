@@ -42,6 +42,11 @@ def test_load_config_defaults(monkeypatch):
     assert config.history_max_messages == 16
     assert config.summary_trigger == 20
     assert config.history_ttl_days == 7
+    assert config.compaction_debounce == 2
+    assert config.compaction_workers == 2
+    assert config.compaction_lease_seconds == 120
+    assert config.telegram_chat_rate == 1
+    assert config.telegram_group_rate == 20 / 60
 
 
 def test_load_config_disables_firestore(monkeypatch):
@@ -52,3 +57,56 @@ def test_load_config_disables_firestore(monkeypatch):
     )
     config = load_config()
     assert config.firestore_enabled is False
+
+
+def test_load_config_openai_pool_settings(monkeypatch):
+    set_required_env(
+        monkeypatch,
+        FIRESTORE_DISABLED="1",
+        OPENAI_MAX_CONNECTIONS="4",
+        OPENAI_KEEPALIVE_EXPIRY="5.5",
+    )
+    config = load_config()
+    assert config.openai_max_connections == 4
+    assert config.openai_max_keepalive_connections == 10
+    assert config.openai_keepalive_expiry == 5.5
+
+
+def test_load_config_parses_local_currency_rates(monkeypatch):
+    set_required_env(
+        monkeypatch,
+        FIRESTORE_DISABLED="1",
+        LOCAL_CURRENCY_RATES="usd=1, EUR=0.92,RUB=95",
+    )
+    config = load_config()
+
+    assert config.local_currency_rates == {"USD": 1.0, "EUR": 0.92, "RUB": 95.0}
+
+
+def test_load_config_openai_resilience_settings(monkeypatch):
+    set_required_env(
+        monkeypatch,
+        FIRESTORE_DISABLED="1",
+        OPENAI_MAX_RETRIES="0",
+        CIRCUIT_RESET_TIMEOUT="2.5",
+    )
+    config = load_config()
+
+    assert config.openai_max_retries == 0
+    assert config.circuit_failure_threshold == 5
+    assert config.circuit_reset_timeout == 2.5
+
+
+def test_load_config_polling_settings(monkeypatch):
+    set_required_env(
+        monkeypatch,
+        FIRESTORE_DISABLED="1",
+        POLLING_LIMIT="500",
+        POLLING_TIMEOUT=None,
+        KEEP_PENDING_UPDATES="yes",
+    )
+    config = load_config()
+
+    assert config.polling_limit == 100
+    assert config.polling_timeout == 30
+    assert config.drop_pending_updates is False
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from app.dispatch import ChatUpdateQueue, update_chat_id
+
+
+def test_update_chat_id_reads_common_update_shapes():
+    assert update_chat_id({"update_id": 1, "message": {"chat": {"id": 5}}}) == 5
+    assert update_chat_id({"update_id": 1, "my_chat_member": {"chat": {"id": -7}}}) == -7
+    assert (
+        update_chat_id({"update_id": 1, "callback_query": {"message": {"chat": {"id": 9}}}})
+        == 9
+    )
+    assert update_chat_id({"update_id": 1, "inline_query": {"id": "x"}}) is None
+
+
+@pytest.mark.asyncio
+async def test_chat_queue_keeps_order_within_chat_and_overlaps_chats():
+    events = []
+    release = asyncio.Event()
+
+    async def process(item):
+        chat, index = item
+        events.append(("start", chat, index))
+        if chat == "a" and index == 0:
+            await release.wait()
+        events.append(("end", chat, index))
+
+    queue = ChatUpdateQueue(process, max_concurrency=2)
+    queue.submit("a", ("a", 0))
+    queue.submit("a", ("a", 1))
+    queue.submit("b", ("b", 0))
+    await asyncio.sleep(0.01)
+
+    assert ("end", "b", 0) in events
+    assert ("start", "a", 1) not in events
+    assert queue.depth == 1
+
+    release.set()
+    await queue.drain(timeout=1)
+
+    a_events = [event for event in events if event[1] == "a"]
+    assert a_events == [("start", "a", 0), ("end", "a", 0), ("start", "a", 1), ("end", "a", 1)]
+    assert queue.depth == 0
+
+
+@pytest.mark.asyncio
+async def test_chat_queue_bounds_concurrency_and_pending():
+    running = 0
+    peak = 0
+
+    async def process(_):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    queue = ChatUpdateQueue(process, max_concurrency=2, max_pending_per_chat=2)
+    for chat in range(5):
+        assert queue.submit(chat, None)
+    assert queue.submit(0, None)
+    assert queue.submit(0, None) is False
+
+    await queue.drain(timeout=1)
+
+    assert peak == 2
+    assert queue.submit(1, None) is False
+
+
+@pytest.mark.asyncio
+async def test_chat_queue_drain_timeout_cancels_stuck_work():
+    async def process(_):
+        await asyncio.sleep(10)
+
+    queue = ChatUpdateQueue(process)
+    queue.submit(1, None)
+    queue.submit(1, None)
+    await asyncio.sleep(0)
+
+    await queue.drain(timeout=0.01)
+
+    assert queue.depth == 0
@@ -0,0 +1,419 @@
+from datetime import datetime, timedelta, timezone
+from itertools import count
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock
+import asyncio
+
+import pytest
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import firestore
+
+from app.services.firestore_client import FirestoreClient
+from app.services.lease import FirestoreLease
+from app.services.tokens import strip_token_counts
+
+
+_clock = count()
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, store, path):
+        self._store = store
+        self.path = path
+
+    def collection(self, name):
+        return FakeCollection(self._store, f"{self.path}/{name}")
+
+    async def get(self, transaction=None):
+        return FakeSnapshot(self, self._store.docs.get(self.path))
+
+    async def set(self, data):
+        self._store.docs[self.path] = _resolve(data)
+
+
+class FakeAggregation:
+    def __init__(self, query, alias):
+        self._query = query
+        self._alias = alias
+
+    async def get(self):
+        self._query._store.aggregations += 1
+        value = len(self._query._snapshots())
+        return [[SimpleNamespace(alias=self._alias, value=value)]]
+
+
+class FakeQuery:
+    def __init__(
+        self, store, path, order=None, descending=False, limit=None, after=None
+    ):
+        self._store = store
+        self._path = path
+        self._order = order
+        self._descending = descending
+        self._limit = limit
+        self._after = after
+
+    def _copy(self, **changes):
+        state = {
+            "order": self._order,
+            "descending": self._descending,
+            "limit": self._limit,
+            "after": self._after,
+        }
+        state.update(changes)
+        return FakeQuery(self._store, self._path, **state)
+
+    def order_by(self, field, direction=firestore.Query.ASCENDING):
+        return self._copy(
+            order=field, descending=direction == firestore.Query.DESCENDING
+        )
+
+    def limit(self, value):
+        return self._copy(limit=value)
+
+    def start_after(self, snapshot):
+        return self._copy(after=snapshot.to_dict()[self._order])
+
+    def count(self, alias=None):
+        return FakeAggregation(self, alias)
+
+    def _snapshots(self):
+        prefix = f"{self._path}/"
+        docs = [
+            FakeSnapshot(FakeDocument(self._store, path), data)
+            for path, data in self._store.docs.items()
+            if path.startswith(prefix) and "/" not in path[len(prefix):]
+        ]
+        if self._order:
+            docs.sort(key=lambda doc: doc.to_dict()[self._order], reverse=self._descending)
+        if self._after is not None:
+            docs = [doc for doc in docs if doc.to_dict()[self._order] > self._after]
+        if self._limit is not None:
+            docs = docs[: self._limit]
+        return docs
+
+    async def stream(self):
+        for doc in self._snapshots():
+            self._store.streamed += 1
+            yield doc
+
+
+class FakeCollection(FakeQuery):
+    def document(self, doc_id=None):
+        if doc_id is None:
+            doc_id = f"auto{next(_clock)}"
+        return FakeDocument(self._store, f"{self._path}/{doc_id}")
+
+    async def add(self, data):
+        doc = self.document()
+        await doc.set(data)
+        return None, doc
+
+
+class FakeBatch:
+    def __init__(self, store):
+        self._store = store
+        self._ops = []
+
+    def set(self, reference, data):
+        self._ops.append((reference.path, _resolve(data)))
+
+    def delete(self, reference):
+        self._ops.append((reference.path, None))
+
+    async def commit(self):
+        for path, data in self._ops:
+            if data is None:
+                self._store.docs.pop(path, None)
+            else:
+                self._store.docs[path] = data
+        self._store.commits += 1
+
+
+class FakeTransaction(FakeBatch):
+    """Enough of ``AsyncTransaction`` for ``firestore.async_transactional``."""
+
+    _read_only = False
+    _max_attempts = 5
+    _id = b"txn"
+
+    def _clean_up(self):
+        self._ops = []
+
+    async def _begin(self, retry_id=None):
+        return None
+
+    async def _commit(self):
+        for path, data in self._ops:
+            if data is None:
+                self._store.docs.pop(path, None)
+            else:
+                self._store.docs[path] = data
+        self._store.transactions += 1
+
+    async def _rollback(self):
+        self._ops = []
+
+
+class FakeAsyncClient:
+    def __init__(self):
+        self.docs = {}
+        self.commits = 0
+        self.transactions = 0
+        self.aggregations = 0
+        self.streamed = 0
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+
+def _resolve(data):
+    return {
+        key: next(_clock) if value is firestore.SERVER_TIMESTAMP else value
+        for key, value in data.items()
+    }
+
+
+def make_client(fake=None):
+    fake = fake or FakeAsyncClient()
+    client = FirestoreClient(project_id="proj")
+    client._client = lambda: fake
+    return client, fake
+
+
+@pytest.mark.asyncio
+async def test_get_recent_history_returns_summary_and_latest_messages():
+    client, _ = make_client()
+    for i in range(4):
+        await client.append_message(1, "user", f"msg{i}")
+    summary_ref = client._client().collection("conversations").document("1")
+    await summary_ref.collection("summaries").document("current").set(
+        {"content": "earlier"}
+    )
+
+    history = await client.get_recent_history(1, max_messages=2)
+
+    assert strip_token_counts(history) == [
+        {"role": "system", "content": "earlier"},
+        {"role": "user", "content": "msg2"},
+        {"role": "user", "content": "msg3"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_compact_summarizes_and_deletes_older_messages():
+    client, fake = make_client()
+    for i in range(5):
+        await client.append_message(1, "user", f"msg{i}")
+    seen = SimpleNamespace(messages=None)
+
+    async def summarize_fn(messages, existing_summary):
+        seen.messages = messages
+        return "summary"
+
+    await client.compact(
+        1,
+        max_messages=2,
+        summary_trigger=3,
+        ttl_hours=24,
+        summarize_fn=summarize_fn,
+    )
+
+    assert [msg["content"] for msg in seen.messages] == ["msg0", "msg1", "msg2"]
+    history = await client.get_recent_history(1, max_messages=10)
+    assert [msg["content"] for msg in history] == ["summary", "msg3", "msg4"]
+    assert fake.commits == 1
+
+
+@pytest.mark.asyncio
+async def test_append_messages_writes_one_ordered_batch():
+    client, fake = make_client()
+
+    await client.append_messages(
+        [(1, "user", "q"), (2, "user", "other"), (1, "assistant", "a")]
+    )
+
+    assert fake.commits == 1
+    history = await client.get_recent_history(1, max_messages=10)
+    assert strip_token_counts(history) == [
+        {"role": "user", "content": "q"},
+        {"role": "assistant", "content": "a"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_compact_skips_on_count_without_streaming_messages():
+    client, fake = make_client()
+    for i in range(3):
+        await client.append_message(1, "user", f"msg{i}")
+    summarize_fn = AsyncMock()
+
+    await client.compact(
+        1,
+        max_messages=2,
+        summary_trigger=3,
+        ttl_hours=24,
+        summarize_fn=summarize_fn,
+    )
+
+    summarize_fn.assert_not_awaited()
+    assert fake.aggregations == 1
+    assert fake.streamed == 0
+
+
+@pytest.mark.asyncio
+async def test_compact_pages_overflow_and_deletes_in_chunked_batches():
+    client, fake = make_client()
+    client.compact_page_size = 200
+    await client.append_messages([(1, "user", f"msg{i}") for i in range(1203)])
+    fake.commits = 0
+    summarize_fn = AsyncMock(return_value="summary")
+
+    await client.compact(
+        1,
+        max_messages=3,
+        summary_trigger=20,
+        ttl_hours=24,
+        summarize_fn=summarize_fn,
+    )
+
+    older = summarize_fn.await_args.args[0]
+    assert len(older) == 1200
+    assert older[0]["content"] == "msg0"
+    assert older[-1]["content"] == "msg1199"
+    assert fake.streamed == 1200
+    assert fake.commits == 3
+    history = await client.get_recent_history(1, max_messages=10)
+    assert [msg["content"] for msg in history] == [
+        "summary",
+        "msg1200",
+        "msg1201",
+        "msg1202",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_response_state_round_trips_and_expires():
+    client, fake = make_client()
+    assert await client.get_response_state(1) is None
+
+    await client.set_response_state(1, {"response_id": "resp_1", "model": "m", "turns": 2})
+
+    assert await client.get_response_state(1) == {
+        "response_id": "resp_1",
+        "model": "m",
+        "turns": 2,
+    }
+    fake.docs["conversations/1/state/response"]["expires_at"] = datetime.now(
+        timezone.utc
+    ) - timedelta(seconds=1)
+    assert await client.get_response_state(1) is None
+
+
+@pytest.mark.asyncio
+async def test_compact_runs_once_when_instances_race_for_the_lease():
+    first, fake = make_client()
+    second, _ = make_client(fake)
+    for i in range(5):
+        await first.append_message(1, "user", f"msg{i}")
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def slow_summarize(messages, existing_summary):
+        started.set()
+        await release.wait()
+        return "summary"
+
+    other_summarize = AsyncMock(return_value="other")
+    kwargs = {"max_messages": 2, "summary_trigger": 3, "ttl_hours": 24}
+    running = asyncio.create_task(first.compact(1, summarize_fn=slow_summarize, **kwargs))
+    await started.wait()
+    await second.compact(1, summarize_fn=other_summarize, **kwargs)
+    release.set()
+    await running
+
+    other_summarize.assert_not_awaited()
+    assert "conversations/1/state/compaction_lease" not in fake.docs
+    history = await first.get_recent_history(1, max_messages=10)
+    assert [msg["content"] for msg in history] == ["summary", "msg3", "msg4"]
+
+
+@pytest.mark.asyncio
+async def test_compact_writes_nothing_after_losing_an_expired_lease():
+    client, fake = make_client()
+    rival, _ = make_client(fake)
+    for i in range(5):
+        await client.append_message(1, "user", f"msg{i}")
+    lease_path = "conversations/1/state/compaction_lease"
+
+    async def summarize_past_expiry(messages, existing_summary):
+        # The lease expires mid-summary and another instance claims it.
+        fake.docs[lease_path]["expires_at"] = datetime.now(timezone.utc)
+        fake.docs[lease_path]["owner"] = rival.instance_id
+        return "late summary"
+
+    committed = await client.compact(
+        1,
+        max_messages=2,
+        summary_trigger=3,
+        ttl_hours=24,
+        summarize_fn=summarize_past_expiry,
+    )
+
+    assert committed is False
+    assert "conversations/1/summaries/current" not in fake.docs
+    assert fake.docs[lease_path]["owner"] == rival.instance_id
+    history = await client.get_recent_history(1, max_messages=10)
+    assert len(history) == 5
+
+
+@pytest.mark.asyncio
+async def test_lease_is_exclusive_until_it_expires():
+    fake = FakeAsyncClient()
+    ref = fake.collection("locks").document("user")
+    holder = FirestoreLease(fake, ref, owner="a", ttl=60)
+    rival = FirestoreLease(fake, ref, owner="b", ttl=60)
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    assert await holder.acquire(now) is True
+    assert await rival.acquire(now + timedelta(seconds=30)) is False
+    assert await holder.renew(now + timedelta(seconds=30)) is True
+    assert await rival.acquire(now + timedelta(seconds=89)) is False
+    assert await rival.acquire(now + timedelta(seconds=91)) is True
+    assert await holder.renew(now + timedelta(seconds=91)) is False
+
+    await holder.release()
+    assert fake.docs["locks/user"]["owner"] == "b"
+    await rival.release()
+    assert "locks/user" not in fake.docs
+
+
+@pytest.mark.asyncio
+async def test_close_closes_the_grpc_transport(monkeypatch):
+    client = FirestoreClient(project_id="proj")
+    db = firestore.AsyncClient(project="proj", credentials=AnonymousCredentials())
+    client._db = db
+    transport = db._firestore_api.transport
+    close = Mock(wraps=transport.close)
+    monkeypatch.setattr(transport, "close", close)
+
+    await client.close()
+
+    close.assert_called_once()
+    assert client._db is None
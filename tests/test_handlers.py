@@ -1,11 +1,13 @@
 from types import SimpleNamespace
-from unittest.mock import AsyncMock, Mock
-import asyncio
+from unittest.mock import AsyncMock
 
 import pytest
 from aiogram.enums import ChatMemberStatus
 
 from app.handlers import AppContext, handle_message, handle_my_chat_member
+from app.metrics import LOCAL_ANSWER_HITS, OPENAI_FAILURES, REQUESTS_IN_FLIGHT, STAGE_SECONDS
+from app.services.compaction import CompactionScheduler
+from app.services.telegram_sender import TelegramSender
 
 
 @pytest.mark.asyncio
@@ -20,8 +22,8 @@ async def test_handle_message_uses_openai_and_firestore():
     )
     openai_client = SimpleNamespace(generate_reply=AsyncMock(return_value=("Hi there", "fast")))
     firestore_client = SimpleNamespace(
-        get_recent_history=lambda *_ , **__: [],
-        append_message=Mock(),
+        get_recent_history=AsyncMock(return_value=[]),
+        append_message=AsyncMock(),
     )
     context = AppContext(
         admin_id=100013433,
@@ -33,10 +35,12 @@ async def test_handle_message_uses_openai_and_firestore():
         history_ttl_days=7,
     )
 
+    model_calls_before = STAGE_SECONDS.count(stage="model_call")
     await handle_message(message, context)
 
+    assert STAGE_SECONDS.count(stage="model_call") == model_calls_before + 1
     openai_client.generate_reply.assert_awaited_once()
-    firestore_client.append_message.assert_called()
+    firestore_client.append_message.assert_awaited()
     assert message.answer.await_count == 2
     message.answer.assert_any_await("Подумаю и отвечу…")
     message.answer.assert_any_await("Hi there\n\n— model: fast")
@@ -78,8 +82,8 @@ async def test_handle_message_openai_error_sends_fallback():
     )
     openai_client = SimpleNamespace(generate_reply=AsyncMock(side_effect=Exception("boom")))
     firestore_client = SimpleNamespace(
-        get_recent_history=lambda *_ , **__: [],
-        append_message=Mock(),
+        get_recent_history=AsyncMock(return_value=[]),
+        append_message=AsyncMock(),
     )
     context = AppContext(
         admin_id=100013433,
@@ -91,24 +95,19 @@ async def test_handle_message_openai_error_sends_fallback():
         history_ttl_days=7,
     )
 
+    failures_before = OPENAI_FAILURES.value()
     await handle_message(message, context)
 
+    assert OPENAI_FAILURES.value() == failures_before + 1
+    assert REQUESTS_IN_FLIGHT.value() == 0
     assert message.answer.await_count == 2
     message.answer.assert_any_await("Подумаю и отвечу…")
     message.answer.assert_any_await("Temporary error talking to OpenAI. Please try again.")
-    firestore_client.append_message.assert_not_called()
+    firestore_client.append_message.assert_not_awaited()
 
 
 @pytest.mark.asyncio
-async def test_handle_message_compacts_when_available(monkeypatch):
-    tasks = []
-    original_create_task = asyncio.create_task
-
-    def fake_create_task(coro):
-        task = original_create_task(coro)
-        tasks.append(task)
-        return task
-
+async def test_handle_message_compacts_when_available():
     message = SimpleNamespace(
         from_user=SimpleNamespace(id=100013433, username="admin"),
         chat=SimpleNamespace(id=1, type="private"),
@@ -122,8 +121,8 @@ async def test_handle_message_compacts_when_available(monkeypatch):
         summarize_history=AsyncMock(return_value="Summary"),
     )
     firestore_client = SimpleNamespace(
-        get_recent_history=lambda *_ , **__: [],
-        append_message=Mock(),
+        get_recent_history=AsyncMock(return_value=[]),
+        append_message=AsyncMock(),
         compact=AsyncMock(),
     )
     context = AppContext(
@@ -134,13 +133,15 @@ async def test_handle_message_compacts_when_available(monkeypatch):
         history_max_messages=16,
         summary_trigger=20,
         history_ttl_days=7,
+        compactions=CompactionScheduler(debounce=60),
+        # Two turns send four messages; keep the per-chat limit out of the way.
+        sender=TelegramSender(chat_burst=4),
     )
 
-    monkeypatch.setattr(asyncio, "create_task", fake_create_task)
     await handle_message(message, context)
-
-    for task in tasks:
-        await task
+    await handle_message(message, context)
+    firestore_client.compact.assert_not_awaited()
+    await context.compactions.drain()
 
     firestore_client.compact.assert_awaited_once()
 
@@ -157,8 +158,8 @@ async def test_handle_message_answers_locally_for_arithmetic():
     )
     openai_client = SimpleNamespace(generate_reply=AsyncMock())
     firestore_client = SimpleNamespace(
-        get_recent_history=lambda *_ , **__: [],
-        append_message=Mock(),
+        get_recent_history=AsyncMock(return_value=[]),
+        append_message=AsyncMock(),
     )
     context = AppContext(
         admin_id=100013433,
@@ -170,8 +171,10 @@ async def test_handle_message_answers_locally_for_arithmetic():
         history_ttl_days=7,
     )
 
+    hits_before = LOCAL_ANSWER_HITS.value(resolver="arith")
     await handle_message(message, context)
 
+    assert LOCAL_ANSWER_HITS.value(resolver="arith") == hits_before + 1
     message.answer.assert_awaited_once_with("4\n\n— model: local-arith")
     openai_client.generate_reply.assert_not_awaited()
 
@@ -198,3 +201,125 @@ async def test_handle_my_chat_member_ignores_non_member_status():
     await handle_my_chat_member(event, context)
 
     bot.leave_chat.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_handle_message_streams_into_placeholder():
+    placeholder = SimpleNamespace(edit_text=AsyncMock())
+    message = SimpleNamespace(
+        from_user=SimpleNamespace(id=100013433, username="admin"),
+        chat=SimpleNamespace(id=1, type="private"),
+        text="Hello",
+        caption=None,
+        reply_to_message=None,
+        answer=AsyncMock(return_value=placeholder),
+    )
+
+    async def stream_reply(messages, user_text=None):
+        for delta in ("Hi", " there"):
+            yield delta, "full"
+
+    openai_client = SimpleNamespace(
+        generate_reply=AsyncMock(),
+        stream_reply=stream_reply,
+    )
+    firestore_client = SimpleNamespace(
+        get_recent_history=AsyncMock(return_value=[]),
+        append_message=AsyncMock(),
+    )
+    context = AppContext(
+        admin_id=100013433,
+        bot_username="mybot",
+        openai_client=openai_client,
+        firestore_client=firestore_client,
+        history_max_messages=16,
+        summary_trigger=20,
+        history_ttl_days=7,
+        stream_replies=True,
+        stream_edit_interval=60.0,
+    )
+
+    await handle_message(message, context)
+
+    openai_client.generate_reply.assert_not_awaited()
+    message.answer.assert_awaited_once_with("Подумаю и отвечу…")
+    assert placeholder.edit_text.await_count == 2
+    placeholder.edit_text.assert_any_await("Hi …", parse_mode=None)
+    placeholder.edit_text.assert_awaited_with("Hi there\n\n— model: full")
+    firestore_client.append_message.assert_any_await(100013433, "assistant", "Hi there")
+
+
+@pytest.mark.asyncio
+async def test_handle_message_chains_stateful_replies():
+    message = SimpleNamespace(
+        from_user=SimpleNamespace(id=100013433, username="admin"),
+        chat=SimpleNamespace(id=1, type="private"),
+        text="Hello",
+        caption=None,
+        reply_to_message=None,
+        answer=AsyncMock(),
+    )
+    previous = {"response_id": "resp_1", "model": "fast", "turns": 1}
+    current = {"response_id": "resp_2", "model": "fast", "turns": 2}
+    openai_client = SimpleNamespace(
+        generate_reply=AsyncMock(),
+        generate_chained_reply=AsyncMock(return_value=("Hi there", "fast", current)),
+    )
+    firestore_client = SimpleNamespace(
+        get_recent_history=AsyncMock(return_value=[]),
+        get_response_state=AsyncMock(return_value=previous),
+        set_response_state=AsyncMock(),
+        append_message=AsyncMock(),
+    )
+    context = AppContext(
+        admin_id=100013433,
+        bot_username="mybot",
+        openai_client=openai_client,
+        firestore_client=firestore_client,
+        history_max_messages=16,
+        summary_trigger=20,
+        history_ttl_days=7,
+        stateful_replies=True,
+    )
+
+    await handle_message(message, context)
+
+    openai_client.generate_reply.assert_not_awaited()
+    openai_client.generate_chained_reply.assert_awaited_once_with(
+        [{"role": "user", "content": "Hello"}], "Hello", previous, deadline=None
+    )
+    firestore_client.set_response_state.assert_awaited_once_with(100013433, current)
+    message.answer.assert_any_await("Hi there\n\n— model: fast")
+
+
+@pytest.mark.asyncio
+async def test_handle_message_splits_replies_over_telegram_limit():
+    message = SimpleNamespace(
+        from_user=SimpleNamespace(id=100013433, username="admin"),
+        chat=SimpleNamespace(id=1, type="private"),
+        text="Write a lot",
+        caption=None,
+        reply_to_message=None,
+        answer=AsyncMock(),
+    )
+    long_reply = "\n\n".join(["a" * 3000, "b" * 3000])
+    openai_client = SimpleNamespace(generate_reply=AsyncMock(return_value=(long_reply, "full")))
+    firestore_client = SimpleNamespace(
+        get_recent_history=AsyncMock(return_value=[]),
+        append_message=AsyncMock(),
+    )
+    context = AppContext(
+        admin_id=100013433,
+        bot_username="mybot",
+        openai_client=openai_client,
+        firestore_client=firestore_client,
+        history_max_messages=16,
+        summary_trigger=20,
+        history_ttl_days=7,
+    )
+
+    await handle_message(message, context)
+
+    sent = [call.args[0] for call in message.answer.await_args_list]
+    assert sent == ["Подумаю и отвечу…", "a" * 3000 + "\n\n", "b" * 3000 + "\n\n— model: full"]
+    firestore_client.append_message.assert_any_await(100013433, "assistant", long_reply)
@@ -0,0 +1,116 @@
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.services.history_cache import CachedHistoryStore
+from app.services.memory_store import MemoryStore
+from app.services.tokens import strip_token_counts
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_cache(**kwargs):
+    store = MemoryStore()
+    store.get_recent_history = AsyncMock(wraps=store.get_recent_history)
+    clock = FakeClock()
+    cache = CachedHistoryStore(store, window=4, clock=clock, **kwargs)
+    return cache, store, clock
+
+
+@pytest.mark.asyncio
+async def test_cache_serves_warm_reads_and_local_appends():
+    cache, store, _ = make_cache()
+    await cache.append_message(1, "user", "a")
+
+    assert strip_token_counts(await cache.get_recent_history(1, max_messages=4)) == [
+        {"role": "user", "content": "a"}
+    ]
+    await cache.append_message(1, "assistant", "b")
+    history = await cache.get_recent_history(1, max_messages=4)
+
+    assert [msg["content"] for msg in history] == ["a", "b"]
+    assert store.get_recent_history.await_count == 1
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 0, "entries": 1}
+
+
+@pytest.mark.asyncio
+async def test_cache_rereads_after_max_age():
+    cache, store, clock = make_cache(max_age=10)
+    await cache.get_recent_history(1, max_messages=4)
+    await store.append_message(1, "user", "from another instance")
+
+    clock.now = 5
+    assert await cache.get_recent_history(1, max_messages=4) == []
+    clock.now = 11
+    history = await cache.get_recent_history(1, max_messages=4)
+
+    assert strip_token_counts(history) == [{"role": "user", "content": "from another instance"}]
+    assert cache.misses == 2
+
+
+@pytest.mark.asyncio
+async def test_cache_evicts_least_recently_used_user():
+    cache, store, _ = make_cache(max_users=2)
+    await cache.get_recent_history(1, max_messages=4)
+    await cache.get_recent_history(2, max_messages=4)
+    await cache.get_recent_history(1, max_messages=4)
+    await cache.get_recent_history(3, max_messages=4)
+
+    assert list(cache._entries) == [1, 3]
+    assert cache.evictions == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_applies_local_compaction():
+    cache, store, _ = make_cache()
+    for i in range(5):
+        await cache.append_message(1, "user", f"msg{i}")
+    await cache.get_recent_history(1, max_messages=4)
+
+    async def summarize_fn(messages, existing_summary):
+        return "summary"
+
+    await cache.compact(
+        1,
+        max_messages=2,
+        summary_trigger=3,
+        ttl_hours=24,
+        summarize_fn=summarize_fn,
+    )
+    history = await cache.get_recent_history(1, max_messages=4)
+
+    assert [msg["content"] for msg in history] == ["summary", "msg3", "msg4"]
+    assert store.get_recent_history.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_drops_summary_when_store_does_not_commit_it():
+    cache, store, _ = make_cache()
+    for i in range(5):
+        await cache.append_message(1, "user", f"msg{i}")
+    await cache.get_recent_history(1, max_messages=4)
+
+    async def compact_losing_lease(user_id, *, summarize_fn, **kwargs):
+        # Like FirestoreClient.compact after lease.renew() fails.
+        await summarize_fn([{"role": "user", "content": "msg0"}], "")
+        return False
+
+    store.compact = compact_losing_lease
+    committed = await cache.compact(
+        1,
+        max_messages=2,
+        summary_trigger=3,
+        ttl_hours=24,
+        summarize_fn=AsyncMock(return_value="summary"),
+    )
+    history = await cache.get_recent_history(1, max_messages=4)
+
+    assert committed is False
+    assert [msg["content"] for msg in history] == ["msg1", "msg2", "msg3", "msg4"]
+    assert store.get_recent_history.await_count == 2
@@ -0,0 +1,109 @@
+from datetime import date, datetime
+
+import pytest
+
+from app.local_answers import (
+    build_local_answers,
+    convert_base,
+    convert_units,
+    evaluate_arithmetic,
+    make_currency_converter,
+    make_date_calculator,
+)
+from app.metrics import LOCAL_ANSWER_HITS
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        ("2+2", "4"),
+        ("(1+2)*3", "9"),
+        ("7/2", "3.5"),
+        ("2^10", "1024"),
+        ("2**0.5", "1.41421356237"),
+        ("15% of 80", "12"),
+        ("15% от 80", "12"),
+        ("200 + 15%", "230"),
+        ("200 - 10%", "180"),
+        ("50%*4", "2"),
+    ],
+)
+def test_evaluate_arithmetic(text, expected):
+    assert evaluate_arithmetic(text) == expected
+
+
+@pytest.mark.parametrize(
+    "text", ["hello", "1/0", "2**100000", "(-8)**0.5", "import os", "2024-03-01", "007"]
+)
+def test_evaluate_arithmetic_rejects(text):
+    answers = build_local_answers()
+    assert answers.answer(text) is None
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        ("255 to hex", "0xff"),
+        ("0xff in dec", "255"),
+        ("10 в bin", "0b1010"),
+        ("0b1010 to oct", "0o12"),
+        ("255 to base64", None),
+    ],
+)
+def test_convert_base(text, expected):
+    assert convert_base(text) == expected
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        ("5 km to m", "5000 m"),
+        ("1 mi in km", "1.609344 km"),
+        ("2,5 кг в г", "2500 г"),
+        ("100 c to f", "212 f"),
+        ("0 °c in k", "273.15 k"),
+        ("5 km to kg", None),
+        ("5 apples to pears", None),
+    ],
+)
+def test_convert_units(text, expected):
+    assert convert_units(text) == expected
+
+
+def test_currency_converter_uses_rate_table_and_aliases():
+    convert = make_currency_converter({"USD": 1, "EUR": 0.9, "RUB": 90})
+
+    assert convert("100 usd to eur") == "90.00 EUR"
+    assert convert("90 евро в рублей") == "9000.00 RUB"
+    assert convert("1 gbp to usd") is None
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        ("2024-02-28 + 2 days", "2024-03-01"),
+        ("today - 1 week", "2026-10-10"),
+        ("01.01.2026 + 10 дней", "2026-01-11"),
+        ("days between 2026-01-01 and 2026-03-01", "59 days"),
+        ("дней между 01.01.2026 и сегодня", "289 days"),
+        ("days until 2026-12-31", "75 days"),
+        ("23:30 + 90 min", "01:00"),
+        ("10:00 - 2 h", "08:00"),
+        ("25:00 + 1 h", None),
+    ],
+)
+def test_date_calculator(text, expected):
+    calculate = make_date_calculator(
+        lambda: date(2026, 10, 17), lambda: datetime(2026, 10, 17, 12, 0)
+    )
+    assert calculate(text) == expected
+
+
+def test_local_answers_counts_hits_per_resolver():
+    answers = build_local_answers(currency_rates={"USD": 1, "EUR": 0.5})
+    before = LOCAL_ANSWER_HITS.value(resolver="currency")
+
+    assert answers.answer("10 USD to EUR?") == ("currency", "5.00 EUR")
+    assert answers.answer("2+2=") == ("arith", "4")
+    assert LOCAL_ANSWER_HITS.value(resolver="currency") == before + 1
+    assert answers.answer("what is the weather") is None
@@ -1,8 +1,25 @@
+from types import SimpleNamespace
 from unittest.mock import AsyncMock
+import asyncio
+import json
 
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import GetMe
+from aiogram.types import Update, User
+from aiohttp.test_utils import TestClient, TestServer
 import pytest
 
-from app.main import build_webhook_url, on_startup
+from app.handlers import router
+from app.main import (
+    build_webhook_url,
+    create_app,
+    metrics_handler,
+    on_shutdown,
+    on_startup,
+    readyz_handler,
+    warm_up,
+)
+from app.services.memory_store import MemoryStore
 
 
 def test_build_webhook_url_strips_slash():
@@ -18,3 +35,123 @@ async def test_on_startup_sets_webhook():
         "https://example.com/webhook", drop_pending_updates=True
     )
     bot.send_message.assert_awaited_once_with(123, "Odin bot запущен.")
+
+
+@pytest.mark.asyncio
+async def test_on_shutdown_closes_clients():
+    bot = AsyncMock()
+    openai_client = AsyncMock()
+    store = AsyncMock()
+    store.close.side_effect = RuntimeError("boom")
+
+    await on_shutdown(bot, openai_client, store, object())
+
+    openai_client.close.assert_awaited_once()
+    store.close.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_metrics_handler_renders_registry():
+    response = await metrics_handler(None)
+
+    assert response.content_type == "text/plain"
+    assert "# TYPE odin_stage_seconds histogram" in response.text
+
+
+@pytest.mark.asyncio
+async def test_warm_up_runs_steps_and_reports_failures():
+    ok = AsyncMock()
+    failing = AsyncMock(side_effect=RuntimeError("no network"))
+
+    assert await warm_up({"ok": ok}) is True
+    assert await warm_up({"ok": ok, "failing": failing}) is False
+    assert ok.await_count == 2
+    failing.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_readyz_reports_warming_up_until_ready():
+    ready = asyncio.Event()
+    request = SimpleNamespace(app={"ready": ready})
+
+    assert (await readyz_handler(request)).status == 503
+    ready.set()
+    assert (await readyz_handler(request)).status == 200
+
+    request.app["warm"] = asyncio.Event()
+    response = await readyz_handler(request)
+    assert response.status == 200
+    assert json.loads(response.text) == {"status": "ready", "warm": False}
+
+
+class CountingSession(BaseSession):
+    def __init__(self):
+        super().__init__()
+        self.get_me_calls = 0
+        self.release = asyncio.Event()
+
+    async def make_request(self, bot, method, timeout=None):
+        if isinstance(method, GetMe):
+            self.get_me_calls += 1
+            await self.release.wait()
+            return User(id=1, is_bot=True, first_name="Odin", username="odin_bot")
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        raise NotImplementedError
+
+    async def close(self):
+        return
+
+
+@pytest.mark.asyncio
+async def test_app_warms_up_once_before_reporting_ready(monkeypatch):
+    for key, value in {
+        "BOT_TOKEN": "123456:TEST",
+        "OPENAI_API_KEY": "key",
+        "ADMIN_ID": "1",
+        "FIRESTORE_DISABLED": "1",
+    }.items():
+        monkeypatch.setenv(key, value)
+    monkeypatch.delenv("WEBHOOK_BASE", raising=False)
+    # The handlers router is module-global; let this app attach it again.
+    monkeypatch.setattr(router, "_parent_router", None)
+    session = CountingSession()
+    openai_client = SimpleNamespace(warm_up=AsyncMock(), close=AsyncMock())
+    store = MemoryStore()
+    store.warm_up = AsyncMock()
+    app = create_app(session=session, openai_client=openai_client, firestore_client=store)
+
+    async with TestClient(TestServer(app)) as client:
+        assert (await client.get("/healthz")).status == 200
+        assert (await client.get("/readyz")).status == 503
+        dispatcher = app["dispatcher"]
+        feeds = [
+            asyncio.create_task(
+                dispatcher.feed_update(
+                    app["bot"],
+                    Update.model_validate(
+                        {
+                            "update_id": update_id,
+                            "message": {
+                                "message_id": update_id,
+                                "date": 0,
+                                "chat": {"id": 5, "type": "private"},
+                                "from": {"id": 5, "is_bot": False, "first_name": "U"},
+                                "text": "hi",
+                            },
+                        }
+                    ),
+                )
+            )
+            for update_id in (1, 2)
+        ]
+        await asyncio.sleep(0.01)
+        session.release.set()
+        await asyncio.gather(*feeds)
+        await asyncio.wait_for(app["ready"].wait(), timeout=1)
+        assert (await client.get("/readyz")).status == 200
+
+    assert session.get_me_calls == 1
+    openai_client.warm_up.assert_awaited_once()
+    store.warm_up.assert_awaited_once()
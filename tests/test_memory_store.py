@@ -1,28 +1,80 @@
-from datetime import datetime, timedelta, timezone
-
 import pytest
 
 from app.services.memory_store import MemoryStore
+from app.services.tokens import strip_token_counts
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+async def summarize_count(messages, existing_summary):
+    return f"summary:{len(messages)}:{existing_summary}"
+
+
+@pytest.mark.asyncio
+async def test_memory_store_prunes_expired_messages():
+    clock = FakeClock()
+    store = MemoryStore(ttl_hours=1, clock=clock)
+    await store.append_message(1, "user", "old")
+    clock.now += 1800
+    await store.append_message(1, "user", "new")
+    clock.now += 3601
+
+    history = await store.get_recent_history(1, max_messages=10)
+    assert strip_token_counts(history) == []
+    assert 1 not in store._messages
+    assert not store._expiry_index
+
+
+@pytest.mark.asyncio
+async def test_memory_store_expires_oldest_first():
+    clock = FakeClock()
+    store = MemoryStore(ttl_hours=1, clock=clock)
+    await store.append_message(1, "user", "old")
+    clock.now += 1800
+    await store.append_message(1, "user", "new")
+    clock.now += 2000
 
+    history = await store.get_recent_history(1, max_messages=10)
+    assert strip_token_counts(history) == [{"role": "user", "content": "new"}]
 
-def test_memory_store_prunes_expired_messages():
-    store = MemoryStore(ttl_hours=1)
-    store.append_message(1, "user", "old")
-    store._messages[1][0]["created_at"] = datetime.now(timezone.utc) - timedelta(hours=2)
 
-    history = store.get_recent_history(1, max_messages=10)
-    assert history == []
+@pytest.mark.asyncio
+async def test_memory_store_bounds_messages_per_user():
+    store = MemoryStore(max_messages_per_user=3)
+    for i in range(5):
+        await store.append_message(1, "user", f"msg{i}")
 
+    history = await store.get_recent_history(1, max_messages=10)
+    assert [msg["content"] for msg in history] == ["msg2", "msg3", "msg4"]
 
-def test_memory_store_prunes_expired_summary():
-    store = MemoryStore(ttl_hours=1)
-    store._summaries[1] = {
-        "content": "summary",
-        "expires_at": datetime.now(timezone.utc) - timedelta(hours=2),
-    }
 
-    history = store.get_recent_history(1, max_messages=10)
-    assert history == []
+@pytest.mark.asyncio
+async def test_memory_store_summary_expires_on_its_own_ttl():
+    clock = FakeClock()
+    store = MemoryStore(ttl_hours=1, clock=clock)
+    for i in range(4):
+        await store.append_message(1, "user", f"msg{i}")
+    await store.compact(
+        1,
+        max_messages=1,
+        summary_trigger=2,
+        ttl_hours=48,
+        summarize_fn=summarize_count,
+    )
+
+    clock.now += 2 * 3600
+    assert strip_token_counts(await store.get_recent_history(1, max_messages=10)) == [
+        {"role": "system", "content": "summary:3:"}
+    ]
+
+    clock.now += 47 * 3600
+    assert await store.get_recent_history(1, max_messages=10) == []
     assert 1 not in store._summaries
 
 
@@ -30,20 +82,28 @@ def test_memory_store_prunes_expired_summary():
 async def test_memory_store_compact_summarizes_and_trims():
     store = MemoryStore(ttl_hours=24)
     for i in range(5):
-        store.append_message(1, "user", f"msg{i}")
-
-    async def summarize_fn(messages, existing_summary):
-        return f"summary:{len(messages)}:{existing_summary}"
+        await store.append_message(1, "user", f"msg{i}")
 
     await store.compact(
         1,
         max_messages=2,
         summary_trigger=3,
         ttl_hours=24,
-        summarize_fn=summarize_fn,
+        summarize_fn=summarize_count,
     )
 
-    history = store.get_recent_history(1, max_messages=10)
+    history = await store.get_recent_history(1, max_messages=10)
     assert history[0]["role"] == "system"
     assert history[0]["content"].startswith("summary:")
     assert len([msg for msg in history if msg["role"] == "user"]) == 2
+
+
+@pytest.mark.asyncio
+async def test_memory_store_response_state_follows_ttl():
+    clock = FakeClock()
+    store = MemoryStore(ttl_hours=1, clock=clock)
+    await store.set_response_state(1, {"response_id": "resp_1", "model": "m", "turns": 1})
+
+    assert (await store.get_response_state(1))["response_id"] == "resp_1"
+    clock.now += 3600
+    assert await store.get_response_state(1) is None
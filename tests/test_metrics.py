@@ -0,0 +1,52 @@
+import pytest
+
+from app.metrics import MetricsRegistry
+
+
+def test_counter_and_gauge_render_with_labels():
+    registry = MetricsRegistry()
+    hits = registry.counter("hits_total", "Hits.", ("kind",))
+    in_flight = registry.gauge("in_flight", "In flight.")
+
+    hits.inc(kind="a")
+    hits.inc(2, kind='quote"d')
+    in_flight.inc()
+    in_flight.inc()
+    in_flight.dec()
+
+    assert hits.value(kind="a") == 1
+    assert registry.render() == (
+        "# HELP hits_total Hits.\n"
+        "# TYPE hits_total counter\n"
+        'hits_total{kind="a"} 1\n'
+        'hits_total{kind="quote\\"d"} 2\n'
+        "# HELP in_flight In flight.\n"
+        "# TYPE in_flight gauge\n"
+        "in_flight 1\n"
+    )
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    latency = registry.histogram("latency_seconds", "Latency.", ("stage",), buckets=(0.1, 1.0))
+
+    latency.observe(0.05, stage="send")
+    latency.observe(0.1, stage="send")
+    latency.observe(3, stage="send")
+
+    assert latency.count(stage="send") == 3
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{stage="send",le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{stage="send",le="1"} 2' in lines
+    assert 'latency_seconds_bucket{stage="send",le="+Inf"} 3' in lines
+    assert 'latency_seconds_sum{stage="send"} 3.15' in lines
+    assert 'latency_seconds_count{stage="send"} 3' in lines
+
+
+def test_registry_rejects_duplicates_and_bad_labels():
+    registry = MetricsRegistry()
+    counter = registry.counter("x_total", "X.", ("a",))
+    with pytest.raises(ValueError):
+        registry.counter("x_total", "X.")
+    with pytest.raises(ValueError):
+        counter.inc(b="1")
@@ -0,0 +1,140 @@
+import pytest
+
+from app.metrics import MODEL_ROUTES
+from app.services.model_router import ModelRouter
+
+SHORT = "курс евро"
+LONG = "x" * 200
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_router(**kwargs):
+    clock = FakeClock()
+    router = ModelRouter(model="slow", fast_model="fast", latency_slo=5.0, clock=clock, **kwargs)
+    return router, clock
+
+
+def replay(router, clock, trace):
+    """Feeds a synthetic trace and returns ``(model, reason)`` for each route step.
+
+    Steps are ``("ok", model, latency)``, ``("fail", model)``, ``("wait", seconds)``
+    and ``("route", user_text)``.
+    """
+    routed = []
+    for step in trace:
+        kind = step[0]
+        if kind == "ok":
+            router.record(step[1], step[2], ok=True)
+        elif kind == "fail":
+            router.record(step[1], None, ok=False)
+        elif kind == "wait":
+            clock.now += step[1]
+        elif kind == "route":
+            decision = router.choose(step[1], [{"role": "user", "content": step[1]}])
+            routed.append((decision.model, decision.reason))
+        else:
+            raise ValueError(kind)
+    return routed
+
+
+def test_router_keeps_text_heuristics_without_stats():
+    router, clock = make_router()
+
+    assert replay(router, clock, [("route", SHORT), ("route", LONG), ("route", "")]) == [
+        ("fast", "short_prompt"),
+        ("slow", "long_prompt"),
+        ("slow", "no_text"),
+    ]
+    assert ModelRouter(model="slow").choose(SHORT, []).reason == "single_model"
+
+
+def test_router_honours_standard_model_request_with_long_history():
+    router, _ = make_router()
+    history = [{"role": "user", "content": "hi"}] * 6
+
+    decision = router.choose("Используй стандартную модель", history)
+
+    assert (decision.model, decision.reason) == ("slow", "user_requested")
+
+
+def test_router_never_moves_long_prompts_to_fast_model_for_latency():
+    router, clock = make_router()
+    trace = [("ok", "slow", 9.0), ("ok", "fast", 1.0), ("route", LONG)]
+
+    assert replay(router, clock, trace) == [("slow", "long_prompt")]
+
+
+def test_router_latency_slo_is_off_by_default():
+    router = ModelRouter(model="slow", fast_model="fast", clock=FakeClock())
+    router.record("fast", 60.0, ok=True)
+
+    assert router.choose(SHORT, []).reason == "short_prompt"
+
+
+def test_router_ewma_recovers_below_slo():
+    router, clock = make_router(alpha=0.5)
+    trace = [("ok", "fast", 9.0), ("route", SHORT)]
+    trace += [("ok", "fast", 2.0)] * 3
+    trace += [("route", SHORT)]
+
+    assert replay(router, clock, trace) == [
+        ("slow", "short_prompt:fast_over_slo"),
+        ("fast", "short_prompt"),
+    ]
+    assert router.stats["fast"].latency_ewma == pytest.approx(2.875)
+
+
+def test_router_avoids_failing_model_until_cooldown():
+    router, clock = make_router(failure_cooldown=30.0)
+    trace = [
+        ("fail", "fast"),
+        ("route", SHORT),
+        ("fail", "fast"),
+        ("route", SHORT),
+        ("wait", 31.0),
+        ("route", SHORT),
+    ]
+
+    assert replay(router, clock, trace) == [
+        ("fast", "short_prompt"),
+        ("slow", "short_prompt:fast_unhealthy"),
+        ("fast", "short_prompt"),
+    ]
+
+
+def test_router_ignores_stale_latency():
+    router, clock = make_router(stale_after=60.0)
+    trace = [("ok", "fast", 7.0), ("route", SHORT), ("wait", 61.0), ("route", SHORT)]
+
+    assert replay(router, clock, trace) == [
+        ("slow", "short_prompt:fast_over_slo"),
+        ("fast", "short_prompt"),
+    ]
+
+
+def test_router_keeps_large_context_on_primary():
+    router, clock = make_router(fast_max_prompt_tokens=10)
+    router.record("slow", 9.0, ok=True)
+
+    decision = router.choose(SHORT, [{"role": "user", "content": "y" * 100}])
+
+    assert (decision.model, decision.reason) == ("slow", "large_context")
+    assert decision.prompt_tokens == 25
+
+
+def test_router_logs_every_decision():
+    router, clock = make_router(decision_log_size=2)
+    before = MODEL_ROUTES.value(model="fast", reason="short_prompt")
+
+    replay(router, clock, [("ok", "fast", 1.5), ("route", SHORT)] + [("route", SHORT)] * 2)
+
+    assert len(router.decisions) == 2
+    assert router.decisions[-1].latency_ewma == {"slow": None, "fast": 1.5}
+    assert MODEL_ROUTES.value(model="fast", reason="short_prompt") == before + 3
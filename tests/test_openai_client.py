@@ -1,9 +1,19 @@
 from types import SimpleNamespace
+import asyncio
+import json
+import time
 from unittest.mock import AsyncMock
 
+import httpx
+import openai
 import pytest
 
-from app.services.openai_client import OpenAIClient
+from app.metrics import HEDGES, OPENAI_RETRIES
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.openai_client import FAST_SYSTEM_PROMPT, OpenAIClient
+from app.services.response_cache import ResponseCache
+
+LONG_TEXT = "Explain this in detail: " + "x" * 200
 
 
 @pytest.mark.asyncio
@@ -96,3 +106,591 @@ async def test_generate_reply_uses_standard_model_when_requested_and_long_histor
 
     assert create.await_args.kwargs["model"] == "slow"
     assert model_used == "slow"
+
+
+@pytest.mark.asyncio
+async def test_client_is_reused_and_closed():
+    openai_client = OpenAIClient(api_key="key", max_connections=5)
+
+    first = openai_client._client()
+    assert openai_client._client() is first
+
+    await openai_client.close()
+    assert openai_client._client() is not first
+    await openai_client.close()
+
+
+@pytest.mark.asyncio
+async def test_stream_reply_yields_responses_text_deltas():
+    async def events():
+        yield SimpleNamespace(type="response.created")
+        yield SimpleNamespace(type="response.output_text.delta", delta="Hel")
+        yield SimpleNamespace(type="response.output_text.delta", delta="lo")
+        yield SimpleNamespace(type="response.completed")
+
+    create = AsyncMock(return_value=events())
+    client = SimpleNamespace(responses=SimpleNamespace(create=create))
+    openai_client = OpenAIClient(api_key="key")
+    openai_client._client = lambda: client
+
+    chunks = [
+        chunk
+        async for chunk in openai_client.stream_reply(
+            [{"role": "user", "content": "hi"}], user_text="hi"
+        )
+    ]
+
+    assert chunks == [("Hel", openai_client.model), ("lo", openai_client.model)]
+    assert create.await_args.kwargs["stream"] is True
+
+
+@pytest.mark.asyncio
+async def test_stream_reply_falls_back_to_chat_completions():
+    def chunk(content):
+        return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+    async def chunks():
+        yield chunk("He")
+        yield chunk(None)
+        yield SimpleNamespace(choices=[])
+        yield chunk("y")
+
+    create = AsyncMock(return_value=chunks())
+    client = SimpleNamespace(
+        responses=None,
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create)),
+    )
+    openai_client = OpenAIClient(api_key="key")
+    openai_client._client = lambda: client
+
+    deltas = [
+        delta
+        async for delta, _ in openai_client.stream_reply(
+            [{"role": "user", "content": "hi"}], user_text="hi"
+        )
+    ]
+
+    assert deltas == ["He", "y"]
+    assert create.await_args.kwargs["stream"] is True
+
+
+@pytest.mark.asyncio
+async def test_generate_reply_windows_history_per_model_budget():
+    create = AsyncMock(return_value=SimpleNamespace(output_text="ok"))
+    client = SimpleNamespace(responses=SimpleNamespace(create=create))
+    openai_client = OpenAIClient(
+        api_key="key",
+        model="slow",
+        fast_model="fast",
+        history_token_budget=1000,
+        fast_history_token_budget=5,
+    )
+    openai_client._client = lambda: client
+    messages = [
+        {"role": "user", "content": "x" * 40, "tokens": 10},
+        {"role": "user", "content": "ping", "tokens": 1},
+    ]
+
+    await openai_client.generate_reply(messages, user_text="ping")
+
+    sent = create.await_args.kwargs["input"]
+    assert create.await_args.kwargs["model"] == "fast"
+    assert sent[1:] == [{"role": "user", "content": "ping"}]
+
+
+@pytest.mark.asyncio
+async def test_generate_reply_serves_repeated_fast_prompt_from_cache():
+    create = AsyncMock(return_value=SimpleNamespace(output_text="1.08"))
+    client = SimpleNamespace(responses=SimpleNamespace(create=create))
+    cache = ResponseCache()
+    openai_client = OpenAIClient(
+        api_key="key", model="slow", fast_model="fast", response_cache=cache
+    )
+    openai_client._client = lambda: client
+
+    first = await openai_client.generate_reply(
+        [{"role": "user", "content": "курс евро"}], user_text="курс евро"
+    )
+    second = await openai_client.generate_reply(
+        [{"role": "user", "content": "Курс евро?"}], user_text="Курс евро?"
+    )
+    await openai_client.generate_reply(
+        [{"role": "user", "content": "курс евро без кэша"}],
+        user_text="курс евро без кэша",
+    )
+
+    assert first == second == ("1.08", "fast")
+    assert create.await_count == 2
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_response_cache_hits_for_question_repeated_in_one_conversation():
+    create = AsyncMock(return_value=SimpleNamespace(output_text="1.08"))
+    cache = ResponseCache()
+    openai_client = OpenAIClient(
+        api_key="key", model="slow", fast_model="fast", response_cache=cache
+    )
+    openai_client._client = lambda: SimpleNamespace(
+        responses=SimpleNamespace(create=create)
+    )
+    history = [{"role": "user", "content": "курс евро"}]
+
+    first = await openai_client.generate_reply(history, user_text="курс евро")
+    history += [
+        {"role": "assistant", "content": first[0]},
+        {"role": "user", "content": "курс евро"},
+    ]
+    second = await openai_client.generate_reply(history, user_text="курс евро")
+
+    assert first == second == ("1.08", "fast")
+    assert create.await_count == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cacheable_prompt_is_sent_without_earlier_turns():
+    create = AsyncMock(return_value=SimpleNamespace(output_text="Paris"))
+    openai_client = OpenAIClient(
+        api_key="key", model="slow", fast_model="fast", response_cache=ResponseCache()
+    )
+    openai_client._client = lambda: SimpleNamespace(
+        responses=SimpleNamespace(create=create)
+    )
+    history = [
+        {"role": "system", "content": "Summary: talked about Berlin."},
+        {"role": "user", "content": "Tell me about Berlin"},
+        {"role": "assistant", "content": "Berlin is a capital."},
+        {"role": "user", "content": "capital of France"},
+    ]
+
+    await openai_client.generate_reply(history, user_text="capital of France")
+
+    # The reply is cached for every conversation, so it must not depend on
+    # this one: only the fast system prompt and the question are sent.
+    sent = create.await_args.kwargs["input"]
+    assert [message["role"] for message in sent] == ["system", "user"]
+    assert sent[-1] == {"role": "user", "content": "capital of France"}
+
+
+def _not_found():
+    request = httpx.Request("POST", "https://api.openai.com/v1/responses")
+    return openai.NotFoundError(
+        "previous response not found",
+        response=httpx.Response(404, request=request),
+        body=None,
+    )
+
+
+def _response_json(response_id, text):
+    return {
+        "id": response_id,
+        "object": "response",
+        "created_at": 0,
+        "model": "slow",
+        "status": "completed",
+        "parallel_tool_calls": False,
+        "tool_choice": "auto",
+        "tools": [],
+        "output": [
+            {
+                "type": "message",
+                "id": f"msg_{response_id}",
+                "role": "assistant",
+                "status": "completed",
+                "content": [{"type": "output_text", "text": text, "annotations": []}],
+            }
+        ],
+    }
+
+
+@pytest.mark.asyncio
+async def test_generate_chained_reply_chains_through_the_installed_sdk():
+    bodies = []
+
+    def handle(request):
+        bodies.append(json.loads(request.content))
+        return httpx.Response(200, json=_response_json(f"resp_{len(bodies)}", "ok"))
+
+    openai_client = OpenAIClient(api_key="key", model="slow")
+    openai_client._async_client = openai.AsyncOpenAI(
+        api_key="key",
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(handle)),
+        max_retries=0,
+    )
+    assert openai_client.detect_capabilities() is True
+    history = [{"role": "user", "content": "long question " * 20}]
+
+    _, _, state = await openai_client.generate_chained_reply(history, history[0]["content"], None)
+    reply, _, state = await openai_client.generate_chained_reply(
+        history + [{"role": "user", "content": "more " * 40}], "more " * 40, state
+    )
+
+    assert reply == "ok"
+    assert state == {"response_id": "resp_2", "model": "slow", "turns": 2}
+    assert bodies[1]["previous_response_id"] == "resp_1"
+    assert bodies[1]["input"] == [{"role": "user", "content": "more " * 40}]
+    await openai_client.close()
+
+
+@pytest.mark.asyncio
+async def test_generate_chained_reply_sends_only_new_turn():
+    create = AsyncMock(return_value=SimpleNamespace(output_text="ok", id="resp_2"))
+    openai_client = OpenAIClient(api_key="key", model="slow")
+    openai_client._client = lambda: SimpleNamespace(
+        responses=SimpleNamespace(create=create)
+    )
+    history = [{"role": "user", "content": "earlier"}, {"role": "user", "content": "next"}]
+
+    reply, model, state = await openai_client.generate_chained_reply(
+        history, "next", {"response_id": "resp_1", "model": "slow", "turns": 3}
+    )
+
+    assert (reply, model) == ("ok", "slow")
+    assert state == {"response_id": "resp_2", "model": "slow", "turns": 4}
+    assert create.await_args.kwargs["previous_response_id"] == "resp_1"
+    assert create.await_args.kwargs["input"] == [{"role": "user", "content": "next"}]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "state",
+    [
+        None,
+        {"response_id": "resp_1", "model": "other", "turns": 1},
+        {"response_id": "resp_1", "model": "slow", "turns": 20},
+    ],
+)
+async def test_generate_chained_reply_replays_history_without_usable_chain(state):
+    create = AsyncMock(return_value=SimpleNamespace(output_text="ok", id="resp_2"))
+    openai_client = OpenAIClient(api_key="key", model="slow")
+    openai_client._client = lambda: SimpleNamespace(
+        responses=SimpleNamespace(create=create)
+    )
+    history = [{"role": "user", "content": "earlier"}, {"role": "user", "content": "next"}]
+
+    _, _, new_state = await openai_client.generate_chained_reply(history, "next", state)
+
+    create.assert_awaited_once()
+    assert "previous_response_id" not in create.await_args.kwargs
+    assert create.await_args.kwargs["input"] == history
+    assert new_state == {"response_id": "resp_2", "model": "slow", "turns": 1}
+
+
+@pytest.mark.asyncio
+async def test_generate_chained_reply_replays_when_chain_expired():
+    create = AsyncMock(
+        side_effect=[_not_found(), SimpleNamespace(output_text="ok", id="resp_3")]
+    )
+    openai_client = OpenAIClient(api_key="key", model="slow")
+    openai_client._client = lambda: SimpleNamespace(
+        responses=SimpleNamespace(create=create)
+    )
+    history = [{"role": "user", "content": "next"}]
+
+    reply, _, state = await openai_client.generate_chained_reply(
+        history, "next", {"response_id": "gone", "model": "slow", "turns": 1}
+    )
+
+    assert reply == "ok"
+    assert state["response_id"] == "resp_3"
+    assert create.await_args_list[1].kwargs["input"] == history
+
+
+@pytest.mark.asyncio
+async def test_fast_model_system_prompt_is_stable_with_summary():
+    create = AsyncMock(return_value=SimpleNamespace(output_text="ok"))
+    openai_client = OpenAIClient(api_key="key", model="slow", fast_model="fast")
+    openai_client._client = lambda: SimpleNamespace(
+        responses=SimpleNamespace(create=create)
+    )
+
+    await openai_client.generate_reply(
+        [{"role": "system", "content": "summary"}, {"role": "user", "content": "hi"}],
+        user_text="hi",
+    )
+
+    sent = create.await_args.kwargs["input"]
+    assert sent[0] == {"role": "system", "content": FAST_SYSTEM_PROMPT}
+    assert sent[1] == {"role": "system", "content": "summary"}
+
+
+@pytest.mark.asyncio
+async def test_generate_reply_feeds_router_latency_and_failures():
+    create = AsyncMock(side_effect=[SimpleNamespace(output_text="ok"), RuntimeError("boom")])
+    openai_client = OpenAIClient(api_key="key", model="slow", fast_model="fast")
+    openai_client._client = lambda: SimpleNamespace(
+        responses=SimpleNamespace(create=create)
+    )
+
+    await openai_client.generate_reply([{"role": "user", "content": "hi"}], user_text="hi")
+    with pytest.raises(RuntimeError):
+        await openai_client.generate_reply([{"role": "user", "content": "hi"}], user_text="hi")
+
+    stats = openai_client.router.stats["fast"]
+    assert stats.samples == 2
+    assert stats.consecutive_failures == 1
+    assert stats.latency_ewma is not None
+
+
+def _hedging_client(delays, sent=None, **kwargs):
+    cancelled = []
+
+    async def create(model, **request):
+        if sent is not None:
+            sent[model] = request
+        try:
+            await asyncio.sleep(delays[model])
+        except asyncio.CancelledError:
+            cancelled.append(model)
+            raise
+        return SimpleNamespace(output_text=f"from {model}")
+
+    openai_client = OpenAIClient(
+        api_key="key",
+        model="slow",
+        fast_model="fast",
+        hedge_percentile=50,
+        hedge_min_samples=3,
+        **kwargs,
+    )
+    openai_client._client = lambda: SimpleNamespace(
+        responses=SimpleNamespace(create=create)
+    )
+    for _ in range(3):
+        openai_client.router.record("slow", 0.01, ok=True)
+    return openai_client, cancelled
+
+
+@pytest.mark.asyncio
+async def test_generate_reply_hedges_slow_primary_and_cancels_loser():
+    openai_client, cancelled = _hedging_client({"slow": 1.0, "fast": 0.0})
+    hedge_wins = HEDGES.value(outcome="hedge_won")
+
+    reply, model = await openai_client.generate_reply(
+        [{"role": "user", "content": LONG_TEXT}], user_text=LONG_TEXT
+    )
+
+    assert (reply, model) == ("from fast", "fast")
+    assert cancelled == ["slow"]
+    assert HEDGES.value(outcome="hedge_won") == hedge_wins + 1
+
+
+@pytest.mark.asyncio
+async def test_generate_reply_records_cancelled_primary_latency_as_lower_bound():
+    openai_client, _ = _hedging_client({"slow": 1.0, "fast": 0.05})
+
+    await openai_client.generate_reply(
+        [{"role": "user", "content": LONG_TEXT}], user_text=LONG_TEXT
+    )
+
+    stats = openai_client.router.stats["slow"]
+    assert len(stats.recent_latencies) == 4
+    assert stats.recent_latencies[-1] >= 0.05
+    # The cancelled request is neither a success nor a failure.
+    assert stats.samples == 3
+    assert openai_client.router.latency_percentile("slow", 50, 3) == 0.01
+    assert openai_client.router.latency_percentile("slow", 100, 3) >= 0.05
+
+
+@pytest.mark.asyncio
+async def test_hedge_sends_long_prompt_without_fast_model_caps():
+    sent = {}
+    openai_client, _ = _hedging_client({"slow": 1.0, "fast": 0.0}, sent)
+
+    await openai_client.generate_reply(
+        [{"role": "user", "content": LONG_TEXT}], user_text=LONG_TEXT
+    )
+
+    assert sent["fast"] == sent["slow"]
+    assert "max_output_tokens" not in sent["fast"]
+    assert "stop" not in sent["fast"]
+
+
+@pytest.mark.asyncio
+async def test_hedge_keeps_primary_history_budget_for_large_context():
+    sent = {}
+    openai_client, _ = _hedging_client(
+        {"slow": 1.0, "fast": 0.0},
+        sent,
+        fast_history_token_budget=5,
+    )
+    openai_client.router.fast_max_prompt_tokens = 5
+    messages = [
+        {"role": "user", "content": "x" * 40, "tokens": 10},
+        {"role": "user", "content": "ping", "tokens": 1},
+    ]
+
+    await openai_client.generate_reply(messages, user_text="ping")
+
+    assert openai_client.router.decisions[-1].reason == "large_context"
+    assert sent["fast"]["input"] == sent["slow"]["input"]
+    assert len(sent["fast"]["input"]) == 2
+
+
+@pytest.mark.asyncio
+async def test_generate_reply_does_not_hedge_when_user_asked_for_standard_model():
+    openai_client, cancelled = _hedging_client({"slow": 0.1, "fast": 0.0})
+    text = "answer with the standard model please"
+    messages = [{"role": "user", "content": "hi"}] * 5 + [
+        {"role": "user", "content": text}
+    ]
+
+    reply, model = await openai_client.generate_reply(messages, user_text=text)
+
+    assert openai_client.router.decisions[-1].reason == "user_requested"
+    assert (reply, model) == ("from slow", "slow")
+    assert cancelled == []
+
+
+@pytest.mark.asyncio
+async def test_generate_reply_does_not_hedge_fast_primary():
+    openai_client, cancelled = _hedging_client({"slow": 0.0, "fast": 0.0})
+
+    reply, model = await openai_client.generate_reply(
+        [{"role": "user", "content": LONG_TEXT}], user_text=LONG_TEXT
+    )
+
+    assert model == "slow"
+    assert cancelled == []
+
+
+@pytest.mark.asyncio
+async def test_generate_reply_respects_deadline():
+    openai_client, cancelled = _hedging_client({"slow": 1.0, "fast": 1.0})
+
+    with pytest.raises(TimeoutError):
+        await openai_client.generate_reply(
+            [{"role": "user", "content": LONG_TEXT}],
+            user_text=LONG_TEXT,
+            deadline=time.monotonic() + 0.05,
+        )
+
+    assert sorted(cancelled) == ["fast", "slow"]
+
+
+def _status_error(cls, status, headers=None):
+    request = httpx.Request("POST", "https://api.openai.com/v1/responses")
+    return cls(
+        "error",
+        response=httpx.Response(status, headers=headers, request=request),
+        body=None,
+    )
+
+
+@pytest.mark.asyncio
+async def test_generate_reply_retries_transient_errors_honouring_retry_after(monkeypatch):
+    create = AsyncMock(
+        side_effect=[
+            _status_error(openai.RateLimitError, 429, {"retry-after-ms": "250"}),
+            _status_error(openai.InternalServerError, 503),
+            SimpleNamespace(output_text="ok"),
+        ]
+    )
+    sleeps = []
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+
+    monkeypatch.setattr("app.services.openai_client.asyncio.sleep", fake_sleep)
+    openai_client = OpenAIClient(api_key="key", model="retry-model", retry_base_delay=0.1)
+    openai_client._client = lambda: SimpleNamespace(
+        responses=SimpleNamespace(create=create)
+    )
+    retries = OPENAI_RETRIES.value(model="retry-model")
+
+    reply, _ = await openai_client.generate_reply([{"role": "user", "content": "hi"}])
+
+    assert reply == "ok"
+    assert create.await_count == 3
+    assert sleeps[0] == 0.25
+    assert 0 <= sleeps[1] <= 0.2
+    assert OPENAI_RETRIES.value(model="retry-model") == retries + 2
+
+
+@pytest.mark.asyncio
+async def test_generate_reply_does_not_wait_for_long_retry_after():
+    create = AsyncMock(
+        side_effect=_status_error(openai.RateLimitError, 429, {"retry-after": "120"})
+    )
+    openai_client = OpenAIClient(api_key="key")
+    openai_client._client = lambda: SimpleNamespace(
+        responses=SimpleNamespace(create=create)
+    )
+
+    with pytest.raises(openai.RateLimitError):
+        await openai_client.generate_reply([{"role": "user", "content": "hi"}])
+
+    assert create.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_fails_over_to_other_model():
+    create = AsyncMock(side_effect=RuntimeError("down"))
+    openai_client = OpenAIClient(
+        api_key="key",
+        model="cb-slow",
+        fast_model="cb-fast",
+        max_retries=0,
+        circuit_failure_threshold=1,
+    )
+    openai_client._client = lambda: SimpleNamespace(
+        responses=SimpleNamespace(create=create)
+    )
+    messages = [{"role": "user", "content": LONG_TEXT}]
+
+    with pytest.raises(RuntimeError):
+        await openai_client.generate_reply(messages, user_text=LONG_TEXT)
+    assert openai_client.breaker_states()["cb-slow"]["state"] == "open"
+
+    create.side_effect = None
+    create.return_value = SimpleNamespace(output_text="ok")
+    reply, model = await openai_client.generate_reply(messages, user_text=LONG_TEXT)
+    assert (reply, model) == ("ok", "cb-fast")
+
+    create.side_effect = RuntimeError("down")
+    with pytest.raises(RuntimeError):
+        await openai_client.generate_reply(messages, user_text=LONG_TEXT)
+    with pytest.raises(CircuitOpenError):
+        await openai_client.generate_reply(messages, user_text=LONG_TEXT)
+
+
+def test_detect_capabilities_checks_the_sdk_once():
+    openai_client = OpenAIClient(api_key="key")
+    openai_client._client = lambda: SimpleNamespace(responses=None)
+
+    assert openai_client.detect_capabilities() is False
+    assert openai_client._uses_responses(
+        SimpleNamespace(responses=SimpleNamespace())
+    ) is False
+
+
+@pytest.mark.asyncio
+async def test_summarize_history_chunks_on_fast_model_and_merges_on_primary():
+    create = AsyncMock(return_value=SimpleNamespace(output_text="part"))
+    openai_client = OpenAIClient(
+        api_key="key",
+        model="slow",
+        fast_model="fast",
+        summary_chunk_tokens=100,
+        summary_use_fast_model=True,
+    )
+    openai_client._client = lambda: SimpleNamespace(
+        responses=SimpleNamespace(create=create)
+    )
+    messages = [{"role": "user", "content": "x" * 300} for _ in range(3)]
+
+    summary = await openai_client.summarize_history(messages, "old summary")
+
+    assert summary == "part"
+    models = [call.kwargs["model"] for call in create.await_args_list]
+    assert models == ["fast", "fast", "fast", "slow"]
+    merge_input = create.await_args_list[-1].kwargs["input"]
+    assert merge_input[1]["content"] == "Existing summary:\nold summary"
+    assert [msg["content"] for msg in merge_input[2:]] == [
+        "Part 1:\npart",
+        "Part 2:\npart",
+        "Part 3:\npart",
+    ]
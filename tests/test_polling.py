@@ -0,0 +1,152 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+import asyncio
+import gc
+import json
+
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Update
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+import pytest
+
+from app.handlers import router
+from app.main import run_polling
+from app.polling import Poller, update_chat_key
+from app.services.memory_store import MemoryStore
+
+ADMIN_ID = 4242
+
+
+def make_update(update_id, text, chat_id=ADMIN_ID):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": ADMIN_ID, "is_bot": False, "first_name": "Admin"},
+            "text": text,
+        },
+    }
+
+
+class FakeBotAPI:
+    """Minimal local Bot API server: getMe, deleteWebhook, getUpdates, sendMessage."""
+
+    def __init__(self, updates):
+        self.updates = list(updates)
+        self.calls = []
+        self.sent = []
+        self.sent_event = asyncio.Event()
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/{method}", self.handle)
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        self.calls.append((method, params))
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Odin", "username": "odin_bot"}
+        elif method == "getUpdates":
+            offset = int(params.get("offset", 0))
+            result = [u for u in self.updates if u["update_id"] >= offset]
+            if not result:
+                await asyncio.sleep(float(params.get("timeout", 0)))
+        elif method == "sendMessage":
+            self.sent.append(params["text"])
+            self.sent_event.set()
+            result = {
+                "message_id": 100 + len(self.sent),
+                "date": 0,
+                "chat": {"id": int(params["chat_id"]), "type": "private"},
+                "text": params["text"],
+            }
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def wait_for_sent(self, count):
+        while len(self.sent) < count:
+            self.sent_event.clear()
+            await asyncio.wait_for(self.sent_event.wait(), timeout=2)
+
+
+@pytest.mark.asyncio
+async def test_run_polling_answers_updates_from_fake_bot_api(monkeypatch):
+    for key, value in {
+        "BOT_TOKEN": "123456:POLL",
+        "OPENAI_API_KEY": "key",
+        "ADMIN_ID": str(ADMIN_ID),
+        "FIRESTORE_DISABLED": "1",
+        "POLLING_TIMEOUT": "1",
+        "POLLING_LIMIT": "10",
+        "KEEP_PENDING_UPDATES": "1",
+    }.items():
+        monkeypatch.setenv(key, value)
+    monkeypatch.setattr(router, "_parent_router", None)
+    api = FakeBotAPI([make_update(1, "2+2"), make_update(2, "Hello")])
+    openai_client = SimpleNamespace(
+        generate_reply=AsyncMock(return_value=("Hi there", "fast")),
+        summarize_history=AsyncMock(return_value="summary"),
+        close=AsyncMock(),
+    )
+
+    async with TestServer(api.app) as server:
+        session = AiohttpSession(
+            api=TelegramAPIServer.from_base(str(server.make_url("")).rstrip("/"))
+        )
+        task = asyncio.create_task(
+            run_polling(
+                session=session,
+                openai_client=openai_client,
+                firestore_client=MemoryStore(),
+            )
+        )
+        await api.wait_for_sent(3)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    assert api.sent[0] == "4\n\n— model: local-arith"
+    assert api.sent[2] == "Hi there\n\n— model: fast"
+    methods = [method for method, _ in api.calls]
+    assert methods.count("getMe") == 1
+    assert ("deleteWebhook", {"drop_pending_updates": "false"}) in api.calls
+    polls = [params for method, params in api.calls if method == "getUpdates"]
+    assert polls[0]["limit"] == "10" and polls[0]["timeout"] == "1"
+    assert json.loads(polls[0]["allowed_updates"]) == ["message", "my_chat_member"]
+    assert any(params.get("offset") == "3" for params in polls[1:])
+    openai_client.close.assert_awaited_once()
+    # A full runtime leaves enough cyclic garbage to trigger a long collection
+    # pause in whichever timing-sensitive test runs next; pay for it here.
+    gc.collect()
+
+
+@pytest.mark.asyncio
+async def test_poller_does_not_acknowledge_updates_over_the_per_chat_cap():
+    release = asyncio.Event()
+
+    async def feed_update(bot, update):
+        await release.wait()
+
+    dispatcher = SimpleNamespace(feed_update=AsyncMock(side_effect=feed_update))
+    poller = Poller(bot=SimpleNamespace(), dispatcher=dispatcher, max_pending_per_chat=1)
+    updates = [Update.model_validate(make_update(i, "hi")) for i in (1, 2, 3)]
+
+    assert poller._submit(updates[:1]) is True
+    await asyncio.sleep(0)
+    assert poller._submit(updates[1:]) is False
+
+    assert poller._offset == 3
+    release.set()
+    await poller.queue.drain()
+    assert dispatcher.feed_update.await_count == 2
+
+
+def test_update_chat_key_orders_by_chat_unless_disabled():
+    update = Update.model_validate(make_update(7, "hi", chat_id=55))
+
+    assert update_chat_key(update) == 55
+    assert update_chat_key(update, ordered=False) == ("update", 7)
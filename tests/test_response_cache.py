@@ -0,0 +1,47 @@
+from app.services.response_cache import ResponseCache, cache_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_cache_key_normalizes_text():
+    assert cache_key("  Курс   евро? ", "fast") == cache_key("курс евро", "fast")
+    assert cache_key("курс евро", "fast") != cache_key("курс евро", "slow")
+    assert cache_key("курс евро", "fast", "a") != cache_key("курс евро", "fast", "b")
+
+
+def test_cache_expires_and_evicts_least_recently_used():
+    clock = FakeClock()
+    cache = ResponseCache(max_entries=2, ttl=60, clock=clock)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+
+    assert cache.get("b") is None
+    assert cache.get("c") == "3"
+    clock.now += 61
+    assert cache.get("a") is None
+    assert cache.stats() == {"hits": 2, "misses": 2, "evictions": 1, "size": 1}
+
+
+def test_cache_survives_restart_via_file(tmp_path):
+    clock = FakeClock()
+    path = str(tmp_path / "cache.json")
+    cache = ResponseCache(ttl=60, path=path, clock=clock)
+    cache.set("fresh", "kept")
+    cache.set("stale", "dropped")
+    cache._entries["stale"] = (clock.now - 1, "dropped")
+    cache.save()
+
+    reloaded = ResponseCache(ttl=60, path=path, clock=clock)
+
+    assert reloaded.get("fresh") == "kept"
+    assert reloaded.get("stale") is None
+    clock.now += 61
+    assert reloaded.get("fresh") is None
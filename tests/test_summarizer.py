@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+
+from app.services.summarizer import HierarchicalSummarizer, cap_summary, chunk_messages
+from app.services.tokens import count_tokens
+
+
+def _msg(index, tokens):
+    return {"role": "user", "content": f"m{index}", "tokens": tokens}
+
+
+class StubSummarizer:
+    def __init__(self, reply_tokens=10):
+        self.reply_tokens = reply_tokens
+        self.chunks = []
+        self.merges = []
+        self.active = 0
+        self.peak = 0
+
+    async def summarize_chunk(self, messages, existing_summary):
+        self.chunks.append(([m["content"] for m in messages], existing_summary))
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0)
+        self.active -= 1
+        names = "+".join(m["content"] for m in messages)
+        return (f"[{names}]" + " x" * self.reply_tokens * 2)[: self.reply_tokens * 4]
+
+    async def merge(self, existing_summary, partials):
+        self.merges.append((existing_summary, list(partials)))
+        return f"merged({len(partials)})"
+
+
+def test_chunk_messages_respects_token_boundaries():
+    messages = [_msg(i, tokens) for i, tokens in enumerate([40, 40, 30, 90, 10, 100])]
+
+    chunks = chunk_messages(messages, 100)
+
+    assert [[m["content"] for m in chunk] for chunk in chunks] == [
+        ["m0", "m1"],
+        ["m2"],
+        ["m3", "m4"],
+        ["m5"],
+    ]
+
+
+def test_chunk_messages_trims_oversized_message_into_own_chunk():
+    messages = [_msg(0, 10), {"role": "user", "content": "y" * 1000}, _msg(2, 10)]
+
+    chunks = chunk_messages(messages, 50)
+
+    assert [len(chunk) for chunk in chunks] == [1, 1, 1]
+    assert chunks[1][0]["tokens"] == 50
+
+
+def test_cap_summary_prefers_sentence_boundary():
+    text = "First fact is here. Second fact is longer and runs on and on and on."
+
+    capped = cap_summary(text, 6)
+
+    assert capped == "First fact is here."
+    assert count_tokens(capped) <= 6
+
+
+def test_cap_summary_cuts_words_with_ellipsis():
+    capped = cap_summary("word " * 100, 10)
+
+    assert capped.endswith("…")
+    assert count_tokens(capped) <= 10
+    assert cap_summary("short", 10) == "short"
+
+
+@pytest.mark.asyncio
+async def test_single_chunk_is_folded_into_existing_summary_in_one_call():
+    stub = StubSummarizer()
+    summarizer = HierarchicalSummarizer(stub.summarize_chunk, stub.merge, chunk_tokens=100)
+
+    await summarizer.summarize([_msg(0, 30), _msg(1, 30)], "old")
+
+    assert stub.chunks == [(["m0", "m1"], "old")]
+    assert stub.merges == []
+
+
+@pytest.mark.asyncio
+async def test_chunks_are_summarized_in_parallel_then_merged():
+    stub = StubSummarizer()
+    summarizer = HierarchicalSummarizer(
+        stub.summarize_chunk, stub.merge, chunk_tokens=100, max_parallel=2
+    )
+    messages = [_msg(i, 60) for i in range(5)]
+
+    summary = await summarizer.summarize(messages, "old")
+
+    assert [chunk for chunk, _ in stub.chunks] == [["m0"], ["m1"], ["m2"], ["m3"], ["m4"]]
+    assert all(existing == "" for _, existing in stub.chunks)
+    assert stub.peak == 2
+    assert len(stub.merges) == 1
+    existing, partials = stub.merges[0]
+    assert existing == "old"
+    assert partials[0].startswith("[m0]") and partials[-1].startswith("[m4]")
+    assert summary == "merged(5)"
+
+
+@pytest.mark.asyncio
+async def test_partials_are_merged_level_by_level_when_too_large():
+    stub = StubSummarizer(reply_tokens=40)
+    summarizer = HierarchicalSummarizer(
+        stub.summarize_chunk, stub.merge, chunk_tokens=100, max_summary_tokens=40
+    )
+    messages = [_msg(i, 100) for i in range(6)]
+
+    await summarizer.summarize(messages, "")
+
+    group_sizes = [len(partials) for _, partials in stub.merges[:-1]]
+    assert group_sizes == [2, 2, 2]
+    assert stub.merges[-1] == ("", ["merged(2)"] * 3)
+
+
+@pytest.mark.asyncio
+async def test_summary_and_partials_are_capped():
+    stub = StubSummarizer(reply_tokens=50)
+
+    async def long_merge(existing_summary, partials):
+        stub.merges.append((existing_summary, list(partials)))
+        return "z " * 500
+
+    summarizer = HierarchicalSummarizer(
+        stub.summarize_chunk, long_merge, chunk_tokens=1000, max_summary_tokens=20
+    )
+
+    summary = await summarizer.summarize([_msg(i, 600) for i in range(2)], "")
+
+    assert all(count_tokens(partial) <= 20 for partial in stub.merges[0][1])
+    assert count_tokens(summary) <= 20
@@ -0,0 +1,195 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+import logging
+import re
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+import pytest
+
+from app.metrics import TELEGRAM_SEND_WAIT_SECONDS
+from app.services.telegram_sender import (
+    TelegramSender,
+    TokenBucket,
+    split_html,
+    truncate_utf16,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_sender(**kwargs):
+    clock = FakeClock()
+    return TelegramSender(clock=clock, sleep=clock.sleep, **kwargs), clock
+
+
+def make_message(chat_id=1):
+    return SimpleNamespace(chat=SimpleNamespace(id=chat_id), answer=AsyncMock())
+
+
+def retry_after(seconds):
+    method = SendMessage(chat_id=1, text="x")
+    return TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=seconds)
+
+
+def assert_balanced(part):
+    stack = []
+    for match in re.finditer(r"<(/?)([a-z]+)[^>]*>", part):
+        if match.group(1):
+            assert stack.pop() == match.group(2)
+        else:
+            stack.append(match.group(2))
+    assert stack == []
+
+
+def test_split_html_keeps_short_text_whole():
+    assert split_html("<b>hi</b>") == ["<b>hi</b>"]
+
+
+def test_split_html_prefers_paragraph_breaks():
+    paragraphs = ["a" * 40, "b" * 40, "c" * 40]
+
+    parts = split_html("\n\n".join(paragraphs), limit=100)
+
+    assert [part.strip() for part in parts] == ["a" * 40 + "\n\n" + "b" * 40, "c" * 40]
+
+
+def test_split_html_reopens_tags_inside_code_blocks():
+    code = "\n".join(f"line {i}" for i in range(40))
+    text = f'Intro\n\n<pre><code class="language-py">{code}</code></pre>\n\nDone'
+
+    parts = split_html(text, limit=120)
+
+    assert len(parts) > 2
+    for part in parts:
+        assert len(part) <= 120
+        assert_balanced(part)
+    assert parts[0].strip() == "Intro"
+    assert parts[1].startswith('<pre><code class="language-py">line 0\n')
+    assert parts[2].startswith('<pre><code class="language-py">')
+    visible = "".join(re.sub(r"<[^>]+>", "", part) for part in parts)
+    assert visible.replace("\n", "") == re.sub(r"<[^>]+>", "", text).replace("\n", "")
+
+
+def test_split_html_never_cuts_entities_and_counts_utf16():
+    assert all(len(part) == 10 for part in split_html("&amp;" * 4, limit=10))
+    assert split_html("😀" * 5, limit=4) == ["😀😀", "😀😀", "😀"]
+
+
+def test_split_plain_text_treats_markup_characters_as_text():
+    text = "<b>x & y " * 4
+
+    parts = split_html(text, limit=20, html=False)
+
+    assert "".join(parts) == text
+    assert all(len(part) <= 20 and "</b>" not in part for part in parts)
+
+
+def test_truncate_utf16_never_splits_astral_characters():
+    assert truncate_utf16("a😀😀", 4) == "a😀"
+    assert truncate_utf16("abc", 10) == "abc"
+
+
+def test_token_bucket_spaces_reservations_after_burst():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+
+    assert [bucket.reserve() for _ in range(4)] == [0, 0, 0.5, 1.0]
+    clock.now = 10
+    bucket.pause(3)
+    assert bucket.reserve() == 3.0
+
+
+@pytest.mark.asyncio
+async def test_sender_throttles_bursts_per_chat():
+    sender, clock = make_sender(chat_rate=1, chat_burst=2)
+    message = make_message()
+
+    for _ in range(4):
+        await sender.answer(message, "hi")
+
+    assert message.answer.await_count == 4
+    assert clock.sleeps == [1.0, 1.0]
+    assert clock.now == 2.0
+
+
+@pytest.mark.asyncio
+async def test_sender_only_reports_waits_that_slept(caplog):
+    sender, _ = make_sender()
+    # The real monotonic clock always moves a little between two reads.
+    ticks = iter(range(1_000))
+    sender.clock = lambda: next(ticks) / 10_000
+    waits = TELEGRAM_SEND_WAIT_SECONDS.count()
+
+    with caplog.at_level(logging.INFO, logger="app.services.telegram_sender"):
+        await sender.answer(make_message(), "hi")
+
+    assert "telegram_send_throttled" not in caplog.text
+    assert TELEGRAM_SEND_WAIT_SECONDS.count() == waits
+
+
+@pytest.mark.asyncio
+async def test_sender_uses_group_rate_and_global_limit():
+    sender, clock = make_sender(group_rate=0.5, chat_burst=1, global_rate=1)
+    group = make_message(chat_id=-100)
+    private = make_message(chat_id=7)
+
+    await sender.answer(group, "a")
+    await sender.answer(group, "b")
+    await sender.answer(private, "c")
+
+    # "b" waits for the group's bucket, "c" for the global one.
+    assert clock.sleeps == [2.0, 1.0]
+
+
+@pytest.mark.asyncio
+async def test_sender_waits_out_retry_after_and_gives_up_eventually():
+    sender, clock = make_sender(max_retries=1)
+    message = make_message()
+    message.answer.side_effect = [retry_after(5), "sent"]
+
+    assert await sender.answer(message, "hi") == "sent"
+    assert clock.sleeps == [5.0]
+
+    message.answer.side_effect = retry_after(5)
+    with pytest.raises(TelegramRetryAfter):
+        await sender.answer(message, "again")
+
+
+@pytest.mark.asyncio
+async def test_sender_edit_sends_overflow_as_new_messages():
+    sender, _ = make_sender()
+    message = make_message()
+    placeholder = SimpleNamespace(edit_text=AsyncMock())
+    text = "\n\n".join(["x" * 3000, "y" * 3000])
+
+    await sender.edit(message, placeholder, text, parse_mode=None)
+
+    placeholder.edit_text.assert_awaited_once_with("x" * 3000 + "\n\n", parse_mode=None)
+    message.answer.assert_awaited_once_with("y" * 3000, parse_mode=None)
+
+
+@pytest.mark.asyncio
+async def test_sender_edit_preview_stays_in_one_plain_message():
+    sender, _ = make_sender()
+    message = make_message()
+    placeholder = SimpleNamespace(edit_text=AsyncMock())
+
+    await sender.edit_preview(message, placeholder, "<i>" + "😀" * 3000)
+
+    text = placeholder.edit_text.await_args.args[0]
+    assert text.startswith("<i>😀")
+    assert len(text.encode("utf-16-le")) // 2 <= 4096
+    assert placeholder.edit_text.await_args.kwargs == {"parse_mode": None}
+    message.answer.assert_not_awaited()
@@ -0,0 +1,57 @@
+import pytest
+
+from app.services.memory_store import MemoryStore
+from app.services.tokens import count_tokens, strip_token_counts, window_by_tokens
+
+
+def _msg(role, content):
+    return {"role": role, "content": content, "tokens": count_tokens(content)}
+
+
+def test_count_tokens_uses_utf8_bytes():
+    assert count_tokens("") == 0
+    assert count_tokens("abcd") == 1
+    assert count_tokens("abcde") == 2
+    assert count_tokens("привет") == 3
+
+
+def test_window_keeps_newest_messages_within_budget():
+    messages = [_msg("user", "a" * 40), _msg("assistant", "b" * 40), _msg("user", "c" * 40)]
+
+    window = window_by_tokens(messages, budget=25)
+
+    assert [m["content"][0] for m in window] == ["b", "c"]
+
+
+def test_window_always_keeps_summary_and_trims_long_messages():
+    messages = [
+        _msg("system", "summary"),
+        _msg("user", "x" * 400),
+        _msg("assistant", "short"),
+    ]
+
+    window = window_by_tokens(messages, budget=40, max_message_tokens=20)
+
+    assert window[0]["content"] == "summary"
+    assert window[1]["content"].endswith("[…]")
+    assert window[1]["tokens"] == 20
+    assert window[2]["content"] == "short"
+
+
+def test_window_keep_latest_sends_oversized_prompt_whole():
+    messages = [_msg("user", "old"), _msg("user", "y" * 400)]
+
+    window = window_by_tokens(messages, budget=10, max_message_tokens=20, keep_latest=True)
+
+    assert window == [messages[1]]
+    assert strip_token_counts(window) == [{"role": "user", "content": "y" * 400}]
+
+
+@pytest.mark.asyncio
+async def test_memory_store_applies_token_budget():
+    store = MemoryStore()
+    await store.append_messages([(1, "user", "a" * 40), (1, "assistant", "b" * 40)])
+
+    history = await store.get_recent_history(1, max_messages=10, token_budget=10)
+
+    assert strip_token_counts(history) == [{"role": "assistant", "content": "b" * 40}]
@@ -0,0 +1,151 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.metrics import WRITE_BEHIND_DROPPED
+from app.services.memory_store import MemoryStore
+from app.services.write_behind import WriteBehindStore
+from app.services.tokens import strip_token_counts
+
+
+class RecordingStore(MemoryStore):
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    async def append_messages(self, entries):
+        self.batches.append(list(entries))
+        await super().append_messages(entries)
+
+
+@pytest.mark.asyncio
+async def test_write_behind_batches_across_users_on_interval():
+    store = RecordingStore()
+    queue = WriteBehindStore(store, max_batch=10, flush_interval=0.01)
+
+    await queue.append_message(1, "user", "a")
+    await queue.append_message(1, "assistant", "b")
+    await queue.append_message(2, "user", "c")
+    assert store.batches == []
+
+    await asyncio.sleep(0.05)
+
+    assert store.batches == [[(1, "user", "a"), (1, "assistant", "b"), (2, "user", "c")]]
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_write_behind_flushes_when_batch_is_full():
+    store = RecordingStore()
+    queue = WriteBehindStore(store, max_batch=2, flush_interval=60)
+
+    await queue.append_message(1, "user", "a")
+    await queue.append_message(1, "assistant", "b")
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+    assert store.batches == [[(1, "user", "a"), (1, "assistant", "b")]]
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_write_behind_reads_own_writes():
+    store = RecordingStore()
+    queue = WriteBehindStore(store, max_batch=10, flush_interval=60)
+
+    await queue.append_message(1, "user", "hello")
+    history = await queue.get_recent_history(1, max_messages=5)
+
+    assert strip_token_counts(history) == [{"role": "user", "content": "hello"}]
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_write_behind_requeues_failed_batch_and_flushes_on_close():
+    store = RecordingStore()
+    queue = WriteBehindStore(store, max_batch=10, flush_interval=60)
+    original = store.append_messages
+    store.append_messages = AsyncMock(side_effect=RuntimeError("down"))
+
+    await queue.append_message(1, "user", "hello")
+    await queue.flush()
+    assert queue._pending == [(1, "user", "hello")]
+
+    store.append_messages = original
+    await queue.close()
+
+    assert store.batches == [[(1, "user", "hello")]]
+
+
+@pytest.mark.asyncio
+async def test_write_behind_close_waits_for_inflight_commit():
+    store = RecordingStore()
+    queue = WriteBehindStore(store, max_batch=1, flush_interval=60)
+    original = store.append_messages
+    committing = asyncio.Event()
+    release = asyncio.Event()
+
+    async def slow_append(entries):
+        committing.set()
+        await release.wait()
+        await original(entries)
+
+    store.append_messages = slow_append
+    await queue.append_message(1, "user", "a")
+    await queue.append_message(1, "assistant", "b")
+    await committing.wait()
+
+    closing = asyncio.create_task(queue.close())
+    await asyncio.sleep(0)
+    release.set()
+    await closing
+
+    assert store.batches == [[(1, "user", "a")], [(1, "assistant", "b")]]
+
+
+@pytest.mark.asyncio
+async def test_write_behind_backs_off_while_store_keeps_failing():
+    store = RecordingStore()
+    queue = WriteBehindStore(
+        store,
+        max_batch=1,
+        flush_interval=0.001,
+        retry_backoff=0.02,
+        max_retry_backoff=0.08,
+    )
+    loop = asyncio.get_running_loop()
+    original = store.append_messages
+    attempts = []
+
+    async def failing_append(entries):
+        attempts.append(loop.time())
+        raise RuntimeError("down")
+
+    store.append_messages = failing_append
+    await queue.append_message(1, "user", "a")
+    await asyncio.sleep(0.3)
+
+    gaps = [later - earlier for earlier, later in zip(attempts, attempts[1:])]
+    assert 3 <= len(attempts) <= 8
+    for index, gap in enumerate(gaps):
+        assert gap >= min(0.02 * 2**index, 0.08) * 0.9
+    assert queue._pending == [(1, "user", "a")]
+
+    store.append_messages = original
+    await queue.close()
+    assert store.batches == [[(1, "user", "a")]]
+
+
+@pytest.mark.asyncio
+async def test_write_behind_drops_oldest_messages_beyond_max_pending():
+    store = RecordingStore()
+    queue = WriteBehindStore(store, max_batch=10, flush_interval=60, max_pending=2)
+    dropped = WRITE_BEHIND_DROPPED.value()
+
+    for content in ("a", "b", "c"):
+        await queue.append_message(1, "user", content)
+
+    assert queue._pending == [(1, "user", "b"), (1, "user", "c")]
+    assert WRITE_BEHIND_DROPPED.value() == dropped + 1
+    await queue.close()